@@ -0,0 +1,10 @@
+"""
+Benchmark Suite for Pizza Ordering System
+
+The benchmarks run against SQLite databases filled by the data generator
+(see data_generator.py) at several scales. Run them from the project directory:
+
+    python -m benchmarks.routes --scales 1k,100k
+
+See benchmarks/routes.py for the options.
+"""
@@ -0,0 +1,261 @@
+"""
+Courier Slot Concurrency Check
+
+Fires hundreds of simultaneous orders for one postal code from a thread pool,
+through the order form (/create_order) and the JSON order API (/api/orders),
+and checks that the delivery slots reserved for the delivery persons serving
+it never overlap (see reserve_delivery_slot() in ordering.py):
+- every created order got its own slot: each pickup of a delivery person is
+  at least the delivery time after their previous one
+- with --trip-batching: orders share slots only as a trip, every trip has at
+  most TRIP_CAPACITY orders, its stored order count and one pickup time
+- the number of orders of the delivery persons equals the number of orders
+  the requests report as created
+- next_available_time of every delivery person is the end of their last slot
+
+Also reports the throughput (created orders per second) and the number of
+slot reservations that were retried after losing to a concurrent order.
+
+By default a small generated SQLite database in a temporary directory is
+used. SQLite runs one write transaction at a time, so it mostly checks the
+retry logic; pass --database-uri to run against a MySQL test database, where
+the transactions really run concurrently. That database must have the menu,
+customers and delivery persons (e.g. flask --app app generate-data).
+
+Usage (from the project directory):
+    python -m benchmarks.courier_concurrency [--orders 300] [--threads 32]
+                                             [--via both] [--trip-batching]
+                                             [--database-uri URI]
+
+Exits with code 1 if slots overlap or orders went missing.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from benchmarks.database import BENCHMARK_SEED, make_app
+from app import create_app
+from data_generator import generate_data, seed_menu
+from metrics import COURIER_SLOT_CONFLICTS
+from models import DELIVERY_DURATION, db, Customer, DeliveryPerson, MenuItem, Order, Trip
+
+# Small database with several delivery persons per postal code
+GENERATOR_PARAMS = {"customers": 50, "couriers": 9, "postal_codes": 3, "orders": 200, "days": 30}
+
+# Ways to send the orders
+ORDER_ROUTES = ("form", "api", "both")
+
+# Pizzas per order. A birthday and the 10-pizza discount make at most two free,
+# so the order never becomes free (an order total must be positive).
+PIZZAS_PER_ORDER = 3
+
+
+def counter_total(counter):
+    """Sum a counter over all its label values."""
+    return sum(counter.values.values())
+
+
+def prepare(app):
+    """
+    Pick the postal code, customers and pizza the orders use, and free up its delivery persons.
+
+    Args:
+        app (Flask): Application on the test database
+
+    Returns:
+        dict: postal_code, delivery_person_ids, customer_ids, pizza_id and
+              last_order_id (the orders created by the check come after it)
+    """
+    with app.app_context():
+        delivery_person = DeliveryPerson.query.order_by(DeliveryPerson.delivery_person_id).first()
+        if delivery_person is None:
+            raise SystemExit("The database has no delivery persons, generate data first.")
+        zone = DeliveryPerson.query.filter_by(postal_code=delivery_person.postal_code).all()
+        customers = Customer.query.order_by(Customer.customer_id).limit(20).all()
+        pizza = MenuItem.query.filter_by(item_type="pizza").order_by(MenuItem.item_id).first()
+        if not customers or pizza is None:
+            raise SystemExit("The database has no customers or pizzas, generate data first.")
+
+        # Start from free delivery persons, so the slots start now
+        now = datetime.now(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None, microsecond=0)
+        for courier in zone:
+            courier.next_available_time = now
+        db.session.commit()
+        return {
+            "postal_code": delivery_person.postal_code,
+            "delivery_person_ids": [courier.delivery_person_id for courier in zone],
+            "customer_ids": [customer.customer_id for customer in customers],
+            "pizza_id": pizza.item_id,
+            "last_order_id": db.session.query(db.func.max(Order.order_id)).scalar() or 0,
+        }
+
+
+def place(app, setup, number, route):
+    """
+    Send one order for the postal code, with the thread's own test client.
+
+    Args:
+        app (Flask): Application under test
+        setup (dict): Result of prepare()
+        number (int): Number of the order, picks the customer
+        route (str): "form" or "api"
+
+    Returns:
+        bool: Whether the order was created
+    """
+    client = app.test_client()
+    customer_id = setup["customer_ids"][number % len(setup["customer_ids"])]
+    if route == "api":
+        response = client.post("/api/orders", json={
+            "customer_id": customer_id,
+            "items": [{"item_id": setup["pizza_id"], "amount": PIZZAS_PER_ORDER}],
+            "delivery_address": f"Concurrency Street {number}",
+            "postal_code": setup["postal_code"],
+            "reference": f"concurrency-{number}",
+        })
+        return response.status_code == 201
+    response = client.post("/create_order", data={
+        "action": "create",
+        "customer_id": customer_id,
+        f"item_{setup['pizza_id']}": str(PIZZAS_PER_ORDER),
+        "delivery_address": f"Concurrency Street {number}",
+        "postal_code": setup["postal_code"],
+    })
+    # A created order redirects to the order list, a failed one back to the form
+    return response.status_code == 302 and response.headers.get("Location", "").endswith("/list_orders")
+
+
+def run_orders(app, setup, orders, threads, via):
+    """
+    Send the orders from a thread pool, all threads starting at the same moment.
+
+    Returns:
+        tuple: (created orders, failed orders, seconds)
+    """
+    start = threading.Barrier(min(threads, orders))
+
+    def send(number):
+        if number < threads:
+            start.wait()
+        route = via if via != "both" else ORDER_ROUTES[number % 2]
+        try:
+            return place(app, setup, number, route)
+        except Exception as e:
+            print(f"  order {number} ({route}) raised {e.__class__.__name__}: {e}")
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(send, range(orders)))
+    elapsed = time.perf_counter() - started
+    created = sum(results)
+    return created, len(results) - created, elapsed
+
+
+def check_slots(app, setup, created):
+    """
+    Check the slots the created orders got.
+
+    Returns:
+        list of str: Problems found, empty if there are none
+    """
+    problems = []
+    stored = 0
+    with app.app_context():
+        capacity = app.config["TRIP_CAPACITY"]
+        trip_counts = dict(db.session.query(Trip.trip_id, Trip.order_count))
+        for delivery_person_id in setup["delivery_person_ids"]:
+            orders = (db.session.query(Order.order_id, Order.pickup_time, Order.trip_id)
+                      .filter(Order.delivery_person_id == delivery_person_id,
+                              Order.order_id > setup["last_order_id"])
+                      .all())
+            delivery_person = db.session.get(DeliveryPerson, delivery_person_id)
+            stored += len(orders)
+
+            # Orders without a trip have a slot of their own
+            trips = {}
+            for order_id, pickup_time, trip_id in orders:
+                trips.setdefault(trip_id or f"order-{order_id}", []).append(pickup_time)
+            for trip_id, trip_pickups in trips.items():
+                if isinstance(trip_id, str):
+                    continue
+                if len(set(trip_pickups)) != 1:
+                    problems.append(f"orders of trip {trip_id} have different pickup times")
+                if len(trip_pickups) > capacity or len(trip_pickups) != trip_counts.get(trip_id):
+                    problems.append(f"trip {trip_id} has {len(trip_pickups)} orders, order_count "
+                                    f"{trip_counts.get(trip_id)}, capacity {capacity}")
+            pickups = sorted(trip_pickups[0] for trip_pickups in trips.values())
+            print(f"  delivery person {delivery_person_id}: {len(orders)} orders in {len(pickups)} slots")
+
+            overlaps = [(earlier, later) for earlier, later in zip(pickups, pickups[1:])
+                        if later - earlier < DELIVERY_DURATION]
+            for earlier, later in overlaps[:10]:
+                problems.append(f"overlapping slots of delivery person {delivery_person_id}: "
+                                f"pickups at {earlier} and {later}")
+            if len(overlaps) > 10:
+                problems.append(f"... {len(overlaps) - 10} more overlapping slots")
+            if pickups and delivery_person.next_available_time != pickups[-1] + DELIVERY_DURATION:
+                problems.append(f"next_available_time of delivery person {delivery_person_id} is "
+                                f"{delivery_person.next_available_time}, their last slot ends at "
+                                f"{pickups[-1] + DELIVERY_DURATION}")
+        if stored != created:
+            problems.append(f"{stored} orders for the delivery persons, but {created} reported as created")
+    return problems
+
+
+def main(argv=None):
+    """
+    Run the concurrency check from the command line.
+
+    Returns:
+        int: Exit code, 1 if the check failed
+    """
+    parser = argparse.ArgumentParser(description="Check delivery slot reservation under concurrent orders.")
+    parser.add_argument("--orders", type=int, default=300, help="Number of orders to send")
+    parser.add_argument("--threads", type=int, default=32, help="Number of threads sending orders")
+    parser.add_argument("--via", choices=ORDER_ROUTES, default="both",
+                        help="Send the orders through the order form, the JSON API or alternating")
+    parser.add_argument("--trip-batching", action="store_true", help="Batch the orders into trips")
+    parser.add_argument("--database-uri", help="Test database to use instead of a generated SQLite database")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.database_uri:
+            app = create_app({"SQLALCHEMY_DATABASE_URI": args.database_uri, "SEED_ON_STARTUP": False})
+        else:
+            app = make_app(os.path.join(directory, "concurrency.sqlite"))
+            with app.app_context():
+                seed_menu()
+                generate_data(seed=BENCHMARK_SEED, **GENERATOR_PARAMS)
+        app.config["TRIP_BATCHING"] = args.trip_batching
+
+        setup = prepare(app)
+        conflicts_before = counter_total(COURIER_SLOT_CONFLICTS)
+        print(f"Sending {args.orders} orders for postal code {setup['postal_code']} "
+              f"({len(setup['delivery_person_ids'])} delivery persons) from {args.threads} threads ({args.via})")
+        created, failed, elapsed = run_orders(app, setup, args.orders, args.threads, args.via)
+        conflicts = counter_total(COURIER_SLOT_CONFLICTS) - conflicts_before
+
+        print(f"  {created} created, {failed} failed in {elapsed:.2f} s "
+              f"({created / elapsed:.1f} orders/s), {conflicts} slot reservations retried")
+        problems = check_slots(app, setup, created)
+        if created == 0:
+            problems.append("no order was created")
+        for problem in problems:
+            print(f"  {problem}")
+
+        with app.app_context():
+            db.engine.dispose()
+
+    print("Courier slot check failed." if problems else "Courier slot check passed.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
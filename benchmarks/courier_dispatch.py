@@ -0,0 +1,204 @@
+"""
+Courier Dispatch Simulation
+
+Simulates a dinner rush on a small generated database with several delivery
+persons per postal code, and compares how long orders wait for their pickup:
+- single: the original assignment, every order of a postal code goes to the
+  same delivery person (the first one) and the others stay idle
+- dispatcher: the courier dispatcher (dispatch.py) gives every order to the
+  delivery person of the postal code who is available first
+- trips: the dispatcher with trip batching (see ordering.py), orders for the
+  same postal code share a trip of a delivery person when they can
+
+Both policies get exactly the same orders (postal code and order time, with a
+fixed seed). The clock is simulated: every order reserves its slot at its own
+order time. The pickup wait of an order is its pickup time minus its order time.
+
+Usage (from the project directory):
+    python -m benchmarks.courier_dispatch [--zones 3] [--couriers-per-zone 3]
+                                          [--orders 60] [--minutes 60]
+                                          [--trip-window 10] [--trip-capacity 3]
+
+Exits with code 1 if trips of a delivery person overlap, a trip has more
+orders than its capacity, or the dispatcher does not shorten the average
+pickup wait.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import current_app
+from sqlalchemy import update
+from benchmarks.database import BENCHMARK_SEED, make_app
+from data_generator import generate_data, seed_menu
+from dispatch import get_dispatcher
+from models import DELIVERY_DURATION, db, DeliveryPerson
+from ordering import DeliverySlot, delivery_times, reserve_delivery
+
+# Start of the simulated rush (Europe/Amsterdam)
+RUSH_START = datetime(2024, 12, 20, 17, 30, tzinfo=ZoneInfo("Europe/Amsterdam"))
+
+
+def single_courier_slot(postal_code, now):
+    """
+    Reserve a slot the original way: always the first delivery person of the postal code.
+
+    Args:
+        postal_code (str): Normalized postal code
+        now (datetime): Simulated order time
+
+    Returns:
+        DeliverySlot or None: The reserved slot, None if nobody serves the postal code
+    """
+    delivery_person = (
+        DeliveryPerson.query
+        .filter(DeliveryPerson.postal_code == postal_code)
+        .order_by(DeliveryPerson.delivery_person_id)
+        .first()
+    )
+    if delivery_person is None:
+        return None
+    pickup_time, expected_delivery_time = delivery_times(delivery_person.next_available_time, now)
+    delivery_person.next_available_time = expected_delivery_time.replace(tzinfo=None)
+    return DeliverySlot(delivery_person.delivery_person_id, pickup_time, expected_delivery_time)
+
+
+POLICIES = {
+    "single": single_courier_slot,
+    "dispatcher": lambda postal_code, now: reserve_delivery(postal_code, now=now),
+    "trips": lambda postal_code, now: reserve_delivery(postal_code, now=now),
+}
+
+
+def prepare_zones(zones, couriers_per_zone):
+    """
+    Spread the delivery persons evenly over the first postal codes.
+
+    Returns:
+        list of str: The postal codes of the rush
+    """
+    postal_codes = sorted({code for (code,) in db.session.query(DeliveryPerson.postal_code)})[:zones]
+    couriers = DeliveryPerson.query.order_by(DeliveryPerson.delivery_person_id).all()
+    for index, courier in enumerate(couriers[:zones * couriers_per_zone]):
+        courier.postal_code = postal_codes[index % zones]
+    for courier in couriers[zones * couriers_per_zone:]:
+        courier.postal_code = "0000XX"
+    db.session.commit()
+    return postal_codes
+
+
+def make_rush(rng, postal_codes, orders, minutes):
+    """
+    Draw the orders of the rush.
+
+    Returns:
+        list of tuple: (order time, postal code), ordered by time
+    """
+    return sorted(
+        (RUSH_START + timedelta(seconds=rng.randint(0, minutes * 60)), rng.choice(postal_codes))
+        for _ in range(orders)
+    )
+
+
+def simulate(policy, rush, postal_codes, capacity):
+    """
+    Reserve a slot for every order of the rush, starting with all delivery persons free.
+
+    Returns:
+        tuple: (waits in minutes, trips per delivery person, problems)
+    """
+    current_app.config["TRIP_BATCHING"] = policy == "trips"
+    db.session.execute(
+        update(DeliveryPerson)
+        .where(DeliveryPerson.postal_code.in_(postal_codes))
+        .values(next_available_time=RUSH_START.replace(tzinfo=None))
+    )
+    db.session.commit()
+    get_dispatcher().clear()
+
+    waits = []
+    # Pickup time and number of orders per trip and delivery person; without
+    # batching every order is a trip of its own
+    trips = {}
+    problems = []
+    for number, (order_time, postal_code) in enumerate(rush):
+        slot = POLICIES[policy](postal_code, order_time)
+        db.session.commit()
+        if slot is None:
+            problems.append(f"{policy}: no delivery person for {postal_code}")
+            continue
+        waits.append((slot.pickup_time - order_time).total_seconds() / 60)
+        trip = trips.setdefault(slot.delivery_person_id, {}).setdefault(
+            slot.trip_id or f"order-{number}", [slot.pickup_time, 0])
+        if trip[0] != slot.pickup_time:
+            problems.append(f"{policy}: orders of trip {slot.trip_id} have different pickup times")
+        trip[1] += 1
+
+    for delivery_person_id, courier_trips in trips.items():
+        pickups = sorted(pickup for pickup, _ in courier_trips.values())
+        if any(later - earlier < DELIVERY_DURATION for earlier, later in zip(pickups, pickups[1:])):
+            problems.append(f"{policy}: overlapping trips of delivery person {delivery_person_id}")
+        if any(orders > capacity for _, orders in courier_trips.values()):
+            problems.append(f"{policy}: a trip of delivery person {delivery_person_id} is over capacity")
+    current_app.config["TRIP_BATCHING"] = False
+    return waits, {courier: len(courier_trips) for courier, courier_trips in sorted(trips.items())}, problems
+
+
+def main(argv=None):
+    """
+    Run the simulation from the command line.
+
+    Returns:
+        int: Exit code, 1 if the check failed
+    """
+    parser = argparse.ArgumentParser(description="Compare pickup waits with and without the courier dispatcher.")
+    parser.add_argument("--zones", type=int, default=3, help="Number of postal codes in the rush")
+    parser.add_argument("--couriers-per-zone", type=int, default=3, help="Delivery persons per postal code")
+    parser.add_argument("--orders", type=int, default=60, help="Number of orders in the rush")
+    parser.add_argument("--minutes", type=int, default=60, help="Length of the rush in minutes")
+    parser.add_argument("--trip-window", type=float, default=10, help="Trip batching window in minutes")
+    parser.add_argument("--trip-capacity", type=int, default=3, help="Maximum number of orders per trip")
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+    args = parser.parse_args(argv)
+
+    problems = []
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, "dispatch.sqlite"))
+        app.config.update(TRIP_WINDOW_MINUTES=args.trip_window, TRIP_CAPACITY=args.trip_capacity)
+        with app.app_context():
+            seed_menu()
+            generate_data(customers=20, couriers=args.zones * args.couriers_per_zone, postal_codes=args.zones,
+                          orders=20, days=30, seed=args.seed)
+        with app.test_request_context():
+            postal_codes = prepare_zones(args.zones, args.couriers_per_zone)
+            rush = make_rush(random.Random(args.seed), postal_codes, args.orders, args.minutes)
+            print(f"Rush of {args.orders} orders in {args.minutes} minutes over {args.zones} postal codes, "
+                  f"{args.couriers_per_zone} delivery persons each")
+            for policy in POLICIES:
+                waits, per_courier, policy_problems = simulate(policy, rush, postal_codes, args.trip_capacity)
+                problems.extend(policy_problems)
+                waits.sort()
+                results[policy] = statistics.mean(waits)
+                print(f"  {policy:<10} pickup wait: mean {results[policy]:6.1f} min, "
+                      f"p95 {waits[min(len(waits) - 1, int(len(waits) * 0.95))]:6.1f} min, "
+                      f"max {waits[-1]:6.1f} min; trips per delivery person {list(per_courier.values())}")
+            db.session.remove()
+        with app.app_context():
+            db.engine.dispose()
+
+    if args.couriers_per_zone > 1 and results["dispatcher"] >= results["single"]:
+        problems.append("the dispatcher does not shorten the average pickup wait")
+    for problem in problems:
+        print(f"  {problem}")
+    print("Courier dispatch simulation failed." if problems else "Courier dispatch simulation passed.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Benchmark Databases
+
+Builds (and caches) SQLite databases at the benchmark scales with the data
+generator, and provides the helpers every benchmark needs: an application
+bound to a database and a counter for the SQL statements it executes.
+
+The databases are generated with a fixed seed and end date, so every machine
+benchmarks exactly the same data.
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app import create_app
+from data_generator import generate_data, seed_menu
+from models import db, Order
+
+# Directory the generated databases are cached in
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+# Seed and end date of the generated data, changing them invalidates the baselines
+BENCHMARK_SEED = 2024
+BENCHMARK_END = datetime(2024, 12, 31, 22, 0)
+
+# Data generator parameters per scale
+SCALES = {
+    "1k": {"customers": 200, "couriers": 10, "postal_codes": 5, "orders": 1000, "days": 90},
+    "100k": {"customers": 10000, "couriers": 50, "postal_codes": 20, "orders": 100000, "days": 365},
+    "1m": {"customers": 100000, "couriers": 200, "postal_codes": 100, "orders": 1000000, "days": 730},
+}
+
+
+def make_app(path, config=None):
+    """
+    Create the application on an existing SQLite database, without re-seeding it.
+
+    Args:
+        path (str): Path of the SQLite database file
+        config (dict, optional): Extra configuration, e.g. REPORT_CACHE_TTL
+
+    Returns:
+        Flask: Configured application
+    """
+    return create_app(dict({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(path)}",
+        "SEED_ON_STARTUP": False,
+    }, **(config or {})))
+
+
+def schema_fingerprint():
+    """
+    Hash the SQLite schema (tables and indexes) of the models.
+
+    Part of the cached database file names, so a model change (e.g. a new
+    index) never benchmarks a database generated with the old schema.
+
+    Returns:
+        str: First 8 hex digits of the hash
+    """
+    digest = hashlib.sha256()
+    for table in db.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=sqlite.dialect())).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=sqlite.dialect())).encode())
+    return digest.hexdigest()[:8]
+
+
+def build_database(scale, data_dir=DEFAULT_DATA_DIR):
+    """
+    Get the path of the generated database for a scale, generating it if needed.
+
+    Args:
+        scale (str): Key of SCALES
+        data_dir (str): Directory the databases are cached in
+
+    Returns:
+        str: Path of the (cached) database file
+    """
+    params = SCALES[scale]
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"orders-{scale}-seed{BENCHMARK_SEED}-{schema_fingerprint()}.sqlite")
+    if os.path.exists(path):
+        return path
+
+    # Generate into a temporary file, so an interrupted run leaves no half-filled database
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    print(f"Generating the {scale} database ({params['orders']} orders)...", flush=True)
+    start = time.perf_counter()
+    app = make_app(partial)
+    with app.app_context():
+        seed_menu()
+        generate_data(seed=BENCHMARK_SEED, end=BENCHMARK_END, **params)
+        assert db.session.query(Order).count() == params["orders"]
+        db.session.remove()
+        db.engine.dispose()
+    os.replace(partial, path)
+    print(f"Generated the {scale} database in {time.perf_counter() - start:.1f}s", flush=True)
+    return path
+
+
+def working_copy(path, directory):
+    """
+    Copy a cached database, so benchmarks that write (e.g. create orders) never change the cache.
+
+    Args:
+        path (str): Cached database file
+        directory (str): Directory for the copy
+
+    Returns:
+        str: Path of the copy
+    """
+    copy = os.path.join(directory, os.path.basename(path))
+    shutil.copyfile(path, copy)
+    return copy
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements executed on the engine of an application.
+
+    Attributes:
+        count (int): Statements executed since the last reset()
+        statements (list of str): The statements executed since the last reset()
+    """
+
+    def __init__(self, app):
+        self.count = 0
+        self.statements = []
+        with app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def reset(self):
+        """Start counting from zero."""
+        self.count = 0
+        self.statements = []
+
+    def close(self):
+        """Stop counting."""
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
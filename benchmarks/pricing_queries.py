@@ -0,0 +1,260 @@
+"""
+Pricing Query Check
+
+Checks the two promises of the pricing service (pricing.py) on a small
+generated database:
+- A quote runs the same number of SQL statements however many orders the
+  customer placed before. The customer's history is grown step by step and
+  the statements of a quote are counted after every step.
+- A quote has the same total and discount messages as the original pricing
+  rules, which walked the customer's full order history. Random orders
+  (birthdays, orders earlier that day, used and unused discount codes,
+  loyalty thresholds) are priced both ways and compared.
+
+Usage (from the project directory):
+    python -m benchmarks.pricing_queries [--history 0,10,100,1000] [--cases 500]
+
+Exits with code 1 if the query count grows or a total differs.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+from benchmarks.database import BENCHMARK_END, BENCHMARK_SEED, QueryCounter, make_app
+from catalog import get_catalog
+from data_generator import generate_data, seed_menu
+from models import db, Customer, DeliveryPerson, DiscountCode, Order, OrderItem, record_customer_order
+from pricing import PricingService
+
+# Small database, the customer histories are grown by the check itself
+GENERATOR_PARAMS = {"customers": 50, "couriers": 3, "postal_codes": 3, "orders": 500, "days": 60}
+
+# Discount codes tried in the comparison; None is no code, NOPE10 does not exist
+TRIED_CODES = (None, "WELCOME10", "STUDENT15", "VIP20", "NOPE10")
+
+
+def legacy_quote(customer, order_items, discount, today):
+    """
+    Price an order with the original rules, reading the full order history.
+
+    Args:
+        customer (Customer): Customer placing the order
+        order_items (list of tuple): (CatalogItem, amount) pairs
+        discount (DiscountCode or None): Discount code entered, if it exists
+        today (date): Day of the order
+
+    Returns:
+        tuple: (total, messages)
+    """
+    pizza_prices = []
+    drink_prices = []
+    for item, amount in order_items:
+        if item.item_type == "pizza":
+            pizza_prices.extend([item.price] * amount)
+        elif item.item_type == "drink":
+            drink_prices.extend([item.price] * amount)
+    subtotal = sum(item.price * amount for item, amount in order_items)
+    messages = []
+    free_pizza = free_drink = 0
+
+    is_birthday = customer.birthdate.month == today.month and customer.birthdate.day == today.day
+    if is_birthday and not any(order.order_time.date() == today for order in customer.orders):
+        free_pizza += 1
+        free_drink += 1
+        messages.append("happy birthday! you get one pizza and drink for free")
+
+    ordered = customer.total_pizzas_ordered
+    ten_discount = (ordered + len(pizza_prices)) // 10 - ordered // 10
+    if ten_discount > 0:
+        free_pizza += ten_discount
+        messages.append(f"10-pizza discount applied ({ten_discount} free pizza('s))")
+
+    for _ in range(free_pizza):
+        if pizza_prices:
+            cheapest = min(pizza_prices)
+            subtotal -= cheapest
+            pizza_prices.remove(cheapest)
+    for _ in range(free_drink):
+        if drink_prices:
+            cheapest = min(drink_prices)
+            subtotal -= cheapest
+            drink_prices.remove(cheapest)
+
+    if discount:
+        if discount in DiscountCode.query.all() and not any(
+                order.discount_id == discount.discount_id for order in customer.orders):
+            subtotal *= (100 - discount.percentage) / 100
+            messages.append(f"discount code applied, {discount.percentage}% off")
+        else:
+            messages.append("discount code is invalid")
+    return round(subtotal, 2), messages
+
+
+def add_orders(rng, customer, count, catalog, discounts, courier_id, day=None):
+    """
+    Add orders to a customer's history, like the order form would.
+
+    Args:
+        rng (random.Random): Random source
+        customer (Customer): Customer placing the orders
+        count (int): Number of orders to add
+        catalog (Catalog): Menu catalog for the items and prices
+        discounts (list of DiscountCode): Codes an order may use
+        courier_id (int): Delivery person of the orders
+        day (date): Day of all orders (default: random days in the last two years)
+    """
+    for _ in range(count):
+        if day is None:
+            order_time = datetime.now() - timedelta(days=rng.randint(1, 730), minutes=rng.randint(0, 1439))
+        else:
+            order_time = datetime.combine(day, time(12, 0)) + timedelta(minutes=rng.randint(0, 600))
+        pizza = rng.choice(catalog.pizzas)
+        amount = rng.randint(1, 3)
+        total = round(pizza.price * amount, 2)
+        order = Order(
+            customer_id=customer.customer_id,
+            delivery_person_id=courier_id,
+            discount_id=rng.choice(discounts).discount_id if rng.random() < 0.05 else None,
+            order_time=order_time,
+            delivery_address=customer.address,
+            postal_code=customer.postal_code,
+            pickup_time=order_time,
+            raw_price=total,
+            total_price=total,
+        )
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.order_id, item_id=pizza.item_id, amount=amount, unit_price=pizza.price))
+        record_customer_order(customer.customer_id, amount, total, order_time)
+    db.session.commit()
+
+
+def random_items(rng, catalog):
+    """Pick 1-4 random menu items with random amounts, always including a pizza."""
+    items = {rng.choice(catalog.pizzas).item_id: rng.randint(1, 12)}
+    for item in rng.sample(catalog.items, rng.randint(0, 3)):
+        items[item.item_id] = rng.randint(1, 4)
+    return sorted(items.items())
+
+
+def check_query_counts(counter, rng, steps, catalog, discounts, courier_id):
+    """
+    Count the statements of a quote while one customer's history grows.
+
+    Returns:
+        list of tuple: (orders in history, statements of the quote)
+    """
+    # A new customer, so the history starts empty
+    template = db.session.get(Customer, 1)
+    customer = Customer(first_name="Query", last_name="Count", birthdate=template.birthdate,
+                        address=template.address, postal_code=template.postal_code,
+                        phone_number="06-99999999", gender=template.gender)
+    db.session.add(customer)
+    db.session.commit()
+    customer_id = customer.customer_id
+
+    items = random_items(rng, catalog)
+    results = []
+    history = 0
+    for target in steps:
+        if target > history:
+            add_orders(rng, customer, target - history, catalog, discounts, courier_id)
+            history = target
+        db.session.expire_all()
+        counter.reset()
+        PricingService().quote(customer_id, items, "VIP20")
+        results.append((history, counter.count))
+    return results
+
+
+def compare_with_legacy(rng, cases, catalog, discounts, courier_id):
+    """
+    Price random orders with the pricing service and the original rules.
+
+    Returns:
+        list of str: Descriptions of the differences, empty if there are none
+    """
+    customers = Customer.query.order_by(Customer.customer_id).all()
+    differences = []
+    for case in range(cases):
+        customer = rng.choice(customers)
+        today = date.today()
+        if rng.random() < 0.3:
+            # Price on the customer's birthday, sometimes after an earlier order that day
+            today = date(2024, customer.birthdate.month, customer.birthdate.day)
+            if rng.random() < 0.5:
+                add_orders(rng, customer, 1, catalog, discounts, courier_id, day=today)
+        if rng.random() < 0.2:
+            add_orders(rng, customer, rng.randint(1, 15), catalog, discounts, courier_id)
+        items = random_items(rng, catalog)
+        code = rng.choice(TRIED_CODES)
+
+        db.session.expire_all()
+        quote = PricingService(catalog).quote(customer.customer_id, items, code, today=today)
+        discount = DiscountCode.query.filter_by(discount_code=code).first() if code else None
+        total, messages = legacy_quote(customer, [(catalog.get(item_id), amount) for item_id, amount in items],
+                                       discount, today)
+        if quote.total != total or quote.messages != messages:
+            differences.append(f"case {case} customer {customer.customer_id} {items} {code} on {today}: "
+                               f"{quote.total} {quote.messages} != {total} {messages}")
+    return differences
+
+
+def main(argv=None):
+    """
+    Run the pricing checks from the command line.
+
+    Returns:
+        int: Exit code, 1 if a check failed
+    """
+    parser = argparse.ArgumentParser(description="Check the query count and totals of the pricing service.")
+    parser.add_argument("--history", default="0,10,100,1000",
+                        help="Comma separated history sizes to count the quote statements at")
+    parser.add_argument("--cases", type=int, default=500, help="Random orders compared with the original rules")
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+    args = parser.parse_args(argv)
+    steps = sorted(int(step) for step in args.history.split(",") if step.strip())
+    rng = random.Random(args.seed)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(f"{directory}/pricing.sqlite")
+        with app.app_context():
+            seed_menu()
+            generate_data(seed=args.seed, end=BENCHMARK_END, **GENERATOR_PARAMS)
+        counter = QueryCounter(app)
+
+        with app.test_request_context():
+            catalog = get_catalog()
+            discounts = DiscountCode.query.all()
+            courier_id = DeliveryPerson.query.first().delivery_person_id
+
+            counts = check_query_counts(counter, rng, steps, catalog, discounts, courier_id)
+            for history, statements in counts:
+                print(f"  {history:>6} orders in history: {statements} statements per quote")
+            if len({statements for _, statements in counts}) != 1:
+                print("FAIL: the statements per quote grow with the order history")
+                failed = True
+
+            differences = compare_with_legacy(rng, args.cases, catalog, discounts, courier_id)
+            for difference in differences[:20]:
+                print(f"  {difference}")
+            if differences:
+                print(f"FAIL: {len(differences)} of {args.cases} quotes differ from the original rules")
+                failed = True
+            else:
+                print(f"  {args.cases} random quotes match the original rules")
+
+            db.session.remove()
+        counter.close()
+        with app.app_context():
+            db.engine.dispose()
+
+    print("Pricing checks failed." if failed else "Pricing checks passed.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Report Range Check
+
+Checks the earnings report (earnings_query() in reports.py) for every kind of
+report period (day, ISO week, month, quarter and a custom from/to range) on a
+small generated database:
+- The query plan (EXPLAIN QUERY PLAN) searches the orders with the
+  ix_order_order_time_customer_spend index on a range of order_time and the
+  CustomerMonthlySpend rollup on its primary key, and never scans the order
+  table. The plan of the original extract(year/month) filter is printed for
+  contrast.
+- The earnings per customer equal a plain sum over all orders whose day is
+  in the period. Orders are added exactly at midnight of the first day and
+  of the first day after the period, so an off-by-one in the half-open
+  ranges shows up.
+
+Only SQLite plans are checked; on MySQL, look at EXPLAIN of the printed
+statements.
+
+Usage (from the project directory):
+    python -m benchmarks.report_ranges [--cases 200]
+
+Exits with code 1 if a plan scans the orders or an earnings total differs.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import extract, func, select
+from benchmarks.database import BENCHMARK_END, BENCHMARK_SEED, make_app
+from data_generator import generate_data, seed_menu
+from models import db, Customer, DeliveryPerson, Order, record_order_sales
+from reports import REPORT_PERIODS, earnings_query, report_period
+
+# Small database spanning a few quarters
+GENERATOR_PARAMS = {"customers": 100, "couriers": 5, "postal_codes": 5, "orders": 3000, "days": 270}
+
+# Index the order ranges must use
+ORDER_RANGE_INDEX = "ix_order_order_time_customer_spend"
+
+# Periods whose plans are checked, one per kind; the custom range starts and
+# ends mid-month, so it reads the rollup and the orders on both sides
+PLANNED_PERIODS = (
+    ("day", date(2024, 11, 15), None),
+    ("week", date(2024, 11, 15), None),
+    ("month", date(2024, 11, 15), None),
+    ("quarter", date(2024, 11, 15), None),
+    ("custom", date(2024, 6, 10), date(2024, 10, 20)),
+)
+
+
+def query_plan(statement):
+    """
+    Return the SQLite query plan of a statement.
+
+    Args:
+        statement (Select): Statement to explain
+
+    Returns:
+        list of str: Details of the plan steps
+    """
+    sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+    return [row[-1] for row in rows]
+
+
+def check_plan(period):
+    """
+    Check that the earnings query of a period range-scans the orders and the rollup.
+
+    Returns:
+        list of str: Problems found, empty if there are none
+    """
+    problems = []
+    plan = query_plan(earnings_query(period))
+    print(f"  {period.kind:<8} {period.label}")
+    for step in plan:
+        print(f"    {step}")
+    order_steps = [step for step in plan if " order " in f"{step} "]
+    rollup_steps = [step for step in plan if "customer_monthly_spend" in step]
+    for step in order_steps:
+        if not (step.startswith("SEARCH") and ORDER_RANGE_INDEX in step and "order_time>" in step):
+            problems.append(f"{period.kind}: orders are not range-searched on {ORDER_RANGE_INDEX}: {step}")
+    for step in rollup_steps:
+        if not (step.startswith("SEARCH") and "month>" in step):
+            problems.append(f"{period.kind}: the rollup is not range-searched on its month: {step}")
+    if not order_steps and not rollup_steps:
+        problems.append(f"{period.kind}: the plan reads neither the orders nor the rollup")
+    return problems
+
+
+def legacy_plan(day):
+    """
+    Print the plan of the original month filter on extract(year/month) of order_time.
+    """
+    statement = (
+        select(Customer.customer_id, func.sum(Order.total_price))
+        .join(Order, Order.customer_id == Customer.customer_id)
+        .where(extract('year', Order.order_time) == day.year,
+               extract('month', Order.order_time) == day.month)
+        .group_by(Customer.customer_id)
+    )
+    print("  extract(year/month) filter of the original report, for contrast")
+    for step in query_plan(statement):
+        print(f"    {step}")
+
+
+def add_boundary_orders(rng, periods):
+    """
+    Add an order exactly at midnight of the start and of the end of every period.
+
+    The orders are recorded in the rollups like orders placed through the
+    application, so the rollup and the orders stay in step.
+    """
+    customers = Customer.query.order_by(Customer.customer_id).limit(20).all()
+    couriers = {courier.postal_code: courier.delivery_person_id for courier in DeliveryPerson.query}
+    for period in periods:
+        for day in (period.start, period.end):
+            customer = rng.choice([customer for customer in customers if customer.postal_code in couriers])
+            order_time = datetime.combine(day, datetime.min.time())
+            raw_price = Decimal(rng.randint(1000, 5000)) / 100
+            db.session.add(Order(customer_id=customer.customer_id, order_time=order_time,
+                                 raw_price=raw_price, total_price=raw_price,
+                                 delivery_address=customer.address, postal_code=customer.postal_code,
+                                 delivery_person_id=couriers[customer.postal_code],
+                                 pickup_time=order_time + timedelta(minutes=15)))
+            record_order_sales(customer.customer_id, customer.postal_code, raw_price, raw_price,
+                               order_time, {})
+    db.session.commit()
+
+
+def compare_with_orders(rng, cases, first_day, last_day):
+    """
+    Compare the earnings of random periods with a plain sum over the orders.
+
+    Returns:
+        list of str: Problems found, empty if there are none
+    """
+    orders = db.session.query(Order.order_time, Order.customer_id, Order.raw_price, Order.total_price).all()
+    problems = []
+    span = (last_day - first_day).days
+    for _ in range(cases):
+        kind = rng.choice(REPORT_PERIODS)
+        day = first_day + timedelta(days=rng.randint(0, span))
+        last = day + timedelta(days=rng.randint(0, 120)) if kind == "custom" else None
+        period = report_period(kind, day, last)
+
+        expected = {}
+        for order_time, customer_id, raw_price, total_price in orders:
+            if period.start <= order_time.date() < period.end:
+                raw, total = expected.get(customer_id, (0, 0))
+                expected[customer_id] = (raw + raw_price, total + total_price)
+        actual = {
+            row.customer_id: (Decimal(str(row.total_before_discount)).quantize(Decimal("0.01")),
+                              Decimal(str(row.total_spent)).quantize(Decimal("0.01")))
+            for row in db.session.execute(earnings_query(period))
+        }
+        if actual != expected:
+            differing = sorted(set(actual.items()) ^ set(expected.items()))[:3]
+            problems.append(f"{kind} {period.label}: earnings differ for {differing}")
+    print(f"  {cases} random periods compared with a sum over {len(orders)} orders")
+    return problems
+
+
+def main(argv=None):
+    """
+    Run the report range check from the command line.
+
+    Returns:
+        int: Exit code, 1 if the check failed
+    """
+    parser = argparse.ArgumentParser(description="Check the plans and totals of the earnings report periods.")
+    parser.add_argument("--cases", type=int, default=200, help="Number of random periods to compare")
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, "reports.sqlite"))
+        with app.app_context():
+            seed_menu()
+            generate_data(seed=args.seed, end=BENCHMARK_END, **GENERATOR_PARAMS)
+            periods = [report_period(kind, day, last) for kind, day, last in PLANNED_PERIODS]
+            add_boundary_orders(rng, periods)
+
+            print("Query plans of the earnings report")
+            for period in periods:
+                problems.extend(check_plan(period))
+            legacy_plan(periods[2].start)
+
+            print("Earnings compared with the orders")
+            last_day = BENCHMARK_END.date()
+            problems.extend(compare_with_orders(rng, args.cases,
+                                                last_day - timedelta(days=GENERATOR_PARAMS["days"]), last_day))
+            db.session.remove()
+            db.engine.dispose()
+
+    for problem in problems:
+        print(f"  {problem}")
+    print("Report range check failed." if problems else "Report range check passed.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
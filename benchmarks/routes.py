@@ -0,0 +1,307 @@
+"""
+Route Benchmarks
+
+Drives the main routes through the Flask test client against the generated
+benchmark databases and records per request:
+- wall time (median and minimum over the repetitions)
+- number of SQL statements
+- peak Python memory allocated while handling the request (tracemalloc)
+
+The results are written as JSON and compared against a stored baseline
+(benchmarks/baseline.json). The run fails (exit code 1) when a route runs more
+queries than in the baseline, or is slower (fastest run) or uses more memory
+than the baseline plus a tolerance.
+
+Usage (from the project directory):
+    python -m benchmarks.routes [--scales 1k,100k,1m] [--repeat 5]
+                                [--output results.json] [--update-baseline]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from benchmarks.database import DEFAULT_DATA_DIR, SCALES, QueryCounter, build_database, make_app, working_copy
+from models import db, Customer, MenuItem
+
+# Stored baseline the results are compared against
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Allowed slowdown and memory growth compared to the baseline (0.5 = 50%).
+# Timings vary between runs of the same code; the query counts are exact.
+DEFAULT_TIME_TOLERANCE = 0.5
+DEFAULT_MEMORY_TOLERANCE = 0.25
+
+# Number of orders in the batch sent to the JSON order API
+API_BATCH_SIZE = 20
+
+# Staff report periods inside the generated data, which ends at BENCHMARK_END.
+# The quarter is read from the monthly rollup only, the custom range also
+# reads the days around its whole month from the orders.
+STAFF_REPORT_QUARTER = "period=quarter&date_from=2024-10-01"
+STAFF_REPORT_CUSTOM = "period=custom&date_from=2024-10-15&date_to=2024-12-20"
+
+# The staff report cache is disabled, otherwise every request after the first
+# one is a cache hit and the report queries are never measured
+BENCHMARK_CONFIG = {"REPORT_CACHE_TTL": 0}
+
+# Differences below these are noise, never a regression
+MIN_TIME_DIFFERENCE_MS = 5.0
+MIN_MEMORY_DIFFERENCE_KIB = 64
+
+
+def benchmark_cases(app):
+    """
+    Build the requests to benchmark, using a customer and menu items from the database.
+
+    Args:
+        app (Flask): Application on the benchmark database
+
+    Returns:
+        list of dict: Cases with name, method, path, optional form or JSON data and the expected status
+    """
+    with app.app_context():
+        customers = Customer.query.order_by(Customer.customer_id).limit(API_BATCH_SIZE).all()
+        customer = customers[0]
+        pizza = MenuItem.query.filter_by(item_type="pizza").order_by(MenuItem.item_id).first()
+        drink = MenuItem.query.filter_by(item_type="drink").order_by(MenuItem.item_id).first()
+        postal_code = customer.postal_code
+        order_form = {
+            "customer_id": customer.customer_id,
+            "use_customer_address": "on",
+            f"item_{pizza.item_id}": "2",
+            f"item_{drink.item_id}": "1",
+        }
+        api_batch = {"orders": [
+            {"customer_id": batch_customer.customer_id,
+             "items": [{"item_id": pizza.item_id, "amount": 2}, {"item_id": drink.item_id, "amount": 1}]}
+            for batch_customer in customers
+        ]}
+        db.session.remove()
+
+    return [
+        {"name": "list_orders", "method": "GET", "path": "/list_orders", "status": 200},
+        {"name": "list_orders_filtered", "method": "GET",
+         "path": f"/list_orders?status=delivered&postal_code={postal_code}", "status": 200},
+        {"name": "list_menu_items", "method": "GET", "path": "/menu-items/", "status": 200},
+        {"name": "list_menu_items_filtered", "method": "GET",
+         "path": "/menu-items/?label=vegetarian&sort=price_asc", "status": 200},
+        {"name": "list_customers", "method": "GET", "path": "/customers", "status": 200},
+        {"name": "staff_reports", "method": "GET", "path": f"/staff_reports?{STAFF_REPORT_QUARTER}", "status": 200},
+        {"name": "staff_reports_custom", "method": "GET", "path": f"/staff_reports?{STAFF_REPORT_CUSTOM}",
+         "status": 200},
+        {"name": "create_order_form", "method": "GET", "path": "/create_order", "status": 200},
+        {"name": "create_order_preview", "method": "POST", "path": "/create_order",
+         "data": dict(order_form, action="preview"), "status": 200},
+        {"name": "create_order_create", "method": "POST", "path": "/create_order",
+         "data": dict(order_form, action="create"), "status": 302},
+        {"name": "api_orders_batch", "method": "POST", "path": "/api/orders", "json": api_batch, "status": 201},
+    ]
+
+
+def send(client, case):
+    """Send the request of a case and read the complete response body."""
+    response = client.open(case["path"], method=case["method"], data=case.get("data"), json=case.get("json"))
+    response.get_data()
+    return response
+
+
+def measure(client, counter, case, repeat):
+    """
+    Benchmark one case.
+
+    The request is sent once to warm up (caches, compiled statements), then
+    `repeat` times for timing (without garbage collection), then once more
+    under tracemalloc for memory, because tracing slows down the request.
+
+    Args:
+        client (FlaskClient): Test client
+        counter (QueryCounter): Counter on the application's engine
+        case (dict): Case from benchmark_cases()
+        repeat (int): Number of timed requests
+
+    Returns:
+        dict: status, time_ms (median, min), queries and peak_memory_kib
+    """
+    send(client, case)
+
+    times = []
+    queries = 0
+    for _ in range(repeat):
+        # Like timeit, keep garbage collection out of the timed request
+        gc.collect()
+        gc.disable()
+        try:
+            counter.reset()
+            start = time.perf_counter()
+            response = send(client, case)
+            times.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+        queries = max(queries, counter.count)
+
+    tracemalloc.start()
+    try:
+        send(client, case)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "time_ms": {"median": round(statistics.median(times), 3), "min": round(min(times), 3)},
+        "queries": queries,
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def run_scale(scale, repeat, data_dir):
+    """
+    Benchmark all cases against the database of one scale.
+
+    Args:
+        scale (str): Key of SCALES
+        repeat (int): Number of timed requests per case
+        data_dir (str): Directory the databases are cached in
+
+    Returns:
+        dict: Generator parameters and the results per case
+    """
+    path = build_database(scale, data_dir)
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(working_copy(path, directory), BENCHMARK_CONFIG)
+        counter = QueryCounter(app)
+        client = app.test_client()
+        results = {}
+        for case in benchmark_cases(app):
+            result = measure(client, counter, case, repeat)
+            results[case["name"]] = result
+            status = "" if result["status"] == case["status"] else f"  UNEXPECTED STATUS {result['status']}"
+            print(f"  {scale:>5} {case['name']:<26} {result['time_ms']['median']:>10.2f} ms "
+                  f"{result['queries']:>5} queries {result['peak_memory_kib']:>10.1f} KiB{status}", flush=True)
+        counter.close()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    return {"params": SCALES[scale], "cases": results}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """
+    Compare results against a baseline.
+
+    Args:
+        results (dict): Output of the benchmark run
+        baseline (dict): Stored baseline in the same format
+        time_tolerance (float): Allowed relative slowdown
+        memory_tolerance (float): Allowed relative memory growth
+
+    Returns:
+        list of str: Descriptions of the regressions, empty if there are none
+    """
+    regressions = []
+    for scale, scale_results in results["scales"].items():
+        baseline_scale = baseline.get("scales", {}).get(scale)
+        if baseline_scale is None:
+            continue
+        if baseline_scale.get("params") != scale_results["params"]:
+            regressions.append(f"{scale}: generated data differs from the baseline, update the baseline")
+            continue
+        for name, result in scale_results["cases"].items():
+            expected = baseline_scale["cases"].get(name)
+            if expected is None:
+                continue
+            label = f"{scale} {name}"
+            if result["status"] != expected["status"]:
+                regressions.append(f"{label}: status {result['status']} (baseline {expected['status']})")
+            if result["queries"] > expected["queries"]:
+                regressions.append(f"{label}: {result['queries']} queries (baseline {expected['queries']})")
+            # The fastest run is the most stable measure on a busy machine
+            time_ms, expected_ms = result["time_ms"]["min"], expected["time_ms"]["min"]
+            if time_ms > expected_ms * (1 + time_tolerance) and time_ms - expected_ms > MIN_TIME_DIFFERENCE_MS:
+                regressions.append(f"{label}: {time_ms:.2f} ms (baseline {expected_ms:.2f} ms)")
+            memory, expected_memory = result["peak_memory_kib"], expected["peak_memory_kib"]
+            if (memory > expected_memory * (1 + memory_tolerance)
+                    and memory - expected_memory > MIN_MEMORY_DIFFERENCE_KIB):
+                regressions.append(f"{label}: {memory:.1f} KiB peak memory (baseline {expected_memory:.1f} KiB)")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Run the route benchmarks from the command line.
+
+    Returns:
+        int: Exit code, 1 if there are regressions
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the main routes against generated databases.")
+    parser.add_argument("--scales", default="1k,100k",
+                        help=f"Comma separated scales to run, from: {', '.join(SCALES)} (default: 1k,100k)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed requests per route (default: 5)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory the generated databases are cached in")
+    parser.add_argument("--output", default="benchmark-results.json", help="File to write the results to")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store the results as the new baseline (merged per scale) instead of comparing")
+    parser.add_argument("--time-tolerance", type=float, default=DEFAULT_TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f"Unknown scale(s): {', '.join(unknown)}")
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    for scale in scales:
+        results["scales"][scale] = run_scale(scale, args.repeat, args.data_dir)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        # Keep the baseline of scales that were not run
+        baseline.update({key: value for key, value in results.items() if key != "scales"})
+        baseline.setdefault("scales", {}).update(results["scales"])
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("No baseline to compare against, create one with --update-baseline")
+        return 0
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("Regressions compared to the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions compared to the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
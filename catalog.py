@@ -0,0 +1,205 @@
+"""
+Menu Catalog for Pizza Ordering System
+
+This module keeps an immutable, in-memory snapshot of the menu per worker.
+The snapshot holds everything the menu-heavy routes need for every menu item:
+item_id, type, name, price, dietary label and ingredient names.
+
+Each snapshot carries the version number stored in the catalog_version table.
+That number is bumped in the same transaction as any change to the menu (see
+bump_catalog_version() in models.py). On every request the worker reads the
+current version (one small query) and only reloads the snapshot when the
+version changed. Hits and reloads are counted, so the hit rate can be measured.
+"""
+
+from collections import namedtuple
+from threading import Lock
+from types import MappingProxyType
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from models import db, CatalogVersion, MenuItem, Pizza, Drink, Dessert
+
+# One orderable menu item. Drinks and desserts have no label or ingredients.
+CatalogItem = namedtuple(
+    "CatalogItem",
+    ["item_id", "item_type", "item_ref_id", "name", "price", "label", "ingredients"],
+)
+
+
+class Catalog:
+    """
+    Immutable snapshot of the menu at a specific catalog version.
+
+    Attributes:
+        version (int): Catalog version this snapshot was loaded at
+        items (tuple of CatalogItem): All menu items, ordered by item_id
+        pizzas (tuple of CatalogItem): Pizza items
+        drinks (tuple of CatalogItem): Drink items
+        desserts (tuple of CatalogItem): Dessert items
+    """
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = tuple(sorted(items, key=lambda item: item.item_id))
+        self._by_id = MappingProxyType({item.item_id: item for item in self.items})
+        self._by_ref = MappingProxyType({(item.item_type, item.item_ref_id): item for item in self.items})
+        self.pizzas = self._of_type("pizza")
+        self.drinks = self._of_type("drink")
+        self.desserts = self._of_type("dessert")
+
+    def _of_type(self, item_type):
+        """Returns the items of one type, ordered by item_id."""
+        return tuple(item for item in self.items if item.item_type == item_type)
+
+    def get(self, item_id):
+        """
+        Look up a menu item by its item_id.
+
+        Args:
+            item_id (int): MenuItem.item_id
+
+        Returns:
+            CatalogItem or None: The menu item, or None if it does not exist
+        """
+        return self._by_id.get(item_id)
+
+    def get_by_ref(self, item_type, item_ref_id):
+        """
+        Look up a menu item by the pizza, drink or dessert it refers to.
+
+        Args:
+            item_type (str): "pizza", "drink" or "dessert"
+            item_ref_id (int): pizza_id, drink_id or dessert_id
+
+        Returns:
+            CatalogItem or None: The menu item, or None if it does not exist
+        """
+        return self._by_ref.get((item_type, item_ref_id))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f"<Catalog version={self.version} items={len(self.items)}>"
+
+
+def load_catalog(version):
+    """
+    Load a new catalog snapshot from the database.
+
+    Uses a fixed number of queries regardless of the size of the menu:
+    menu items, pizzas (plus one for their ingredients), drinks and desserts.
+
+    Args:
+        version (int): Catalog version the data is loaded at
+
+    Returns:
+        Catalog: New snapshot
+    """
+    pizzas = {p.pizza_id: p for p in Pizza.query.options(selectinload(Pizza.ingredients)).all()}
+    drinks = {d.drink_id: d for d in Drink.query.all()}
+    desserts = {d.dessert_id: d for d in Dessert.query.all()}
+
+    items = []
+    for menu_item in MenuItem.query.all():
+        if menu_item.item_type == "pizza" and menu_item.item_ref_id in pizzas:
+            pizza = pizzas[menu_item.item_ref_id]
+            items.append(CatalogItem(
+                menu_item.item_id, "pizza", pizza.pizza_id, pizza.name, float(pizza.price),
+                pizza.label, tuple(ing.ingredient_name for ing in pizza.ingredients),
+            ))
+        elif menu_item.item_type == "drink" and menu_item.item_ref_id in drinks:
+            drink = drinks[menu_item.item_ref_id]
+            items.append(CatalogItem(
+                menu_item.item_id, "drink", drink.drink_id, drink.name, float(drink.price), None, (),
+            ))
+        elif menu_item.item_type == "dessert" and menu_item.item_ref_id in desserts:
+            dessert = desserts[menu_item.item_ref_id]
+            items.append(CatalogItem(
+                menu_item.item_id, "dessert", dessert.dessert_id, dessert.name, float(dessert.price), None, (),
+            ))
+    return Catalog(version, items)
+
+
+class CatalogCache:
+    """
+    Per-worker cache holding the current catalog snapshot.
+
+    Attributes:
+        hits (int): Requests served from the cached snapshot
+        misses (int): Requests that had to (re)load the snapshot
+    """
+
+    def __init__(self):
+        self._catalog = None
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def current(self):
+        """
+        Get the catalog snapshot for the current catalog version.
+
+        Reads the version first and only reloads the snapshot if it differs
+        from the cached one. Reading the version before the data guarantees a
+        snapshot is never labelled with a newer version than its data.
+
+        Returns:
+            Catalog: Up to date snapshot
+        """
+        version = db.session.query(CatalogVersion.version).filter_by(catalog_version_id=1).scalar() or 0
+
+        catalog = self._catalog
+        if catalog is not None and catalog.version == version:
+            self.hits += 1
+            return catalog
+
+        with self._lock:
+            # Another thread may have reloaded it while we were waiting
+            catalog = self._catalog
+            if catalog is not None and catalog.version == version:
+                self.hits += 1
+                return catalog
+            catalog = load_catalog(version)
+            self._catalog = catalog
+            self.misses += 1
+            current_app.logger.info("Menu catalog reloaded at version %s (%s items)", version, len(catalog))
+            return catalog
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: hits, misses, hit_rate (0-1) and the cached version
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "version": self._catalog.version if self._catalog else None,
+        }
+
+
+def get_catalog_cache():
+    """
+    Get the catalog cache of the current application.
+
+    The cache is stored per application, so several apps (e.g. on different
+    databases) in one process never share a snapshot.
+
+    Returns:
+        CatalogCache: Cache of the current application
+    """
+    return current_app.extensions.setdefault("menu_catalog", CatalogCache())
+
+
+def get_catalog():
+    """
+    Get the up to date menu catalog snapshot of the current application.
+
+    Returns:
+        Catalog: Up to date snapshot
+    """
+    return get_catalog_cache().current()
@@ -0,0 +1,133 @@
+"""
+Command Line Interface for Pizza Ordering System
+
+This module registers maintenance commands on the Flask CLI. They run inside
+the application context, so they use the same database configuration as the
+web application.
+
+Usage (from the project directory):
+    SEED_ON_STARTUP=0 flask --app app <command>
+
+SEED_ON_STARTUP=0 prevents create_app() from dropping and re-seeding the
+database before the command runs.
+"""
+
+import sys
+from datetime import timedelta
+import click
+from data_generator import GENERATOR_BATCH_SIZE, generate_data, seed_menu
+from exports import EXPORT_FORMATS, export_orders
+from importer import IMPORT_FORMATS, IMPORT_CHUNK_SIZE, import_orders
+from models import db, recompute_pizza_prices, rebuild_customer_stats, rebuild_sales_rollups
+
+
+def register_commands(app):
+    """
+    Register all CLI commands on the Flask application.
+
+    Args:
+        app (Flask): Application to register the commands on
+    """
+
+    @app.cli.command("recompute-pizza-prices")
+    def recompute_pizza_prices_command():
+        """
+        Recalculate the stored price and dietary label of every pizza.
+
+        Use this to repair drift after ingredients were changed outside the
+        application (e.g. directly in MySQL).
+        """
+        changed = recompute_pizza_prices()
+        click.echo(f"Recomputed pizza prices and labels: {changed} pizza(s) corrected.")
+
+    @app.cli.command("backfill-customer-stats")
+    def backfill_customer_stats_command():
+        """
+        Rebuild the customer_stats table from the order history.
+        """
+        rows = rebuild_customer_stats()
+        click.echo(f"Rebuilt customer statistics for {rows} customer(s).")
+
+    @app.cli.command("backfill-sales-rollups")
+    def backfill_sales_rollups_command():
+        """
+        Rebuild the pizza_daily_sales and customer_monthly_spend tables from the order history.
+        """
+        pizza_rows, spend_rows = rebuild_sales_rollups()
+        click.echo(f"Rebuilt {pizza_rows} daily pizza sales row(s) and {spend_rows} monthly customer spend row(s).")
+
+    @app.cli.command("export-orders")
+    @click.option("--format", "export_format", type=click.Choice(list(EXPORT_FORMATS)), default="csv",
+                  help="csv: one row per order line, ndjson: one order per line.")
+    @click.option("--from", "date_from", type=click.DateTime(["%Y-%m-%d"]), default=None,
+                  help="First order date (YYYY-MM-DD).")
+    @click.option("--to", "date_to", type=click.DateTime(["%Y-%m-%d"]), default=None,
+                  help="Last order date (YYYY-MM-DD, inclusive).")
+    @click.option("--output", type=click.Path(dir_okay=False, writable=True), default=None,
+                  help="File to write to, defaults to standard output.")
+    def export_orders_command(export_format, date_from, date_to, output):
+        """
+        Stream orders with their lines, customer and delivery person as CSV or NDJSON.
+        """
+        if date_to is not None:
+            date_to = date_to + timedelta(days=1)
+        out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+        try:
+            for chunk in export_orders(export_format, date_from, date_to):
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+
+    @app.cli.command("import-orders")
+    @click.argument("file", type=click.File("r", encoding="utf-8-sig"))
+    @click.option("--format", "import_format", type=click.Choice(IMPORT_FORMATS), default=None,
+                  help="csv or ndjson, defaults to the file extension.")
+    @click.option("--chunk-size", type=click.IntRange(min=1), default=IMPORT_CHUNK_SIZE, show_default=True,
+                  help="Number of orders inserted per transaction.")
+    def import_orders_command(file, import_format, chunk_size):
+        """
+        Import orders from a CSV or NDJSON file (use - for standard input).
+
+        Invalid orders are skipped and listed with their line number.
+        """
+        if import_format is None:
+            import_format = file.name.rsplit(".", 1)[-1].lower()
+            if import_format not in IMPORT_FORMATS:
+                raise click.UsageError("Cannot tell the format from the file name, use --format.")
+        report = import_orders(file, import_format, chunk_size)
+        for error in report.errors:
+            click.echo(f"line {error['line']} ({error['reference']}): {error['error']}", err=True)
+        click.echo(f"Imported {report.imported} order(s), {report.failed} failed.")
+
+    @app.cli.command("generate-data")
+    @click.option("--customers", type=click.IntRange(min=0), default=1000, show_default=True)
+    @click.option("--couriers", type=click.IntRange(min=1), default=30, show_default=True)
+    @click.option("--postal-codes", type=click.IntRange(min=1), default=20, show_default=True)
+    @click.option("--orders", type=click.IntRange(min=0), default=100000, show_default=True)
+    @click.option("--days", type=click.IntRange(min=1), default=365, show_default=True,
+                  help="Number of days before --end the orders are spread over.")
+    @click.option("--end", type=click.DateTime(["%Y-%m-%d"]), default=None,
+                  help="Date the orders end (YYYY-MM-DD), defaults to now.")
+    @click.option("--seed", type=int, default=None, help="Seed for reproducible data.")
+    @click.option("--batch-size", type=click.IntRange(min=1), default=GENERATOR_BATCH_SIZE, show_default=True,
+                  help="Number of rows per INSERT statement.")
+    @click.option("--reset", is_flag=True, help="Drop and recreate all tables first.")
+    def generate_data_command(customers, couriers, postal_codes, orders, days, end, seed, batch_size, reset):
+        """
+        Generate customers, delivery persons and orders for testing and benchmarking.
+
+        The fixed menu is created first if it does not exist. The same --seed and
+        --end always generate the same data.
+        """
+        if reset:
+            db.drop_all()
+            db.create_all()
+        seed_menu()
+        try:
+            counts = generate_data(customers=customers, couriers=couriers, postal_codes=postal_codes,
+                                   orders=orders, days=days, seed=seed, end=end, batch_size=batch_size)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        click.echo(f"Generated {counts['customers']} customer(s), {counts['couriers']} delivery person(s), "
+                   f"{counts['orders']} order(s) with {counts['order_lines']} order line(s).")
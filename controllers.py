@@ -13,12 +13,22 @@ It handles HTTP requests and responses for:
 Each section is organized into blueprints for better code organization.
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, Response, abort, jsonify, render_template, request, redirect, url_for, flash, stream_with_context
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func, and_, extract
-from models import db, Customer, MenuItem, Order, OrderItem, Ingredient, Pizza, Drink, Dessert, DeliveryPerson, DiscountCode
+from sqlalchemy import and_, or_
+from models import db, Customer, MenuItem, Order, OrderItem, Ingredient, Pizza, Drink, Dessert, DeliveryPerson, CustomerStats, resolve_menu_items
+from catalog import get_catalog
+from dispatch import get_dispatcher
+from pricing import PricingError, PricingService, StaleQuoteError
+from ordering import (API_MAX_BATCH_SIZE, DeliverySlot, SlotReservationError, delivery_times, place_order,
+                      reserve_delivery, submit_orders)
+from exports import EXPORT_FORMATS, export_orders
+from importer import IMPORT_FORMATS, IMPORT_CHUNK_SIZE, import_orders
+from reports import REPORT_PERIODS, earnings, first_report_year, get_report_cache, report_period, top_selling_pizzas
+from metrics import ORDERS_CREATED, QUOTES_PREVIEWED, QUOTE_TOKENS, COURIER_ASSIGNMENT_FAILURES
 from datetime import date, datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
+import io
 
 # ============================================================================
 # BLUEPRINT DEFINITIONS
@@ -32,6 +42,23 @@ orders_bp = Blueprint("orders", __name__)
 ingredients_bp = Blueprint("ingredients", __name__)
 create_order_bp = Blueprint("create_order", __name__)
 staff_reports_bp = Blueprint("staff_reports", __name__)
+api_bp = Blueprint("api", __name__, url_prefix="/api")
+
+# Number of customers shown per page of the customer list
+CUSTOMERS_PER_PAGE = 50
+
+# Customer columns that can be searched on (by prefix)
+CUSTOMER_SEARCH_FIELDS = ("last_name", "phone_number", "postal_code")
+
+# Number of orders shown per page of the order list
+ORDERS_PER_PAGE = 50
+
+# Order statuses that can be filtered on
+ORDER_STATUSES = ("pending", "out_for_delivery", "delivered")
+
+# Allowed values for the menu filters
+MENU_LABELS = ("vegan", "vegetarian", "non-vegetarian")
+MENU_SORT_OPTIONS = ("price_asc", "price_desc", "name")
 
 # ============================================================================
 # HOME ROUTES
@@ -52,16 +79,78 @@ def index():
 @customers_bp.route("/customers")
 def list_customers():
     """
-    Display a list of all customers with their basic information.
+    Display customers with their basic information, one page at a time.
+    
+    Shows customer ID, name, phone, address, birthdate, order count, pizzas
+    ordered and total spent (read from customer_stats).
     
-    Shows customer ID, name, phone, address, birthdate, and order count.
-    Customers are ordered by customer_id.
+    Without a search, customers are ordered by customer_id. With a search,
+    customers whose last name, phone number or postal code starts with the
+    search text are shown, ordered by that field. Both cases page with a
+    cursor on the sort key instead of an offset, and every query is backed by
+    an index on Customer, so the page size and cost stay bounded regardless of
+    the number of customers.
+    
+    Query Parameters:
+        q (str): Search text (prefix), optional
+        field (str): 'last_name', 'phone_number' or 'postal_code', defaults to 'last_name'
+        after (str): Cursor of the last customer on the previous page, optional
     
     Returns:
-        Rendered customers.html template with customer list
-    """
-    customers = Customer.query.order_by(Customer.customer_id).all()
-    return render_template("customers.html", title="Customers", customers=customers)
+        Rendered customers.html template with one page of customers
+    """
+    search = request.args.get("q", "").strip()
+    field = request.args.get("field", "last_name")
+    if field not in CUSTOMER_SEARCH_FIELDS:
+        field = "last_name"
+    if field == "postal_code":
+        search = search.replace(" ", "").upper()
+    after = request.args.get("after", "")
+
+    query = Customer.query.options(selectinload(Customer.stats))
+
+    if search:
+        # Prefix search, ordered by the searched column so the index is used for both.
+        # LIKE with a bound parameter is not range-searched (SQLite scans the whole
+        # index), so the prefix is also given as a range on the bare column; LIKE
+        # keeps the match exact.
+        column = getattr(Customer, field)
+        query = query.filter(
+            column >= search,
+            column < search + "\uffff",
+            column.startswith(search, autoescape=True),
+        )
+        if after:
+            try:
+                after_value, after_id = after.rsplit("_", 1)
+                after_id = int(after_id)
+                query = query.filter(or_(
+                    column > after_value,
+                    and_(column == after_value, Customer.customer_id > after_id),
+                ))
+            except ValueError:
+                pass
+        query = query.order_by(column, Customer.customer_id)
+    else:
+        if after.isdigit():
+            query = query.filter(Customer.customer_id > int(after))
+        query = query.order_by(Customer.customer_id)
+
+    # Fetch one extra customer to know whether there is a next page
+    customers = query.limit(CUSTOMERS_PER_PAGE + 1).all()
+    next_cursor = None
+    if len(customers) > CUSTOMERS_PER_PAGE:
+        customers = customers[:CUSTOMERS_PER_PAGE]
+        last = customers[-1]
+        next_cursor = f"{getattr(last, field)}_{last.customer_id}" if search else str(last.customer_id)
+
+    return render_template("customers.html",
+                           title="Customers",
+                           customers=customers,
+                           search=search,
+                           field=field,
+                           next_cursor=next_cursor,
+                           is_first_page=not after)
 
 @customers_bp.route("/customers/new")
 def new_customer():
@@ -140,7 +229,8 @@ def create_customer():
             gender=gender_val
         )
 
-        # Save to database
+        # Save to database, together with empty order statistics
+        customer.stats = CustomerStats()
         db.session.add(customer)
         db.session.commit()
 
@@ -164,15 +254,63 @@ def list_menu_items():
     
     For pizzas, shows ingredients and dietary labels (vegan/vegetarian).
     For drinks and desserts, shows name and price.
+    Items are served from the in-memory menu catalog (see catalog.py).
+    
+    The menu can be filtered and sorted. Filtering and sorting happen in the
+    database on the stored price and label columns; only the matching ids are
+    fetched and then rendered from the catalog.
+    
+    Query Parameters:
+        min_price (float): Minimum price, optional
+        max_price (float): Maximum price, optional
+        label (str): "vegan", "vegetarian" or "non-vegetarian", only applies to pizzas, optional
+        sort (str): "price_asc", "price_desc" or "name", optional
     
     Returns:
         Rendered menu_items.html template with categorized items
     """
-    pizzas = Pizza.query.all()
-    drinks = Drink.query.all()
-    desserts = Dessert.query.all()
-    print(pizzas[1].label)
-    return render_template("menu_items.html", title="Menu Items", pizzas=pizzas, drinks=drinks, desserts=desserts)
+    catalog = get_catalog()
+
+    # Get filter parameters from query string
+    min_price = request.args.get("min_price", type=float)
+    max_price = request.args.get("max_price", type=float)
+    label = request.args.get("label", "").strip()
+    sort = request.args.get("sort", "").strip()
+    filters = {"min_price": min_price, "max_price": max_price, "label": label, "sort": sort}
+
+    if label not in MENU_LABELS:
+        label = ""
+    if sort not in MENU_SORT_OPTIONS:
+        sort = ""
+
+    # Without filters, serve the catalog as is
+    if min_price is None and max_price is None and not label and not sort:
+        return render_template("menu_items.html", title="Menu Items", filters=filters,
+                               pizzas=catalog.pizzas, drinks=catalog.drinks, desserts=catalog.desserts)
+
+    def matching_items(item_type, model, id_column, extra_filters=()):
+        # Filter and sort in the database, then map the ids to catalog items
+        query = db.session.query(id_column).filter(*extra_filters)
+        if min_price is not None:
+            query = query.filter(model.price >= min_price)
+        if max_price is not None:
+            query = query.filter(model.price <= max_price)
+        if sort == "price_asc":
+            query = query.order_by(model.price.asc(), model.name)
+        elif sort == "price_desc":
+            query = query.order_by(model.price.desc(), model.name)
+        elif sort == "name":
+            query = query.order_by(model.name)
+        else:
+            query = query.order_by(id_column)
+        items = (catalog.get_by_ref(item_type, ref_id) for ref_id, in query.all())
+        return [item for item in items if item is not None]
+
+    pizzas = matching_items("pizza", Pizza, Pizza.pizza_id, [Pizza.label == label] if label else [])
+    drinks = matching_items("drink", Drink, Drink.drink_id)
+    desserts = matching_items("dessert", Dessert, Dessert.dessert_id)
+    return render_template("menu_items.html", title="Menu Items", filters=filters,
+                           pizzas=pizzas, drinks=drinks, desserts=desserts)
 
 @menu_items_bp.route("/new")
 def new_menu_item():
@@ -271,18 +409,161 @@ def list_ingredients():
 @orders_bp.route("/list_orders")
 def list_orders():
     """
-    Display all orders with full details.
+    Display orders with full details, one page at a time.
     
     Shows order ID, customer, items, total, delivery person, address,
     timestamps, and current status. Orders are sorted by order_time descending
     (most recent first).
     
+    Pagination uses a cursor on (order_time, order_id) instead of an offset,
+    so every page costs the same no matter how deep into the history it is.
+    All relations shown on the page are loaded with a fixed number of queries.
+    
+    Query Parameters:
+        status (str): 'pending', 'out_for_delivery' or 'delivered', optional
+        courier (int): delivery_person_id, optional
+        postal_code (str): Delivery postal code, optional
+        date_from (str): First order date (YYYY-MM-DD), optional
+        date_to (str): Last order date (YYYY-MM-DD, inclusive), optional
+        after (str): Cursor of the last order on the previous page, optional
+    
     Returns:
-        Rendered orders.html template with order list
+        Rendered orders.html template with one page of orders
     """
-    orders = Order.query.order_by(Order.order_time.desc()).all()
-    print(f"amount of orders: {len(orders)}")
-    return render_template("orders.html", orders=orders)
+    # Get filter parameters from query string
+    status = request.args.get("status", "").strip()
+    courier = request.args.get("courier", type=int)
+    postal_code = request.args.get("postal_code", "").strip().replace(" ", "").upper()
+    date_from = parse_date_arg("date_from")
+    date_to = parse_date_arg("date_to")
+    cursor = parse_order_cursor(request.args.get("after", ""))
+
+    filters = {
+        "status": status if status in ORDER_STATUSES else "",
+        "courier": courier,
+        "postal_code": postal_code,
+        "date_from": date_from.isoformat() if date_from else "",
+        "date_to": date_to.isoformat() if date_to else "",
+    }
+
+    # Eager load everything orders.html shows, so the page costs a fixed number of queries
+    query = Order.query.options(
+        selectinload(Order.customer),
+        selectinload(Order.delivery_person),
+        selectinload(Order.order_items).selectinload(OrderItem.menu_item),
+    )
+
+    # Apply filters
+    if filters["status"]:
+        query = query.filter(Order.status_filter(filters["status"]))
+    if courier is not None:
+        query = query.filter(Order.delivery_person_id == courier)
+    if postal_code:
+        query = query.filter(Order.postal_code == postal_code)
+    if date_from or date_to:
+        # date_to is inclusive, so the range ends at the start of the next day
+        query = query.filter(Order.placed_between(date_from, date_to + timedelta(days=1) if date_to else None))
+
+    # Continue after the last order of the previous page
+    if cursor:
+        cursor_time, cursor_id = cursor
+        query = query.filter(or_(
+            Order.order_time < cursor_time,
+            and_(Order.order_time == cursor_time, Order.order_id < cursor_id),
+        ))
+
+    # Fetch one extra order to know whether there is a next page
+    orders = (
+        query
+        .order_by(Order.order_time.desc(), Order.order_id.desc())
+        .limit(ORDERS_PER_PAGE + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(orders) > ORDERS_PER_PAGE:
+        orders = orders[:ORDERS_PER_PAGE]
+        next_cursor = format_order_cursor(orders[-1])
+
+    # Load the pizzas, drinks and desserts behind the order lines in one go
+    resolve_menu_items(item.menu_item for order in orders for item in order.order_items)
+
+    delivery_persons = DeliveryPerson.query.order_by(DeliveryPerson.delivery_person_id).all()
+    return render_template("orders.html",
+                           title="Orders",
+                           orders=orders,
+                           filters=filters,
+                           delivery_persons=delivery_persons,
+                           next_cursor=next_cursor,
+                           is_first_page=cursor is None)
+
+@orders_bp.route("/list_orders/export")
+def export_orders_route():
+    """
+    Stream orders with their lines, customer and delivery person as a file.
+    
+    The response is generated while rows are read from the database (see
+    exports.py), so memory stays flat and the download starts immediately.
+    
+    Query Parameters:
+        format (str): 'csv' (default, one row per order line) or 'ndjson' (one order per line)
+        date_from (str): First order date (YYYY-MM-DD), optional
+        date_to (str): Last order date (YYYY-MM-DD, inclusive), optional
+    
+    Returns:
+        Streaming CSV or NDJSON response, or 400 for invalid parameters
+    """
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        abort(400, f"Unsupported export format, use one of: {', '.join(EXPORT_FORMATS)}")
+
+    try:
+        date_from = request.args.get("date_from", "").strip()
+        date_to = request.args.get("date_to", "").strip()
+        date_from = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        # date_to is inclusive, so export everything before the next day
+        date_to = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1) if date_to else None
+    except ValueError:
+        abort(400, "Invalid date, please use YYYY-MM-DD.")
+
+    filename = f"orders.{export_format}"
+    return Response(
+        stream_with_context(export_orders(export_format, date_from, date_to)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@orders_bp.route("/list_orders/import", methods=["POST"])
+def import_orders_route():
+    """
+    Import many orders at once from a CSV or NDJSON file.
+    
+    The file can be uploaded as the form field 'file' or sent as the request
+    body. It is read as a stream and imported in chunks (see importer.py).
+    Invalid orders are skipped and listed in the report.
+    
+    Query Parameters:
+        format (str): 'csv' or 'ndjson', defaults to the extension of the uploaded file
+        chunk_size (int): Orders per transaction, optional
+    
+    Returns:
+        JSON report with the number of imported and failed orders and the errors,
+        or 400 for invalid parameters
+    """
+    upload = request.files.get("file")
+    import_format = request.args.get("format")
+    if import_format is None and upload is not None and upload.filename:
+        import_format = upload.filename.rsplit(".", 1)[-1].lower()
+    if import_format not in IMPORT_FORMATS:
+        abort(400, f"Unsupported import format, use one of: {', '.join(IMPORT_FORMATS)}")
+
+    chunk_size = request.args.get("chunk_size", IMPORT_CHUNK_SIZE, type=int)
+    if chunk_size is None or chunk_size < 1:
+        abort(400, "chunk_size must be a positive number.")
+
+    stream = upload.stream if upload is not None else request.stream
+    lines = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    report = import_orders(lines, import_format, chunk_size)
+    return jsonify(report.to_dict())
 
 # ============================================================================
 # ORDER CREATION ROUTES
@@ -297,6 +578,8 @@ def create_order():
     
     POST Request (action=preview):
         Calculates and displays price with discounts applied, without creating order.
+        The form gets a signed quote token, so the create that follows does not
+        price the order again (see PricingService.redeem()).
         Shows breakdown of:
         - Raw price (before discounts)
         - Applied discounts (birthday, loyalty, discount codes)
@@ -315,8 +598,13 @@ def create_order():
         - Birthday discount (if today is customer's birthday, not used today)
         - 10-pizza loyalty discount (1 free pizza per 10 pizzas ordered)
         - Discount code (if provided and valid)
+        The price is calculated by PricingService (see pricing.py), or taken from
+        the quote token of the preview. If the menu changed, the customer placed
+        another order or the discount code was redeemed since the preview, the
+        order is not created and the new price is shown.
         
-        Updates delivery person availability after order creation.
+        Reserves the delivery person's next slot atomically, so concurrent
+        orders for the same postal code never get the same pickup time.
     
     Form Data:
         customer_id (str): Selected customer ID
@@ -324,6 +612,7 @@ def create_order():
         delivery_address (str): Delivery street address
         use_customer_address (checkbox): Use customer's saved address
         discount_code (str): Optional discount code
+        quote_token (str): Signed quote of the preview (optional)
         item_{item_id} (str): Quantity for each menu item
         action (str): "preview" or "create"
     
@@ -332,15 +621,15 @@ def create_order():
         POST preview: Rendered order_form.html with price calculation
         POST create: Redirect to orders list on success, form on error
     """
-    # Load data needed for the form
-    customers = Customer.query.order_by(Customer.first_name).all()
-    menu_items = MenuItem.query.order_by(MenuItem.item_id).all()
+    # Menu items come from the in-memory catalog
+    catalog = get_catalog()
+    menu_items = catalog.items
 
     if request.method == "GET":
         # Display empty order form
         return render_template("order_form.html",
                                title="New Order",
-                               customers=customers,
+                               customers=Customer.query.order_by(Customer.first_name).all(),
                                menu_items=menu_items)
     
     elif request.method == "POST":
@@ -349,22 +638,6 @@ def create_order():
         discount_code = request.form.get("discount_code") or None
         postal_code = request.form.get("postal_code", "").strip()
         action = request.form.get("action")  # "preview" or "create"
-        request.form.get("use_customer_address")
-
-        # Fetch customer and discount code objects
-        customer = Customer.query.get(customer_id)
-        discount = DiscountCode.query.filter_by(discount_code=discount_code).first() if discount_code else None
-
-        # Determine delivery address and postal code
-        if request.form.get("use_customer_address"):
-            # Get customers saved address and postal code
-            postal_code = customer.postal_code
-            delivery_address=customer.address
-        else:
-            # Use manually entered address and postal code
-            # Normalize postal code and address from input fields
-            postal_code = postal_code.replace(" ", "").upper()
-            delivery_address = request.form.get("delivery_address", "").strip()
 
         # Collect selected order items from form
         order_items = []
@@ -376,82 +649,102 @@ def create_order():
             if amount > 0:
                 order_items.append((item, amount))
 
+        # Price the order: customer, loyalty totals and discount code in a fixed number of queries.
+        # A create with the quote token of its preview reuses the preview's quote instead.
+        pricing = PricingService(catalog)
+        items = [(item.item_id, amount) for item, amount in order_items]
+        quote = None
+        stale_quote = None
+        if customer_id and order_items:
+            try:
+                if action == "create" and request.form.get("quote_token"):
+                    try:
+                        quote = pricing.redeem(request.form["quote_token"], customer_id, items, discount_code)
+                        QUOTE_TOKENS.inc("redeemed" if quote else "ignored")
+                    except StaleQuoteError as e:
+                        QUOTE_TOKENS.inc("stale")
+                        stale_quote = str(e)
+                if quote is None:
+                    quote = pricing.quote(customer_id, items, discount_code)
+            except PricingError:
+                quote = None
+
         # Validate required fields
-        if not customer or not order_items:
+        if quote is None:
             flash("Please select a valid customer and at least one menu item.", "error")
             return redirect(url_for("create_order.create_order"))
+        customer = quote.customer
+
+        # Determine delivery address and postal code
+        if request.form.get("use_customer_address"):
+            # Get customers saved address and postal code
+            postal_code = customer.postal_code
+            delivery_address=customer.address
+        else:
+            # Use manually entered address and postal code
+            # Normalize postal code and address from input fields
+            postal_code = postal_code.replace(" ", "").upper()
+            delivery_address = request.form.get("delivery_address", "").strip()
         
-        # Assign delivery person based on postal code
-        delivery_person_id, pickup_time, expected_delivery_time = assign_delivery_person(postal_code)
+        # Assign delivery person based on postal code. A preview only estimates the
+        # delivery slot, creating the order reserves it atomically, or joins a
+        # trip when trip batching is enabled (see ordering.py)
+        try:
+            if action == "create" and not stale_quote and quote.pizza_count >= 1:
+                slot = reserve_delivery(postal_code)
+            else:
+                slot = assign_delivery_person(postal_code)
+        except SlotReservationError as e:
+            db.session.rollback()
+            flash(f"Error creating order: {str(e)}", "error")
+            return redirect(url_for("create_order.create_order"))
     
         # Check if a delivery person is available for this postal code
-        if delivery_person_id is None:
+        if slot is None:
+            COURIER_ASSIGNMENT_FAILURES.inc()
             postcodes = [dp.postal_code for dp in DeliveryPerson.query.all()]
             flash(f"No delivery person available for your postal code. Try one of these: {', '.join(postcodes)}", "error")
             return redirect(url_for("create_order.create_order"))
-        
-        # Categorize items by type for discount calculations
-        price_list = list_prices_by_type(order_items)
-        
-        # Calculate raw price (before discounts)
-        raw_price = sum(item.price * amount for item, amount in order_items)
 
-        # Calculate all applicable discounts
-        discounts = calculate_discounts(customer, raw_price, price_list["pizzas"], price_list["drinks"], discount)
+        # The previewed price no longer holds: show the new price instead of creating the order
+        if stale_quote:
+            flash(f"{stale_quote} Please check the new price and place the order again.", "error")
+            action = "preview"
 
         # PREVIEW ACTION: Show price breakdown without creating order
         if action == "preview":
-            if len(price_list["pizzas"]) < 1: 
+            QUOTES_PREVIEWED.inc()
+            if quote.pizza_count < 1:
                 flash("choose at least 1 pizza for a valid order")
             # Just show preview inside the same form
             return render_template("order_form.html",
                                title="New Order",
-                               customers=customers,
+                               customers=Customer.query.order_by(Customer.first_name).all(),
                                menu_items=menu_items,
-                               raw_price=raw_price,
-                               total=discounts["total"],
-                               messages=discounts["messages"])
+                               raw_price=quote.raw_price,
+                               total=quote.total,
+                               messages=quote.messages,
+                               quote_token=pricing.sign(quote, discount_code))
 
         # CREATE ACTION: Actually create the order
         elif action == "create":
             
             try:
                 # Validate at least one pizza is in the order
-                if len(price_list["pizzas"]) < 1:
+                if quote.pizza_count < 1:
                     flash(f"Error creating order: choose at least 1 pizza for a valid order", "error")
                     return redirect(url_for("create_order.create_order")) 
                 
-                discount_id = discount.discount_id if discount else None
-
-                # Create order object/record
-                order = Order(
-                    customer_id=customer.customer_id,
-                    delivery_person_id=delivery_person_id,  # Use the unpacked variable
-                    discount_id=discount_id,
-                    delivery_address=delivery_address,
-                    postal_code=postal_code,
-                    pickup_time=pickup_time,  # Use the unpacked variable
-                    total_price = discounts["total"]
-                )
-                db.session.add(order)
-                db.session.flush() # Get order_id for order items
-
-                # Create order items records
-                for item, amount in order_items:
-                    db.session.add(OrderItem(order_id=order.order_id,
-                                         item_id=item.item_id,
-                                         amount=amount))
-            
-                # Update delivery person's availability
-                # They will be busy until they finish this delivery
-                delivery_person = DeliveryPerson.query.get(delivery_person_id)
-                delivery_person.next_available_time = expected_delivery_time
+                # Create the order and its lines in the transaction that reserved the
+                # delivery slot, and update the customer's running totals (see ordering.py)
+                place_order(quote, slot, delivery_address, postal_code)
 
                 db.session.commit()
+                ORDERS_CREATED.inc("form")
 
                 # Show success message with timing information
-                pickup_str = pickup_time.strftime('%H:%M')
-                delivery_str = expected_delivery_time.strftime('%H:%M')
+                pickup_str = slot.pickup_time.strftime('%H:%M')
+                delivery_str = slot.expected_delivery_time.strftime('%H:%M')
                 flash(f"Order created! Pickup at {pickup_str}, delivery by {delivery_str}.", "success")
                 return redirect(url_for("orders.list_orders"))
 
@@ -463,6 +756,50 @@ def create_order():
         # Fallback for unexpected action values
         return redirect(url_for("create_order.create_order"))
 
+# ============================================================================
+# JSON ORDER API ROUTES
+# ============================================================================
+@api_bp.route("/orders", methods=["POST"])
+def api_create_orders():
+    """
+    Create one or many orders from JSON, for POS and delivery aggregator integrations.
+    
+    The orders are priced with the same rules as the order form and placed in
+    one batch that shares the menu, customer, discount code and delivery person
+    lookups (see ordering.py). Every order succeeds or fails on its own.
+    
+    Request Body (JSON), one order or a batch:
+        {"customer_id": 1, "items": [{"item_id": 3, "amount": 2}], ...}
+        {"orders": [{...}, {...}]}
+        Per order: customer_id and items are required; discount_code,
+        delivery_address, postal_code and reference (echoed back) are optional.
+    
+    Returns:
+        JSON with the number of created and failed orders and one result per
+        order (order_id, total, discounts, pickup and delivery times, or the
+        error). Status 201 if all orders were created, 200 otherwise, and 400
+        for a request that is not valid JSON or has too many orders.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and "orders" in data:
+        payloads = data["orders"]
+    elif isinstance(data, dict):
+        payloads = [data]
+    else:
+        return jsonify({"error": "Send a JSON order or {\"orders\": [...]}."}), 400
+    if not isinstance(payloads, list) or not payloads:
+        return jsonify({"error": "orders must be a non-empty list."}), 400
+    if len(payloads) > API_MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {API_MAX_BATCH_SIZE} orders per request."}), 400
+
+    results = submit_orders(payloads)
+    created = sum(1 for result in results if result["status"] == "created")
+    return jsonify({
+        "created": created,
+        "failed": len(results) - created,
+        "orders": results,
+    }), 201 if created == len(results) else 200
+
 # ============================================================================
 # STAFF REPORTS ROUTES
 # ============================================================================
@@ -474,17 +811,28 @@ def staff_reports():
     Provides three main reports:
     1. Top 3 pizzas sold in the last 30 days
     2. Undelivered orders (pending or out for delivery)
-    3. Monthly earnings report with filtering options
+    3. Earnings report for a period with filtering options
+    
+    The top pizzas and the earnings are read from the sales rollup
+    tables (PizzaDailySales, CustomerMonthlySpend), which are updated with
+    every new order, so they do not scan the order history. Their results
+    are cached per filter combination (see reports.py), the footer shows the
+    cache statistics.
     
-    Monthly earnings report can be filtered by:
-    - Month and year
+    Earnings report can be filtered by:
+    - Period: a day, ISO week, month, quarter or custom range of days
     - Customer gender
     - Age range (min and max age)
     - Postal code
     
     Query Parameters:
-        month (int): Month number (1-12), defaults to current month
-        year (int): Year, defaults to current year
+        period (str): day, week, month, quarter or custom, defaults to month
+        date_from (str): A day in the period (YYYY-MM-DD), the first day of a
+            custom period, defaults to today
+        date_to (str): Last day of a custom period (YYYY-MM-DD, inclusive),
+            defaults to date_from
+        month (int): Month number (1-12), for a month period without date_from
+        year (int): Year, for a month period without date_from
         gender (int): Gender filter (0=Female, 1=Male, 2=Other), optional
         min_age (int): Minimum customer age, optional
         max_age (int): Maximum customer age, optional
@@ -493,221 +841,135 @@ def staff_reports():
     Returns:
         Rendered staff_reports.html with analytics data
     """
-    # Calculate date one month ago for top pizzas
-    one_month_ago = datetime.now(ZoneInfo("Europe/Amsterdam")) - timedelta(days=30)
+    now = datetime.now(ZoneInfo("Europe/Amsterdam"))
+
+    # Top 3 pizzas sold in the last 30 days (cached, see reports.py)
+    top_pizzas = top_selling_pizzas((now - timedelta(days=30)).date(), now.date())
     
-    # Query top 3 pizzas sold in the last month
-    top_pizzas = (
-        db.session.query(
-            Pizza.name,
-            func.sum(OrderItem.amount).label('total_sold')
-        )
-        .join(MenuItem, MenuItem.item_ref_id == Pizza.pizza_id)
-        .join(OrderItem, OrderItem.item_id == MenuItem.item_id)
-        .join(Order, Order.order_id == OrderItem.order_id)
-        .filter(MenuItem.item_type == 'pizza')
-        .filter(Order.order_time >= one_month_ago)
-        .group_by(Pizza.pizza_id, Pizza.name)
-        .order_by(func.sum(OrderItem.amount).desc())
-        .limit(3)
+    # Query undelivered orders (pending or out_for_delivery status)
+    # Filtered in SQL on the indexed pickup_time, customer and courier loaded up front
+    undelivered_orders = (
+        Order.query
+        .options(selectinload(Order.customer), selectinload(Order.delivery_person))
+        .filter(Order.undelivered())
+        .order_by(Order.order_time.desc())
         .all()
     )
-    
-    # Query undelivered orders (pending or out_for_delivery status)
-    now = datetime.now(ZoneInfo("Europe/Amsterdam"))
-    all_orders = Order.query.order_by(Order.order_time.desc()).all()
-    
-    undelivered_orders = []
-    for order in all_orders:
-        if order.status in ['pending', 'out_for_delivery']:
-            undelivered_orders.append(order)
 
-    # Monthly earnings report logic
+    # Earnings report logic
     # Get filter parameters from query string
     gender_filter = request.args.get('gender', type=int)
     min_age = request.args.get('min_age', type=int)
     max_age = request.args.get('max_age', type=int)
     postal_code_filter = request.args.get('postal_code', '').strip().replace(" ", "").upper()
     
-    # Get selected month and year (default to current month)
-    now = datetime.now(ZoneInfo("Europe/Amsterdam"))
-    selected_month = request.args.get('month', default=now.month, type=int)
-    selected_year = request.args.get('year', default=now.year, type=int)
-    
-    # Build the base query for monthly earnings
-    query = (
-        db.session.query(
-            Customer.customer_id,
-            Customer.first_name,
-            Customer.last_name,
-            Customer.gender,
-            Customer.birthdate,
-            func.sum(Order.total_price).label('total_spent')
-        )
-        .join(Order, Order.customer_id == Customer.customer_id)
-        .filter(extract('month', Order.order_time) == selected_month)
-        .filter(extract('year', Order.order_time) == selected_year)
-    )
-    
-    # Apply gender filter if provided
-    if gender_filter is not None:
-        query = query.filter(Customer.gender == gender_filter)
-    
-    # Apply age filters if provided
-    if min_age is not None or max_age is not None:
-        today = date.today()
-        if max_age is not None:
-            # Customer must be born after this date to be younger than max_age
-            min_birthdate = date(today.year - max_age - 1, today.month, today.day)
-            query = query.filter(Customer.birthdate > min_birthdate)
-        if min_age is not None:
-            # Customer must be born before this date to be older than min_age
-            max_birthdate = date(today.year - min_age, today.month, today.day)
-            query = query.filter(Customer.birthdate <= max_birthdate)
-    
-    # Apply postal code filter if provided
-    if postal_code_filter:
-        query = query.filter(Order.postal_code == postal_code_filter)
-    
-    # Group by customer and order by total spent (descending)
-    results = (
-        query
-        .group_by(Customer.customer_id, Customer.first_name, Customer.last_name, 
-                  Customer.gender, Customer.birthdate)
-        .order_by(func.sum(Order.total_price).desc())
-        .all()
-    )
-    
-    # Calculate total earnings for the filtered results
-    total_earnings = sum(r.total_spent for r in results) if results else 0
-    
-    # Calculate age for each customer and format data
-    customers_with_age = []
-    for r in results:
-        age = calculate_age(r.birthdate)
-        customers_with_age.append({
-            'customer_id': r.customer_id,
-            'full_name': f"{r.first_name} {r.last_name}",
-            'gender': r.gender,
-            'age': age,
-            'total_spent': float(r.total_spent)
-        })
-    
-    # Get available years for dropdown (from first order to current year)
-    first_order = db.session.query(func.min(Order.order_time)).scalar()
-    available_years = range(first_order.year, now.year + 1) if first_order else [now.year]
+    # Get the selected period (default to the current month)
+    period_kind = request.args.get('period', 'month')
+    date_from = parse_date_arg('date_from')
+    date_to = parse_date_arg('date_to')
+    try:
+        if date_from is None and period_kind == 'month':
+            # A month can also be selected with month and year
+            date_from = date(request.args.get('year', default=now.year, type=int),
+                             request.args.get('month', default=now.month, type=int), 1)
+        period = report_period(period_kind, date_from or now.date(), date_to)
+    except ValueError as e:
+        flash(f"Invalid report period: {e}", "error")
+        period = report_period('month', now.date())
+    
+    # Earnings per customer with the filters applied (cached, see reports.py)
+    report = earnings(period, gender=gender_filter, min_age=min_age, max_age=max_age,
+                      postal_code=postal_code_filter)
+    
+    # First day offered in the date pickers (from the first order)
+    first_year = first_report_year()
+    first_day = date(first_year or now.year, 1, 1)
     
     return render_template("staff_reports.html",
                          title="Staff Reports",
                          top_pizzas=top_pizzas,
                          undelivered_orders=undelivered_orders,
-                         customers=customers_with_age,
-                         total_earnings=total_earnings,
-                         selected_month=selected_month,
-                         selected_year=selected_year,
-                         available_years=available_years,
+                         customers=report['customers'],
+                         total_earnings=report['total_earnings'],
+                         total_before_discount=report['total_before_discount'],
+                         period=period,
+                         periods=REPORT_PERIODS,
+                         first_day=first_day,
                          filters={
+                             'date_from': period.start.isoformat(),
+                             'date_to': (period.end - timedelta(days=1)).isoformat(),
                              'gender': gender_filter,
                              'min_age': min_age,
                              'max_age': max_age,
                              'postal_code': postal_code_filter
-                         })
+                         },
+                         report_cache=get_report_cache().stats())
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
-def calculate_age(birthdate):
+
+def parse_date_arg(name):
     """
-    Calculate age from birthdate.
-    
-    Properly accounts for whether birthday has occurred this year.
+    Read an optional YYYY-MM-DD date from the query string.
     
     Args:
-        birthdate (date): Person's date of birth
+        name (str): Name of the query parameter
     
     Returns:
-        int: Age in years
+        date or None: The parsed date, or None if missing or invalid
     """
-    today = date.today()
-
-    # Calculate initial age as year difference
-    age = today.year - birthdate.year
-
-    # Adjust if birthday hasn't occurred yet this year
-    # Check if current month is before birth month, OR
-    # if months match but current day is before birth day
-    if today.month < birthdate.month or (today.month == birthdate.month and today.day < birthdate.day):
-        age -= 1
-    return age
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        flash(f"Invalid date for {name.replace('_', ' ')}, please use YYYY-MM-DD.", "error")
+        return None
 
-def list_prices_by_type(order_items):
+def format_order_cursor(order):
     """
-    Extract and organize item prices from an order by item type.
+    Build the pagination cursor pointing at an order.
     
-    This helper function processes order items and creates separate lists of
-    individual prices for pizzas and drinks. Each price appears in the list
-    as many times as the item quantity in the order.
+    Args:
+        order (Order): Last order of a page
     
-    Purpose:
-        - Prepares price data for discount calculations
-        - Enables discount logic to target cheapest items (by using min())
-        - Supports check constraints (e.g., "order must contain at least 1 pizza")
+    Returns:
+        str: Cursor in the form "<order_time ISO format>_<order_id>"
+    """
+    return f"{order.order_time.isoformat()}_{order.order_id}"
+
+def parse_order_cursor(cursor):
+    """
+    Parse a pagination cursor built by format_order_cursor().
     
     Args:
-        order_items (list of tuple): List of (MenuItem, quantity) tuples
-            - MenuItem: Menu item object with item_type and price properties
-            - quantity (int): Number of this item in the order
+        cursor (str): Cursor from the query string
     
     Returns:
-        dict: Dictionary containing two keys:
-            - 'pizzas' (list of float): Individual prices for each pizza ordered
-            - 'drinks' (list of float): Individual prices for each drink ordered
-    
-    Implementation Details:
-        - Uses list.extend() to add multiple prices at once
-        - Multiplies price into a list: [price] * amount
-          Example: [10.99] * 2 becomes [10.99, 10.99]
-        - Only processes 'pizza' and 'drink' item types
-        - Desserts are intentionally excluded (not used in discount logic)
-    
-    Why Individual Prices?
-        Storing each item's price separately (rather than totals) allows the
-        discount calculation function to:
-        - Remove the cheapest items when applying free item discounts
-        - Count exact quantities for validation rules
-        - Process multiple free items without complex calculations
-    
-    Note:
-        This function does not modify the original order_items list.
-        It creates new lists containing price values only.
-    """
-    # Initialize empty lists for each item type
-    pizza_prices = []
-    drink_prices = []
-
-    # Process each order item
-    for menu_item, amount in order_items:
-        if menu_item.item_type == "pizza":
-            # Add pizza price to list 'amount' times
-            pizza_prices.extend([menu_item.price] * amount)
-        elif menu_item.item_type == "drink":
-            # Add drink price to list 'amount' times
-            drink_prices.extend([menu_item.price] * amount)
-        # Note: Desserts are not tracked in this function as they're not used in discount calculations
-    # Return organized price data
-    return {"pizzas": pizza_prices, "drinks": drink_prices}
+        tuple or None: (order_time, order_id), or None if missing or invalid
+    """
+    if not cursor:
+        return None
+    try:
+        order_time, order_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(order_time), int(order_id)
+    except ValueError:
+        return None
 
 def assign_delivery_person(postal_code):
     """
-    Find and assign an available delivery person for a given postal code.
+    Estimate the delivery slot of an order for a given postal code, for the price preview.
     
     This function handles the delivery logistics by:
-    1. Finding a delivery person who serves the specified postal code
+    1. Finding the delivery person of the postal code who is available first
     2. Determining when they'll be available for pickup
     3. Calculating expected delivery time (pickup + 30 minutes)
     
     Delivery Logic:
-        - Each postal code is served by a specific delivery person
+        - A postal code can be served by several delivery persons, the courier
+          dispatcher (see dispatch.py) knows who is available first
         - Pickup occurs at max(now, delivery_person.next_available_time)
         - Delivery takes 30 minutes from pickup
         - All times are timezone-aware (Europe/Amsterdam)
@@ -717,262 +979,29 @@ def assign_delivery_person(postal_code):
                           Can contain spaces and mixed case
     
     Returns:
-        tuple: A 3-element tuple containing:
-            - delivery_person_id (int or None): ID of the assigned delivery person
-            - pickup_time (datetime or None): When the order will be picked up
-            - expected_delivery_time (datetime or None): When delivery is expected
-            
-            Returns (None, None, None) if no delivery person serves this postal code
+        DeliverySlot or None: delivery_person_id, pickup_time and
+            expected_delivery_time, or None if no delivery person serves this
+            postal code
     
     Note:
         - Postal codes are normalized (uppercase, no spaces) for matching
         - Times are timezone-aware using Europe/Amsterdam timezone
-        - The function does NOT update the delivery person's availability
-          (that must be done separately when the order is created)
+        - The function does NOT update the delivery person's availability.
+          Creating an order reserves the slot with reserve_delivery_slot()
+          (see ordering.py), which does.
     """
     # Normalize postal code (remove spaces, convert to uppercase)
     postal_code_normalized = postal_code.replace(" ", "").upper()
     
-    # Query delivery person who serves this postal code
-    delivery_person = (
-        DeliveryPerson.query
-        .filter(DeliveryPerson.postal_code == postal_code_normalized)
-        .first()
-    )
+    # Delivery person of this postal code who is available first
+    earliest = get_dispatcher().estimate(postal_code_normalized)
     
     # If no delivery person serves this postal code, return None
-    if not delivery_person:
-        return None, None, None
-    
-    # Calculate pickup and delivery times
-    now = datetime.now(ZoneInfo("Europe/Amsterdam"))
-    
-    # Make next_available_time timezone-aware if it's naive
-    next_available = delivery_person.next_available_time_aware
-    
-    # Now you can compare them
-    pickup_time = max(now, next_available)
-    
-    # Expected delivery time = pickup time + 30 minutes for delivery
-    expected_delivery_time = pickup_time + timedelta(minutes=30)
-    
-    return delivery_person.delivery_person_id, pickup_time, expected_delivery_time
-
-def valid_birthday_discount(customer):
-    """
-    Check if a customer is eligible for their birthday discount today.
-    
-    Birthday Discount Rules:
-        - Customer gets 1 free pizza and 1 free drink on their birthday
-        - Discount can only be used once per birthday
-        - If customer already placed an order today, discount was used
-        - Customer must have a birthdate on file
-    
-    Business Logic:
-        The system assumes every order contains at least one pizza, so if
-        a customer has already ordered today, they've already received their
-        free pizza. We don't track whether they used the free drink, as the
-        discount is considered "used" after the first order of the day.
-    
-    Args:
-        customer (Customer): Customer object to check for birthday eligibility
-    
-    Returns:
-        bool: True if customer is eligible for birthday discount, False otherwise
-            - False if customer has no birthdate on file
-            - False if customer already placed an order today
-            - True if it's their birthday and no orders placed yet today
-    
-    Note:
-        This function checks the order_time against today's date, not the
-        customer's birthdate directly. The birthday check happens elsewhere
-        in the discount calculation flow.
-    """
-    # Check if customer has a birthdate
-    if not customer.birthday:
-        return False
-
-    # Ceck if customer has already placed an order today
-    for ord in customer.orders:
-        # Compare order date to today's date
-        if (
-            ord.order_time.day == date.today().day
-            and ord.order_time.month == date.today().month
-            and ord.order_time.year == date.today().year
-        ):  
-            # Customer has already ordered today - discount used
-            return False
-    
-    # No orders today - customer can use birthday discount
-    return True
-    
-def valid_discount_code(customer, discount):
-    """
-    Validate whether a customer can use a specific discount code.
-    
-    Discount Code Rules:
-        - Each discount code can only be used once per customer
-        - Discount code must exist in the database
-        - Customer cannot reuse a code from a previous order
-    
-    Args:
-        customer (Customer): Customer attempting to use the discount code
-        discount (DiscountCode or None): Discount code object to validate
-                                         Can be None if no code provided
-    
-    Returns:
-        bool or None: Validation result:
-            - None: No discount code provided (discount is None)
-            - False: Invalid discount code (doesn't exist or already used)
-            - True: Valid discount code that customer can use
-    
-    Implementation Notes:
-        - Checks discount against ALL discount codes in database
-        - Iterates through customer's order history to check for prior usage
-        - One-time use is enforced at the customer level, not globally
-    """
-    # Return None if no discount code provided
-    if (discount is None):
+    if earliest is None:
         return None
-
-    # Verify discount code exists in database
-    discounts = DiscountCode.query.all()
-    if (discount not in discounts):
-        return False
-    
-    # Check if customer has already used this discount code in a previous order
-    for ord in customer.orders:
-        if ord.discount_id == discount.discount_id:
-            return False
-    
-    # Discount code is valid and unused by this customer
-    return True
-
-def calculate_discounts(customer, raw_price, pizza_prices, drink_prices, discount):
-    """
-    Calculate all applicable discounts for an order and return the final price.
-    
-    This is the main discount calculation engine that applies multiple discount
-    types in a specific order. It processes birthday discounts, loyalty rewards,
-    and promotional discount codes.
-    
-    Discount Types Applied (in order):
-        1. Birthday Discount: 1 free pizza + 1 free drink (if today is birthday)
-        2. Loyalty Discount: 1 free pizza per 10 pizzas ordered historically
-        3. Discount Code: Percentage off total (e.g., 10% off with WELCOME10)
-    
-    Discount Application Logic:
-        - Free items are applied by removing the cheapest qualifying items
-        - Pizza discounts remove the cheapest pizza(s) from the order
-        - Drink discounts remove the cheapest drink(s) from the order
-        - Percentage discount is applied AFTER free items are removed
-        - Discount codes must be valid and unused by the customer
+    delivery_person_id, next_available_time = earliest
     
-    Args:
-        customer (Customer): Customer placing the order (for discount eligibility)
-        raw_price (float): Total order price before any discounts
-        pizza_prices (list of float): List of individual pizza prices in the order
-                                      Modified in-place as free items are removed
-        drink_prices (list of float): List of individual drink prices in the order
-                                      Modified in-place as free items are removed
-        discount (DiscountCode or None): Optional discount code object to apply
-    
-    Returns:
-        dict: Dictionary containing:
-            - 'total' (float): Final price after all discounts, rounded to 2 decimals
-            - 'messages' (list of str): Human-readable list of applied discounts
-    
-    Calculation Details:
-        Birthday Discount:
-            - Checks if today is customer's birthday
-            - Checks if discount hasn't been used today
-            - Removes price of cheapest pizza and drink from order
-        
-        Loyalty Discount:
-            - Formula: (total_pizzas + new_pizzas) // 10 - (total_pizzas // 10)
-            - Example: Customer has ordered 12 pizzas, ordering 3 more
-              - New total: 15 pizzas → 15 // 10 = 1 free pizza
-              - Previous: 12 // 10 = 1 free pizza already earned
-              - Difference: 1 - 1 = 0 new free pizzas this order
-            - Example 2: Customer has 8 pizzas, ordering 5 more
-              - New total: 13 pizzas → 13 // 10 = 1 free pizza
-              - Previous: 8 // 10 = 0 free pizzas
-              - Difference: 1 - 0 = 1 free pizza this order
-        
-        Discount Code:
-            - Validates code hasn't been used by customer before
-            - Applies percentage reduction to remaining total
-            - Formula: subtotal * (100 - percentage) / 100
-    
-    Side Effects:
-        - Modifies pizza_prices and drink_prices lists by removing discounted items
-        - Does NOT create database records (that happens in the order creation)
+    # Calculate pickup and delivery times (see ordering.py)
+    pickup_time, expected_delivery_time = delivery_times(next_available_time)
     
-    Note:
-        - All free item discounts target the CHEAPEST items first
-        - This benefits the business while still providing value to customers
-        - Final price is rounded to 2 decimal places for currency precision
-    """
-    # Start with the raw price before discounts
-    subtotal = raw_price
-
-    # List to store human-readable discount messages
-    discounts_applied = []
-
-    # Check how many free pizza's and drinks to apply
-    free_pizza = 0
-    free_drink = 0
-
-    # ========== BIRTHDAY DISCOUNT ==========
-    # Check if customer is eligible for birthday discount
-    if valid_birthday_discount(customer):
-        free_pizza += 1 # One free pizza
-        free_drink += 1 # One free drink
-        discounts_applied.append("happy birthday! you get one pizza and drink for free")
-
-    # ========== LOYALTY DISCOUNT (10-PIZZA REWARD) ==========
-    # Calculate how many free pizzas customer earns from this order
-    # Formula explanation:
-    #   - (total + new) // 10: Total free pizzas after this order
-    #   - (total) // 10: Free pizzas already earned before this order
-    #   - Difference: New free pizzas earned with this order
-    ten_discount = (
-        customer.total_pizzas_ordered + len(pizza_prices)) // 10 - (customer.total_pizzas_ordered // 10
-    )
-
-    if ten_discount>0:
-        free_pizza+=ten_discount
-        discounts_applied.append(f"10-pizza discount applied ({ten_discount} free pizza('s))")
-
-    # ========== APPLY FREE PIZZA DISCOUNTS ==========
-    # Remove the cheapest pizzas from the order prices (free pizzas)
-    for i in range(free_pizza):
-        if pizza_prices:                    # Check if there are pizzas to discount
-            cheapest = min(pizza_prices)    # Find cheapest pizza
-            subtotal -= cheapest            # Subtract from total price
-            pizza_prices.remove(cheapest)   # Remove from list 
-
-    # ========== APPLY FREE DRINK DISCOUNTS ==========
-    # Remove the cheapest drinks from the order  price (free drinks)
-    for i in range(free_drink):
-        if drink_prices:                    # Check if there are drinks to discount
-            cheapest = min(drink_prices)    # Find cheapest drink
-            subtotal -= cheapest            # Subtract from total price
-            drink_prices.remove(cheapest)   # Remove from list
-
-    # ========== DISCOUNT CODE ==========
-    # Apply percentage-based discount code if provided and valid
-    if discount:
-        # Validate that customer hasn't used this code before
-        if valid_discount_code(customer, discount) == True:
-            # Calculate multiplier: 10% off means multiply by 0.90
-            discount_multiplier = (100 - discount.percentage) / 100
-            subtotal *= discount_multiplier
-            discounts_applied.append(f"discount code applied, {discount.percentage}% off")
-        else:
-            # Discount code is invalid or already used
-            discounts_applied.append(f"discount code is invalid")
-            
-    # Return final price rounded to 2 decimals and list of applied discounts
-    return {"total": round(subtotal, 2), "messages": discounts_applied}
-    
\ No newline at end of file
+    return DeliverySlot(delivery_person_id, pickup_time, expected_delivery_time)
@@ -0,0 +1,397 @@
+"""
+Test Data Generation for Pizza Ordering System
+
+This module fills the database with test data:
+- seed_menu() creates the fixed menu: ingredients, pizzas, drinks, desserts,
+  menu items and discount codes.
+- generate_data() creates any number of customers, delivery persons, postal
+  codes and orders, spread over a date span.
+- seed_data() resets the database to the small sample data set that is loaded
+  when the application starts.
+
+generate_data() is deterministic: the same seed (and end date) always produces
+the same data. Rows are written with explicit ids using executemany INSERT
+statements in batches, so a database with millions of orders can be built in
+minutes, e.g. for benchmarking.
+
+Uses the Faker library with Dutch locale for realistic names and streets.
+"""
+
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+from faker import Faker
+from sqlalchemy import func, insert
+from models import (
+    DELIVERY_DURATION, db, Customer, CustomerStats, DeliveryPerson, DiscountCode, Dessert, Drink, Ingredient, MenuItem,
+    Order, OrderItem, OrderSales, Pizza, resolve_menu_items, record_customer_orders_bulk, record_order_sales_bulk,
+)
+
+# Postal codes of the sample data (Maastricht), used before any generated ones
+BASE_POSTAL_CODES = ["6221AX", "6211RZ", "6215PD"]
+
+# Number of rows written per INSERT batch (and per transaction)
+GENERATOR_BATCH_SIZE = 10000
+
+# Number of different first names, last names and streets drawn from Faker
+NAME_POOL_SIZE = 500
+
+
+def seed_menu():
+    """
+    Create the fixed menu if it does not exist yet.
+
+    Creates the ingredients with dietary properties, 10 pizzas with various
+    ingredient combinations, drinks, desserts, menu items for all products and
+    discount codes. Parts that already exist are left alone, so this can be
+    run on an existing database.
+
+    The menu is created through the ORM, so the stored pizza prices and labels
+    and the catalog version are kept up to date by the flush hooks in models.py.
+    """
+    # Create igredients
+    if Ingredient.query.count() == 0:
+        db.session.add_all([
+            Ingredient(ingredient_name="Tomato Sauce", price=1.50, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Mozzarella", price=2.00, vegetarian=True, vegan=False),
+            Ingredient(ingredient_name="Vegan Mozzarella", price=3.00, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Pepperoni", price=2.50, vegetarian=False, vegan=False),
+            Ingredient(ingredient_name="Mushrooms", price=1.75, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Bell Peppers", price=1.25, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Onions", price=1.00, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Olives", price=1.50, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Ham", price=2.75, vegetarian=False, vegan=False),
+            Ingredient(ingredient_name="Pineapple", price=1.80, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Basil", price=0.75, vegetarian=True, vegan=True),
+            Ingredient(ingredient_name="Parmesan", price=2.20, vegetarian=True, vegan=False),
+            Ingredient(ingredient_name="Gorgonzola", price=2.30, vegetarian=True, vegan=False),
+        ])
+    db.session.flush()  # so ingredient IDs exist
+
+    # Create pizzas with ingredient combinations
+    if Pizza.query.count() == 0:
+        ingredients = {i.ingredient_name: i for i in Ingredient.query.all()}
+        tomato = ingredients["Tomato Sauce"]
+        mozzarella = ingredients["Mozzarella"]
+        pepperoni = ingredients["Pepperoni"]
+        mushrooms = ingredients["Mushrooms"]
+        peppers = ingredients["Bell Peppers"]
+        onions = ingredients["Onions"]
+        olives = ingredients["Olives"]
+        ham = ingredients["Ham"]
+        pineapple = ingredients["Pineapple"]
+        basil = ingredients["Basil"]
+        parmesan = ingredients["Parmesan"]
+        gorgonzola = ingredients["Gorgonzola"]
+        vegan_mozzarella = ingredients["Vegan Mozzarella"]
+
+        pizzas = [
+            Pizza(name="Margherita", ingredients=[tomato, mozzarella, basil]),
+            Pizza(name="Vegan Margherita", ingredients=[tomato, vegan_mozzarella, basil]),
+            Pizza(name="Pepperoni", ingredients=[tomato, mozzarella, pepperoni]),
+            Pizza(name="Veggie Deluxe", ingredients=[tomato, mozzarella, mushrooms, peppers, onions, olives]),
+            Pizza(name="Vegan Deluxe", ingredients=[tomato, vegan_mozzarella, mushrooms, peppers, onions, olives]),
+            Pizza(name="Hawaiian", ingredients=[tomato, mozzarella, ham, pineapple]),
+            Pizza(name="Four Cheese", ingredients=[tomato, mozzarella, parmesan, gorgonzola]),
+            Pizza(name="Meat Feast", ingredients=[tomato, mozzarella, ham, pepperoni]),
+            Pizza(name="Capricciosa", ingredients=[tomato, mozzarella, ham, mushrooms, olives]),
+            Pizza(name="Funghi", ingredients=[tomato, mozzarella, mushrooms]),
+        ]
+        db.session.add_all(pizzas)
+        db.session.flush()
+
+    # Create drinks
+    if Drink.query.count() == 0:
+        drinks = [
+            Drink(name="Coca Cola", price=2.00),
+            Drink(name="Sprite", price=2.00),
+            Drink(name="Ice Tea", price=2.50),
+            Drink(name="Beer", price=3.50),
+        ]
+        db.session.add_all(drinks)
+        db.session.flush()
+
+    # Create desserts
+    if Dessert.query.count() == 0:
+        desserts = [
+            Dessert(name="Tiramisu", price=4.00),
+            Dessert(name="Panna Cotta", price=3.50),
+            Dessert(name="Brownie", price=2.50)
+        ]
+        db.session.add_all(desserts)
+        db.session.flush()
+
+    # Create menu items for all pizzas, drinks, and desserts that have none yet
+    existing = set(db.session.query(MenuItem.item_type, MenuItem.item_ref_id))
+    for item_type, model in (("pizza", Pizza), ("drink", Drink), ("dessert", Dessert)):
+        ref_column = model.__mapper__.primary_key[0]
+        for (ref_id,) in db.session.query(ref_column).order_by(ref_column):
+            if (item_type, ref_id) not in existing:
+                db.session.add(MenuItem(item_type=item_type, item_ref_id=ref_id))
+
+    # Create discount codes
+    if DiscountCode.query.count() == 0:
+        db.session.add_all([
+            DiscountCode(percentage=10, discount_code="WELCOME10"),
+            DiscountCode(percentage=15, discount_code="STUDENT15"),
+            DiscountCode(percentage=20, discount_code="VIP20"),
+        ])
+
+    db.session.commit()
+
+
+def make_postal_codes(rng, count):
+    """
+    Create distinct Dutch postal codes, starting with the sample data codes.
+
+    Args:
+        rng (random.Random): Random number generator
+        count (int): Number of postal codes
+
+    Returns:
+        list of str: Postal codes like '6221AX'
+    """
+    postal_codes = BASE_POSTAL_CODES[:count]
+    seen = set(postal_codes)
+    while len(postal_codes) < count:
+        code = f"{rng.randint(1000, 9999)}{rng.choice('ABCDEFGHJKLMNPRSTVWXZ')}{rng.choice('ABCDEFGHJKLMNPRSTVWXZ')}"
+        if code not in seen:
+            seen.add(code)
+            postal_codes.append(code)
+    return postal_codes
+
+
+def make_phone_number(customer_id):
+    """
+    Create a mobile phone number that is unique per customer_id.
+
+    Multiplying by a number without common factors with 10^8 maps every id
+    below 10^8 to a different 8 digit number, so no uniqueness check is needed.
+    """
+    return f"06-{(customer_id * 7919 + 31415926) % 10 ** 8:08d}"
+
+
+def next_id(column):
+    """Returns the first free id of a primary key column (generated rows are appended)."""
+    return (db.session.query(func.max(column)).scalar() or 0) + 1
+
+
+def insert_in_batches(table, rows, batch_size):
+    """
+    Insert rows with executemany INSERT statements, committing after every batch.
+
+    Args:
+        table (Table): Table to insert into
+        rows (iterable of dict): Rows to insert
+        batch_size (int): Number of rows per INSERT
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(table), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(insert(table), batch)
+        db.session.commit()
+
+
+def generate_data(customers=10, couriers=3, postal_codes=3, orders=20, days=30, seed=None, end=None,
+                  batch_size=GENERATOR_BATCH_SIZE):
+    """
+    Generate customers, delivery persons and orders.
+
+    The menu must exist (see seed_menu()). Generated rows are appended to the
+    existing data. Every postal code gets at least one delivery person, and
+    customers only live in these postal codes, so every customer can order.
+    Orders are spread evenly over the date span and get 1 to 4 different
+    pizzas, a drink (60%) and a dessert (30%), priced at the current menu
+    prices. Some customers order much more often than others. Generated orders
+    get no discounts.
+
+    Args:
+        customers (int): Number of customers to create
+        couriers (int): Number of delivery persons to create
+        postal_codes (int): Number of postal codes the customers and couriers are spread over
+        orders (int): Number of orders to create
+        days (int): Number of days before the end the orders are spread over
+        seed (int, optional): Seed for the random data; the same seed and end
+            always generate the same data
+        end (datetime, optional): Time of the last possible order, defaults to now
+        batch_size (int): Number of rows per INSERT statement and transaction
+
+    Returns:
+        dict: Number of generated customers, couriers and orders, and the number of order lines
+
+    Raises:
+        ValueError: If the parameters cannot produce valid data
+    """
+    if postal_codes < 1:
+        raise ValueError("At least 1 postal code is needed.")
+    if couriers < postal_codes:
+        raise ValueError("Every postal code needs a delivery person, so couriers must be >= postal_codes.")
+    if orders > 0 and customers < 1:
+        raise ValueError("Orders need customers, so customers must be >= 1.")
+
+    rng = random.Random(seed)
+    fake = Faker("nl_NL")
+    fake.seed_instance(seed)
+    first_names = [fake.first_name() for _ in range(NAME_POOL_SIZE)]
+    last_names = [fake.last_name() for _ in range(NAME_POOL_SIZE)]
+    streets = [fake.street_name() for _ in range(NAME_POOL_SIZE)]
+
+    if end is None:
+        end = datetime.now(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None)
+    codes = make_postal_codes(rng, postal_codes)
+
+    # Delivery persons, the first ones cover one postal code each
+    first_courier_id = next_id(DeliveryPerson.delivery_person_id)
+    courier_rows = [
+        {
+            "delivery_person_id": first_courier_id + i,
+            "delivery_person_first_name": rng.choice(first_names),
+            "delivery_person_last_name": rng.choice(last_names),
+            "postal_code": codes[i] if i < len(codes) else rng.choice(codes),
+            "next_available_time": end,
+        }
+        for i in range(couriers)
+    ]
+    insert_in_batches(DeliveryPerson.__table__, courier_rows, batch_size)
+    couriers_by_postal_code = {}
+    for row in courier_rows:
+        couriers_by_postal_code.setdefault(row["postal_code"], []).append(row["delivery_person_id"])
+
+    # Customers (kept in memory as tuples, the orders need their address)
+    first_customer_id = next_id(Customer.customer_id)
+    customer_list = []
+    today = end.date()
+
+    def customer_rows():
+        for customer_id in range(first_customer_id, first_customer_id + customers):
+            postal_code = rng.choice(codes)
+            address = f"{rng.choice(streets)} {rng.randint(1, 200)}"
+            customer_list.append((customer_id, postal_code, address))
+            yield {
+                "customer_id": customer_id,
+                "first_name": rng.choice(first_names),
+                "last_name": rng.choice(last_names),
+                "birthdate": today - timedelta(days=rng.randint(18 * 365, 60 * 365)),
+                "address": address,
+                "postal_code": postal_code,
+                "phone_number": make_phone_number(customer_id),
+                "gender": rng.choice([0, 1, 2]),
+            }
+
+    insert_in_batches(Customer.__table__, customer_rows(), batch_size)
+    insert_in_batches(CustomerStats.__table__, (
+        {"customer_id": customer_id, "pizzas_ordered": 0, "order_count": 0, "lifetime_spend": 0}
+        for customer_id, _, _ in customer_list
+    ), batch_size)
+
+    # Menu prices, loaded once
+    menu = resolve_menu_items(MenuItem.query.order_by(MenuItem.item_id).all())
+    prices = {m.item_id: Decimal(str(m.price)).quantize(Decimal("0.01")) for m in menu}
+    menu_pizzas = [m.item_id for m in menu if m.item_type == "pizza"]
+    menu_drinks = [m.item_id for m in menu if m.item_type == "drink"]
+    menu_desserts = [m.item_id for m in menu if m.item_type == "dessert"]
+    if orders > 0 and not menu_pizzas:
+        raise ValueError("The menu has no pizzas, run seed_menu() first.")
+
+    # Orders, generated in time order one batch at a time
+    start = end - timedelta(days=days)
+    span = (end - start).total_seconds()
+    order_id = next_id(Order.order_id)
+    totals = {}
+    order_lines = 0
+
+    for batch_start in range(0, orders, batch_size):
+        batch_end = min(batch_start + batch_size, orders)
+        # Each batch covers its share of the date span, so order_ids follow order_time
+        offsets = sorted(
+            rng.uniform(span * batch_start / orders, span * batch_end / orders)
+            for _ in range(batch_end - batch_start)
+        )
+
+        order_rows, item_rows = [], []
+        sales = OrderSales()
+        for offset in offsets:
+            # Squaring the random number makes low customer ids order more often
+            customer_id, postal_code, address = customer_list[int(rng.random() ** 2 * customers)]
+            order_time = (start + timedelta(seconds=offset)).replace(microsecond=0)
+
+            lines = {}
+            for _ in range(rng.randint(1, 4)):
+                lines.setdefault(rng.choice(menu_pizzas), rng.randint(1, 3))
+            pizza_units = dict(lines)  # only pizzas so far
+            pizza_count = sum(pizza_units.values())
+            if menu_drinks and rng.random() < 0.6:
+                lines.setdefault(rng.choice(menu_drinks), rng.randint(1, 2))
+            if menu_desserts and rng.random() < 0.3:
+                lines.setdefault(rng.choice(menu_desserts), 1)
+
+            raw_price = sum((prices[item_id] * amount for item_id, amount in lines.items()), Decimal("0"))
+            pickup_time = order_time + timedelta(minutes=rng.randint(0, 60))
+            order_rows.append({
+                "order_id": order_id,
+                "customer_id": customer_id,
+                "discount_id": None,
+                "delivery_person_id": rng.choice(couriers_by_postal_code[postal_code]),
+                "order_time": order_time,
+                "delivery_address": address,
+                "postal_code": postal_code,
+                "pickup_time": pickup_time,
+                "expected_delivery_time": pickup_time + DELIVERY_DURATION,
+                "raw_price": raw_price,
+                "total_price": raw_price,
+            })
+            for item_id, amount in lines.items():
+                item_rows.append({"order_id": order_id, "item_id": item_id, "amount": amount,
+                                  "unit_price": prices[item_id]})
+
+            customer_totals = totals.get(customer_id)
+            if customer_totals is None:
+                totals[customer_id] = {"pizzas": pizza_count, "orders": 1, "spend": raw_price,
+                                       "last_order_time": order_time}
+            else:
+                customer_totals["pizzas"] += pizza_count
+                customer_totals["orders"] += 1
+                customer_totals["spend"] += raw_price
+                customer_totals["last_order_time"] = order_time  # orders are generated in time order
+            sales.add(customer_id, postal_code, raw_price, raw_price, order_time, pizza_units)
+            order_id += 1
+
+        db.session.execute(insert(Order.__table__), order_rows)
+        db.session.execute(insert(OrderItem.__table__), item_rows)
+        record_order_sales_bulk(sales)
+        db.session.commit()
+        order_lines += len(item_rows)
+
+    # Customer statistics of the generated orders
+    totals = list(totals.items())
+    for chunk_start in range(0, len(totals), batch_size):
+        record_customer_orders_bulk(dict(totals[chunk_start:chunk_start + batch_size]))
+        db.session.commit()
+
+    return {"customers": customers, "couriers": couriers, "orders": orders, "order_lines": order_lines}
+
+
+def seed_data(seed=None):
+    """
+    Reset the database to the sample data set.
+
+    This function:
+    1. Drops all existing tables and recreates them
+    2. Creates the fixed menu and discount codes (see seed_menu())
+    3. Generates 10 customers, 3 delivery persons for 3 postal codes in
+       Maastricht and 20 orders from the past month (see generate_data())
+
+    Args:
+        seed (int, optional): Seed for the random data
+    """
+    db.drop_all()
+    db.create_all()
+
+    seed_menu()
+    generate_data(customers=10, couriers=3, postal_codes=3, orders=20, days=30, seed=seed)
@@ -0,0 +1,206 @@
+"""
+Courier Dispatcher for Pizza Ordering System
+
+A postal code (delivery zone) can have several delivery persons. A new order
+goes to the one that is available first, so during a rush all delivery
+persons of a zone share the orders instead of one of them taking them all.
+
+Each worker keeps a priority queue (heapq) per zone with the zone's delivery
+persons, keyed by next_available_time, so picking the earliest one needs no
+query. The delivery_person table stays the source of truth:
+- The slot is reserved with the conditional UPDATE of reserve_delivery_slot()
+  (see ordering.py), which only succeeds if next_available_time in the
+  database still equals the value in the queue. When it does not (another
+  worker took the slot, an order was rolled back, a delivery person was
+  removed), the zone is reloaded from the database with a row lock and the
+  delivery person picked again.
+- A zone is also reloaded when it was loaded more than COURIER_ZONE_MAX_AGE
+  seconds ago, so delivery persons added or moved elsewhere are picked up.
+
+A picked delivery person is moved to the end of the new slot in the queue
+right away, before the order commits, so simultaneous orders in the same
+worker go to the next delivery person instead of conflicting.
+"""
+
+import heapq
+import time
+from threading import Lock
+from flask import current_app
+from sqlalchemy import select
+from metrics import COURIER_ZONE_LOADS
+from models import db, DeliveryPerson
+
+
+class CourierZone:
+    """
+    Priority queue of the delivery persons serving one postal code.
+
+    Moving a delivery person pushes a new queue entry, the old one is skipped
+    when it reaches the top (lazy deletion).
+
+    Attributes:
+        available (dict): next_available_time (naive) per delivery_person_id,
+                          as last read from or written to the database
+        loaded_at (float): time.monotonic() when the zone was loaded
+    """
+
+    def __init__(self, rows, loaded_at):
+        self.available = dict(rows)
+        self.loaded_at = loaded_at
+        self._queue = [(next_available_time, delivery_person_id)
+                       for delivery_person_id, next_available_time in self.available.items()]
+        heapq.heapify(self._queue)
+
+    def earliest(self):
+        """
+        Get the delivery person that is available first.
+
+        Returns:
+            tuple or None: (delivery_person_id, next_available_time), None if
+                           nobody serves the zone
+        """
+        while self._queue:
+            next_available_time, delivery_person_id = self._queue[0]
+            if self.available.get(delivery_person_id) == next_available_time:
+                return delivery_person_id, next_available_time
+            heapq.heappop(self._queue)
+        return None
+
+    def move(self, delivery_person_id, next_available_time):
+        """Set a new next_available_time for a delivery person."""
+        self.available[delivery_person_id] = next_available_time
+        heapq.heappush(self._queue, (next_available_time, delivery_person_id))
+
+    def __len__(self):
+        return len(self.available)
+
+
+class CourierDispatcher:
+    """
+    Per-worker queues of the delivery persons per postal code.
+
+    Attributes:
+        max_age (float): Seconds after which a zone is reloaded from the database
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._zones = {}
+        self._lock = Lock()
+
+    def load(self, postal_codes, lock=False, reason="new"):
+        """
+        (Re)load zones from the database, in one query.
+
+        Args:
+            postal_codes (iterable of str): Normalized postal codes
+            lock (bool): Lock the delivery person rows (SELECT ... FOR UPDATE)
+                         until the end of the transaction
+            reason (str): Why the zones are loaded, for the metrics
+                          ("new", "expired" or "conflict")
+        """
+        postal_codes = set(postal_codes)
+        if not postal_codes:
+            return
+        query = (
+            select(DeliveryPerson.postal_code, DeliveryPerson.delivery_person_id, DeliveryPerson.next_available_time)
+            .where(DeliveryPerson.postal_code.in_(postal_codes))
+        )
+        if lock:
+            query = query.with_for_update()
+        rows = {postal_code: [] for postal_code in postal_codes}
+        for postal_code, delivery_person_id, next_available_time in db.session.execute(query):
+            rows[postal_code].append((delivery_person_id, next_available_time))
+
+        loaded_at = time.monotonic()
+        with self._lock:
+            for postal_code, couriers in rows.items():
+                self._zones[postal_code] = CourierZone(couriers, loaded_at)
+        COURIER_ZONE_LOADS.inc(reason, amount=len(rows))
+
+    def refresh(self, postal_codes):
+        """
+        Load the zones that were not loaded yet or expired.
+
+        Args:
+            postal_codes (iterable of str): Normalized postal codes
+        """
+        now = time.monotonic()
+        new, expired = set(), set()
+        for postal_code in set(postal_codes):
+            zone = self._zones.get(postal_code)
+            if zone is None:
+                new.add(postal_code)
+            elif now - zone.loaded_at > self.max_age:
+                expired.add(postal_code)
+        self.load(new, reason="new")
+        self.load(expired, reason="expired")
+
+    def serves(self, postal_code):
+        """
+        Check whether any delivery person serves a postal code.
+
+        Args:
+            postal_code (str): Normalized postal code
+
+        Returns:
+            bool: True if the zone has a delivery person
+        """
+        self.refresh([postal_code])
+        return len(self._zones[postal_code]) > 0
+
+    def estimate(self, postal_code):
+        """
+        Get the delivery person that would get an order now, without reserving anything.
+
+        Args:
+            postal_code (str): Normalized postal code
+
+        Returns:
+            tuple or None: (delivery_person_id, next_available_time), None if
+                           nobody serves the postal code
+        """
+        self.refresh([postal_code])
+        with self._lock:
+            return self._zones[postal_code].earliest()
+
+    def pick(self, postal_code, slot_end):
+        """
+        Pick the delivery person that is available first and hold the slot in the queue.
+
+        The slot is not reserved in the database yet, see reserve_delivery_slot().
+
+        Args:
+            postal_code (str): Normalized postal code
+            slot_end (callable): Gets the picked delivery person's
+                                 next_available_time, returns the new one
+
+        Returns:
+            tuple or None: (delivery_person_id, next_available_time before the
+                           slot, next_available_time after the slot), None if
+                           nobody serves the postal code
+        """
+        self.refresh([postal_code])
+        with self._lock:
+            zone = self._zones[postal_code]
+            earliest = zone.earliest()
+            if earliest is None:
+                return None
+            delivery_person_id, next_available_time = earliest
+            new_available_time = slot_end(next_available_time)
+            zone.move(delivery_person_id, new_available_time)
+            return delivery_person_id, next_available_time, new_available_time
+
+    def clear(self):
+        """Forget all zones, they are reloaded on their next use."""
+        with self._lock:
+            self._zones.clear()
+
+
+def get_dispatcher():
+    """Get the courier dispatcher of the current application."""
+    dispatcher = current_app.extensions.get("courier_dispatcher")
+    if dispatcher is None:
+        dispatcher = current_app.extensions.setdefault(
+            "courier_dispatcher", CourierDispatcher(current_app.config.get("COURIER_ZONE_MAX_AGE", 60)))
+    return dispatcher
@@ -0,0 +1,222 @@
+"""
+Order Exports for Pizza Ordering System
+
+This module streams orders with their order lines, customer and delivery
+person as CSV or NDJSON (one JSON object per line). It is used by the export
+route in controllers.py and the export-orders CLI command.
+
+Exports are generators: rows are fetched from the database in batches with a
+server-side cursor (yield_per) and written out as they arrive, so memory use
+stays flat regardless of the number of orders, and the first bytes (the CSV
+header) are sent before the query has even run.
+"""
+
+import csv
+import io
+import json
+from sqlalchemy import and_, func, select
+from models import db, Order, OrderItem, MenuItem, Customer, DeliveryPerson, DiscountCode, Pizza, Drink, Dessert
+
+# Supported export formats and their MIME types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# Number of rows fetched from the database per batch
+EXPORT_BATCH_SIZE = 1000
+
+# Columns of the CSV export (one row per order line)
+CSV_COLUMNS = [
+    "order_id", "order_time", "customer_id", "customer_name", "delivery_person_id",
+    "delivery_person_name", "delivery_address", "postal_code", "pickup_time", "discount_code",
+    "raw_price", "total_price", "item_id", "item_type", "item_name", "amount", "unit_price",
+]
+
+
+def order_export_query(date_from=None, date_to=None):
+    """
+    Build the query returning one row per order line, with order, customer and courier data.
+
+    Args:
+        date_from (datetime, optional): Only orders placed at or after this time
+        date_to (datetime, optional): Only orders placed before this time
+
+    Returns:
+        Select: Query ordered by order_time, order_id and item_id
+    """
+    item_name = func.coalesce(Pizza.name, Drink.name, Dessert.name)
+    statement = (
+        select(
+            Order.order_id,
+            Order.order_time,
+            Order.customer_id,
+            Customer.first_name,
+            Customer.last_name,
+            Order.delivery_person_id,
+            DeliveryPerson.delivery_person_first_name,
+            DeliveryPerson.delivery_person_last_name,
+            Order.delivery_address,
+            Order.postal_code,
+            Order.pickup_time,
+            DiscountCode.discount_code,
+            Order.raw_price,
+            Order.total_price,
+            OrderItem.item_id,
+            MenuItem.item_type,
+            item_name.label("item_name"),
+            OrderItem.amount,
+            OrderItem.unit_price,
+        )
+        .join(Customer, Customer.customer_id == Order.customer_id)
+        .join(DeliveryPerson, DeliveryPerson.delivery_person_id == Order.delivery_person_id)
+        .outerjoin(DiscountCode, DiscountCode.discount_id == Order.discount_id)
+        .join(OrderItem, OrderItem.order_id == Order.order_id)
+        .join(MenuItem, MenuItem.item_id == OrderItem.item_id)
+        .outerjoin(Pizza, and_(MenuItem.item_type == "pizza", Pizza.pizza_id == MenuItem.item_ref_id))
+        .outerjoin(Drink, and_(MenuItem.item_type == "drink", Drink.drink_id == MenuItem.item_ref_id))
+        .outerjoin(Dessert, and_(MenuItem.item_type == "dessert", Dessert.dessert_id == MenuItem.item_ref_id))
+        .where(Order.placed_between(date_from, date_to))
+        .order_by(Order.order_time, Order.order_id, OrderItem.item_id)
+    )
+    return statement
+
+
+def iter_order_rows(date_from=None, date_to=None):
+    """
+    Stream the order line rows from the database in batches.
+
+    Args:
+        date_from (datetime, optional): Only orders placed at or after this time
+        date_to (datetime, optional): Only orders placed before this time
+
+    Yields:
+        Row: One row per order line
+    """
+    statement = order_export_query(date_from, date_to).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    yield from db.session.execute(statement)
+
+
+def format_value(value):
+    """Convert a database value to a string/number that CSV and JSON can hold."""
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if not isinstance(value, (int, float, str)):
+        # Decimal prices
+        return str(value)
+    return value
+
+
+def iter_orders_csv(date_from=None, date_to=None):
+    """
+    Export orders as CSV, one row per order line.
+
+    Args:
+        date_from (datetime, optional): Only orders placed at or after this time
+        date_to (datetime, optional): Only orders placed before this time
+
+    Yields:
+        str: Chunks of CSV text, starting with the header
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+
+    rows_in_buffer = 0
+    buffer.seek(0)
+    buffer.truncate()
+    for row in iter_order_rows(date_from, date_to):
+        writer.writerow([
+            row.order_id, format_value(row.order_time), row.customer_id,
+            f"{row.first_name} {row.last_name}", row.delivery_person_id,
+            f"{row.delivery_person_first_name} {row.delivery_person_last_name}",
+            row.delivery_address, row.postal_code, format_value(row.pickup_time), row.discount_code,
+            format_value(row.raw_price), format_value(row.total_price), row.item_id, row.item_type,
+            row.item_name, row.amount, format_value(row.unit_price),
+        ])
+        rows_in_buffer += 1
+
+        # Send the rows in chunks instead of one tiny write per row
+        if rows_in_buffer >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows_in_buffer = 0
+
+    if rows_in_buffer:
+        yield buffer.getvalue()
+
+
+def iter_orders_ndjson(date_from=None, date_to=None):
+    """
+    Export orders as NDJSON, one JSON object per order with its lines nested.
+
+    Rows arrive ordered by order, so an order is complete (and written) as
+    soon as the first row of the next order arrives.
+
+    Args:
+        date_from (datetime, optional): Only orders placed at or after this time
+        date_to (datetime, optional): Only orders placed before this time
+
+    Yields:
+        str: One JSON document per order, each ending with a newline
+    """
+    current = None
+    for row in iter_order_rows(date_from, date_to):
+        if current is None or current["order_id"] != row.order_id:
+            if current is not None:
+                yield json.dumps(current) + "\n"
+            current = {
+                "order_id": row.order_id,
+                "order_time": format_value(row.order_time),
+                "customer": {
+                    "customer_id": row.customer_id,
+                    "name": f"{row.first_name} {row.last_name}",
+                },
+                "delivery_person": {
+                    "delivery_person_id": row.delivery_person_id,
+                    "name": f"{row.delivery_person_first_name} {row.delivery_person_last_name}",
+                },
+                "delivery_address": row.delivery_address,
+                "postal_code": row.postal_code,
+                "pickup_time": format_value(row.pickup_time),
+                "discount_code": row.discount_code,
+                "raw_price": format_value(row.raw_price),
+                "total_price": format_value(row.total_price),
+                "items": [],
+            }
+        current["items"].append({
+            "item_id": row.item_id,
+            "item_type": row.item_type,
+            "item_name": row.item_name,
+            "amount": row.amount,
+            "unit_price": format_value(row.unit_price),
+        })
+
+    if current is not None:
+        yield json.dumps(current) + "\n"
+
+
+def export_orders(export_format, date_from=None, date_to=None):
+    """
+    Export orders in the requested format.
+
+    Args:
+        export_format (str): "csv" or "ndjson"
+        date_from (datetime, optional): Only orders placed at or after this time
+        date_to (datetime, optional): Only orders placed before this time
+
+    Returns:
+        generator: Chunks of exported text
+
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if export_format == "csv":
+        return iter_orders_csv(date_from, date_to)
+    elif export_format == "ndjson":
+        return iter_orders_ndjson(date_from, date_to)
+    raise ValueError(f"Unsupported export format: {export_format}")
@@ -0,0 +1,522 @@
+"""
+Bulk Order Import for Pizza Ordering System
+
+This module imports large numbers of orders at once, e.g. from the phone
+centre system or from historical data migrations. It is used by the import
+route in controllers.py and the import-orders CLI command.
+
+Supported formats:
+- NDJSON: one order per line, with its lines in an "items" list. The output of
+  the NDJSON export (see exports.py) can be imported as is.
+- CSV: one row per order line. Consecutive rows with the same order_ref (or
+  order_id) form one order. The output of the CSV export can be imported as is.
+
+Fields per order (only customer_id and the items are required):
+    customer_id, order_time, delivery_address, postal_code, delivery_person_id,
+    pickup_time, discount_code, total_price
+Fields per order line:
+    item_id, amount, unit_price (defaults to the current menu price)
+
+Orders are validated against lookup maps that are loaded once (menu, delivery
+persons, discount codes) or once per chunk (customers), so validation itself
+does not query the database per order. Valid orders are inserted per chunk in
+one transaction with executemany-style INSERT statements, and the
+customer_stats rows and the sales rollups are updated in the same
+transaction. Invalid orders are skipped and reported with their line number.
+
+Imported orders are records of orders that already happened: discount codes
+are not checked for earlier use, no discounts are calculated, and the
+availability of delivery persons is not changed.
+"""
+
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo
+from sqlalchemy import false, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from catalog import get_catalog
+from metrics import ORDERS_CREATED
+from models import (
+    DELIVERY_DURATION, db, Customer, DeliveryPerson, DiscountCode, Order, OrderItem, OrderSales,
+    record_customer_orders_bulk, record_order_sales_bulk,
+)
+
+# Supported import formats
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# Number of orders inserted per transaction
+IMPORT_CHUNK_SIZE = 1000
+
+# Maximum number of errors listed in a report (all errors are counted)
+MAX_REPORTED_ERRORS = 1000
+
+
+class OrderImportError(ValueError):
+    """Raised when an order in the import cannot be parsed or is invalid."""
+
+
+class ImportReport:
+    """
+    Result of an import.
+
+    Attributes:
+        imported (int): Number of orders imported
+        failed (int): Number of orders skipped because of an error
+        errors (list of dict): Per-order errors with line, reference and message
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, reference, message):
+        """
+        Record an order that could not be imported.
+
+        Args:
+            line (int): Line number of the order in the input
+            reference: Order reference from the input, if any
+            message (str): What went wrong
+        """
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "reference": reference, "error": message})
+
+    def to_dict(self):
+        """Returns the report as a JSON serializable dict."""
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+
+# ============================================================================
+# PARSING
+# ============================================================================
+
+def parse_datetime(value, field):
+    """
+    Parse an ISO 8601 datetime into a naive Europe/Amsterdam datetime.
+
+    Times with a UTC offset are converted; naive times are assumed to be in
+    Europe/Amsterdam already, like all times stored in the database.
+
+    Args:
+        value (str or None): ISO 8601 datetime
+        field (str): Field name, used in the error message
+
+    Returns:
+        datetime or None: Parsed datetime, or None if the value is empty
+
+    Raises:
+        OrderImportError: If the value is not a valid datetime
+    """
+    if value in (None, ""):
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise OrderImportError(f"invalid {field}: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None)
+    return parsed
+
+
+def parse_int(value, field, required=False):
+    """
+    Parse an integer field.
+
+    Raises:
+        OrderImportError: If the value is missing (when required) or not an integer
+    """
+    if value in (None, ""):
+        if required:
+            raise OrderImportError(f"{field} is required")
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise OrderImportError(f"invalid {field}: {value!r}")
+
+
+def parse_price(value, field):
+    """
+    Parse an optional price field into a Decimal.
+
+    Raises:
+        OrderImportError: If the value is not a valid, positive number
+    """
+    if value in (None, ""):
+        return None
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        raise OrderImportError(f"invalid {field}: {value!r}")
+    if not price.is_finite() or price <= 0:
+        raise OrderImportError(f"{field} must be greater than 0")
+    return price
+
+
+def normalize_order(fields, items):
+    """
+    Convert the raw fields of one order into typed values.
+
+    Args:
+        fields (dict): Raw order fields (strings or JSON values)
+        items (list of dict): Raw order lines with item_id, amount and unit_price
+
+    Returns:
+        dict: Order with typed values and an "items" list of
+            (item_id, amount, unit_price) tuples
+
+    Raises:
+        OrderImportError: If a field cannot be parsed
+    """
+    if not items:
+        raise OrderImportError("order has no items")
+    postal_code = fields.get("postal_code")
+    return {
+        "customer_id": parse_int(fields.get("customer_id"), "customer_id", required=True),
+        "order_time": parse_datetime(fields.get("order_time"), "order_time"),
+        "delivery_address": (fields.get("delivery_address") or "").strip() or None,
+        "postal_code": str(postal_code).replace(" ", "").upper() if postal_code else None,
+        "delivery_person_id": parse_int(fields.get("delivery_person_id"), "delivery_person_id"),
+        "pickup_time": parse_datetime(fields.get("pickup_time"), "pickup_time"),
+        "discount_code": (fields.get("discount_code") or "").strip() or None,
+        "total_price": parse_price(fields.get("total_price"), "total_price"),
+        "items": [
+            (
+                parse_int(item.get("item_id"), "item_id", required=True),
+                parse_int(item.get("amount"), "amount", required=True),
+                parse_price(item.get("unit_price"), "unit_price"),
+            )
+            for item in items
+        ],
+    }
+
+
+def parse_ndjson(lines):
+    """
+    Parse NDJSON input, one order per line.
+
+    Nested customer and delivery_person objects (as written by the NDJSON
+    export) are accepted in place of customer_id and delivery_person_id.
+
+    Args:
+        lines (iterable of str): Input lines
+
+    Yields:
+        tuple: (line number, reference, order dict or OrderImportError)
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        reference = None
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise OrderImportError("line is not a JSON object")
+            reference = data.get("order_ref", data.get("order_id"))
+            fields = dict(data)
+            if isinstance(data.get("customer"), dict):
+                fields.setdefault("customer_id", data["customer"].get("customer_id"))
+            if isinstance(data.get("delivery_person"), dict):
+                fields.setdefault("delivery_person_id", data["delivery_person"].get("delivery_person_id"))
+            items = data.get("items") or []
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                raise OrderImportError("items must be a list of objects")
+            yield line_number, reference, normalize_order(fields, items)
+        except json.JSONDecodeError as e:
+            yield line_number, reference, OrderImportError(f"invalid JSON: {e.msg}")
+        except OrderImportError as e:
+            yield line_number, reference, e
+
+
+def parse_csv(lines):
+    """
+    Parse CSV input, one row per order line.
+
+    Consecutive rows with the same order_ref (or order_id) column are one
+    order; the order fields are taken from its first row.
+
+    Args:
+        lines (iterable of str): Input lines, starting with the header
+
+    Yields:
+        tuple: (line number of the first row, reference, order dict or OrderImportError)
+    """
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        return
+    reference_column = "order_ref" if "order_ref" in reader.fieldnames else "order_id"
+    if reference_column not in reader.fieldnames:
+        yield 1, None, OrderImportError("CSV needs an order_ref or order_id column")
+        return
+
+    group, group_line, group_reference = [], None, None
+    for row in reader:
+        line_number = reader.line_num
+        reference = row.get(reference_column)
+        if group and reference != group_reference:
+            yield group_line, group_reference, _csv_group_to_order(group)
+            group = []
+        if not group:
+            group_line, group_reference = line_number, reference
+        group.append(row)
+    if group:
+        yield group_line, group_reference, _csv_group_to_order(group)
+
+
+def _csv_group_to_order(rows):
+    """Convert the CSV rows of one order into an order dict (or the error)."""
+    try:
+        return normalize_order(rows[0], rows)
+    except OrderImportError as e:
+        return e
+
+
+# ============================================================================
+# IMPORTING
+# ============================================================================
+
+class OrderImporter:
+    """
+    Imports parsed orders in chunks.
+
+    The menu (from the catalog snapshot), delivery persons and discount codes
+    are loaded once when the importer is created.
+    """
+
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.catalog = get_catalog()
+        self.discount_ids = dict(db.session.query(DiscountCode.discount_code, DiscountCode.discount_id))
+        self.courier_ids = set()
+        self.couriers_by_postal_code = {}
+        for courier_id, postal_code in (
+            db.session.query(DeliveryPerson.delivery_person_id, DeliveryPerson.postal_code)
+            .order_by(DeliveryPerson.delivery_person_id)
+        ):
+            self.courier_ids.add(courier_id)
+            self.couriers_by_postal_code.setdefault(postal_code, courier_id)
+        self.report = ImportReport()
+
+    def run(self, parsed_orders):
+        """
+        Import all parsed orders.
+
+        Args:
+            parsed_orders (iterable): Output of parse_csv() or parse_ndjson()
+
+        Returns:
+            ImportReport: Number of imported and failed orders, with errors
+        """
+        chunk = []
+        for parsed in parsed_orders:
+            chunk.append(parsed)
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+        return self.report
+
+    def _import_chunk(self, chunk):
+        """Validate one chunk of orders and insert the valid ones in one transaction."""
+        # Load the customers of this chunk with one query
+        customer_ids = {order["customer_id"] for _, _, order in chunk if isinstance(order, dict)}
+        customers = {
+            row.customer_id: row for row in
+            db.session.query(Customer.customer_id, Customer.address, Customer.postal_code)
+            .filter(Customer.customer_id.in_(customer_ids))
+        } if customer_ids else {}
+
+        valid = []
+        for line, reference, order in chunk:
+            if isinstance(order, OrderImportError):
+                self.report.add_error(line, reference, str(order))
+                continue
+            try:
+                valid.append((line, reference, self._build_rows(order, customers)))
+            except OrderImportError as e:
+                self.report.add_error(line, reference, str(e))
+        if not valid:
+            return
+
+        try:
+            order_rows = [rows[0] for _, _, rows in valid]
+            order_ids = self._insert_orders(order_rows)
+
+            item_rows = []
+            customer_totals = {}
+            sales = OrderSales()
+            for order_id, (_, _, (order_row, items, pizza_units)) in zip(order_ids, valid):
+                for item in items:
+                    item["order_id"] = order_id
+                item_rows.extend(items)
+
+                totals = customer_totals.setdefault(order_row["customer_id"], {
+                    "pizzas": 0, "orders": 0, "spend": Decimal("0"), "last_order_time": order_row["order_time"],
+                })
+                totals["pizzas"] += sum(pizza_units.values())
+                totals["orders"] += 1
+                totals["spend"] += order_row["total_price"]
+                totals["last_order_time"] = max(totals["last_order_time"], order_row["order_time"])
+
+                sales.add(order_row["customer_id"], order_row["postal_code"], order_row["raw_price"],
+                          order_row["total_price"], order_row["order_time"], pizza_units)
+
+            db.session.execute(insert(OrderItem.__table__), item_rows)
+            record_customer_orders_bulk(customer_totals)
+            record_order_sales_bulk(sales)
+            db.session.commit()
+            self.report.imported += len(valid)
+            ORDERS_CREATED.inc("import", amount=len(valid))
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            message = f"chunk could not be saved: {e.__class__.__name__}: {getattr(e, 'orig', e)}"
+            for line, reference, _ in valid:
+                self.report.add_error(line, reference, message)
+
+    def _build_rows(self, order, customers):
+        """
+        Validate one order against the lookup maps and build its rows.
+
+        Returns:
+            tuple: (order row dict, list of order item row dicts, pizzas per item_id)
+
+        Raises:
+            OrderImportError: If the order is invalid
+        """
+        customer = customers.get(order["customer_id"])
+        if customer is None:
+            raise OrderImportError(f"unknown customer_id {order['customer_id']}")
+
+        # Merge repeated items, order_item has one row per (order, item)
+        lines = {}
+        for item_id, amount, unit_price in order["items"]:
+            menu_item = self.catalog.get(item_id)
+            if menu_item is None:
+                raise OrderImportError(f"unknown item_id {item_id}")
+            if amount is None or amount <= 0:
+                raise OrderImportError(f"amount of item {item_id} must be greater than 0")
+            if unit_price is None:
+                unit_price = Decimal(str(menu_item.price))
+            if item_id in lines:
+                lines[item_id]["amount"] += amount
+            else:
+                lines[item_id] = {"item_id": item_id, "amount": amount, "unit_price": unit_price}
+
+        pizza_units = {item_id: line["amount"] for item_id, line in lines.items()
+                       if self.catalog.get(item_id).item_type == "pizza"}
+        if sum(pizza_units.values()) < 1:
+            raise OrderImportError("order must contain at least 1 pizza")
+
+        postal_code = order["postal_code"] or customer.postal_code
+        delivery_address = order["delivery_address"] or customer.address
+        if not delivery_address:
+            raise OrderImportError("delivery_address is required (customer has no address)")
+
+        courier_id = order["delivery_person_id"]
+        if courier_id is None:
+            courier_id = self.couriers_by_postal_code.get(postal_code)
+            if courier_id is None:
+                raise OrderImportError(f"no delivery person for postal code {postal_code}")
+        elif courier_id not in self.courier_ids:
+            raise OrderImportError(f"unknown delivery_person_id {courier_id}")
+
+        discount_id = None
+        if order["discount_code"]:
+            discount_id = self.discount_ids.get(order["discount_code"])
+            if discount_id is None:
+                raise OrderImportError(f"unknown discount_code {order['discount_code']!r}")
+
+        raw_price = sum((line["unit_price"] * line["amount"] for line in lines.values()), Decimal("0"))
+        raw_price = raw_price.quantize(Decimal("0.01"))
+        total_price = order["total_price"] if order["total_price"] is not None else raw_price
+
+        order_time = order["order_time"] or datetime.now(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None)
+        pickup_time = order["pickup_time"] or order_time
+        order_row = {
+            "customer_id": customer.customer_id,
+            "discount_id": discount_id,
+            "delivery_person_id": courier_id,
+            "order_time": order_time,
+            "delivery_address": delivery_address,
+            "postal_code": postal_code,
+            "pickup_time": pickup_time,
+            "expected_delivery_time": pickup_time + DELIVERY_DURATION,
+            "raw_price": raw_price,
+            "total_price": total_price,
+        }
+        return order_row, list(lines.values()), pizza_units
+
+    def _insert_orders(self, order_rows):
+        """
+        Insert the order rows with one executemany statement.
+
+        The ids are allocated up front (see _allocate_order_ids()), so the rows
+        go to the database as one plain executemany INSERT. Returning the
+        generated ids in parameter order instead makes SQLite (and MySQL)
+        insert one row per statement. Only PostgreSQL keeps generating the
+        ids: it batches INSERT ... RETURNING, and explicit ids would not
+        advance the order_id sequence.
+
+        Returns:
+            list of int: order_id of each row, in the same order
+        """
+        table = Order.__table__
+        if db.session.get_bind().dialect.name == "postgresql":
+            statement = insert(table).returning(table.c.order_id, sort_by_parameter_order=True)
+            return [order_id for (order_id,) in db.session.execute(statement, order_rows)]
+
+        order_ids = self._allocate_order_ids(len(order_rows))
+        for order_id, row in zip(order_ids, order_rows):
+            row["order_id"] = order_id
+        db.session.execute(insert(table), order_rows)
+        return order_ids
+
+    def _allocate_order_ids(self, count):
+        """
+        Allocate consecutive order ids after the last order.
+
+        The end of the order table stays locked until the chunk is committed,
+        so concurrent imports and orders cannot take the same ids: MySQL locks
+        it with SELECT ... FOR UPDATE, SQLite locks the whole database for the
+        first write of a transaction, which an UPDATE without rows takes.
+
+        Returns:
+            list of int: The allocated ids
+        """
+        table = Order.__table__
+        statement = select(func.max(table.c.order_id))
+        if db.session.get_bind().dialect.name == "sqlite":
+            db.session.execute(update(table).where(false()).values(order_id=table.c.order_id))
+        else:
+            statement = statement.with_for_update()
+        last_id = db.session.execute(statement).scalar() or 0
+        return list(range(last_id + 1, last_id + 1 + count))
+
+
+def import_orders(lines, import_format, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import orders from CSV or NDJSON input.
+
+    Args:
+        lines (iterable of str): Input lines (a text file object works)
+        import_format (str): "csv" or "ndjson"
+        chunk_size (int): Number of orders inserted per transaction
+
+    Returns:
+        ImportReport: Number of imported and failed orders, with errors
+
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if import_format == "csv":
+        parsed_orders = parse_csv(lines)
+    elif import_format == "ndjson":
+        parsed_orders = parse_ndjson(lines)
+    else:
+        raise ValueError(f"Unsupported import format: {import_format}")
+    return OrderImporter(chunk_size).run(parsed_orders)
@@ -0,0 +1,243 @@
+"""
+SQL Instrumentation for Pizza Ordering System
+
+This module hooks into the SQLAlchemy engine events to show what every
+request costs in the database:
+- Counts the statements and the total database time per request and adds
+  them to the response as X-DB-Query-Count and X-DB-Time-ms headers.
+- Detects statements that run many times with the same shape (the SQL
+  without its parameter values) in one request. That is the typical sign of
+  an N+1 problem, e.g. a lazy load in a loop. They are logged with the call
+  site in the application code (Python file or template) that ran them.
+- Writes statements slower than a threshold to a rotating slow query log,
+  also outside requests (e.g. CLI commands).
+
+Configuration (app.config):
+    SQL_INSTRUMENTATION (bool): Count statements per request, add the headers
+        and detect N+1 statements (default False)
+    SQL_N_PLUS_ONE_THRESHOLD (int): Runs of the same statement shape in one
+        request that are reported as a likely N+1 (default 5)
+    SLOW_QUERY_MS (float): Statements taking at least this long are written
+        to the slow query log, 0 disables the log (default 0)
+    SLOW_QUERY_LOG (str): Path of the slow query log (default slow_queries.log)
+    SLOW_QUERY_LOG_MAX_BYTES (int): Size at which the log is rotated (default 1 MB)
+    SLOW_QUERY_LOG_BACKUPS (int): Number of rotated logs kept (default 5)
+
+For streamed responses (e.g. exports) the headers only include the
+statements that ran before the response started.
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+# Directory of the application code, used to find the call site of a statement
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Name of the slow query logger
+SLOW_QUERY_LOGGER = "pizza.slow_queries"
+
+# Maximum length of the parameters written to the slow query log
+MAX_LOGGED_PARAMETERS = 500
+
+# Parameter lists like (?, ?, ?) or (%(p1)s, %(p2)s), collapsed to one shape
+PARAMETER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """
+    Normalize a SQL statement to its shape.
+
+    Statements are already parameterized, only IN lists of different lengths
+    and whitespace differ between runs of the "same" statement.
+
+    Args:
+        statement (str): SQL statement as sent to the database
+
+    Returns:
+        str: Normalized statement
+    """
+    return PARAMETER_LIST.sub("(?)", WHITESPACE.sub(" ", statement).strip())
+
+
+def find_call_site():
+    """
+    Find the application code that caused the current statement.
+
+    Walks up the stack to the first frame in the project directory that is
+    not part of the installed packages or this module. Templates count as
+    application code, so lazy loads in a template point at the template line.
+
+    Returns:
+        str: 'file:line (function)' relative to the project, or 'unknown'
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(PROJECT_DIR) and filename != __file__
+                and "site-packages" not in filename and f"{os.sep}venv{os.sep}" not in filename):
+            return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "unknown"
+
+
+class RequestQueryStats:
+    """
+    Statements executed during one request.
+
+    Attributes:
+        count (int): Number of statements
+        total_time (float): Total database time in seconds
+        shapes (Counter): Number of runs per statement shape
+        call_sites (dict): Call site of the latest run per statement shape
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+        self.call_sites = {}
+
+    def record(self, statement, elapsed):
+        """Record one executed statement and the time it took."""
+        self.count += 1
+        self.total_time += elapsed
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        self.call_sites[shape] = find_call_site()
+
+    def repeated(self, threshold):
+        """
+        Get the statement shapes that ran at least `threshold` times.
+
+        Returns:
+            list of tuple: (shape, runs, call site), most runs first
+        """
+        return [
+            (shape, runs, self.call_sites[shape])
+            for shape, runs in self.shapes.most_common()
+            if runs >= threshold
+        ]
+
+
+class SqlInstrumentation:
+    """
+    Flask extension that registers the engine events and request hooks.
+
+    Usage:
+        SqlInstrumentation(app)
+    """
+
+    def __init__(self, app=None):
+        self.per_request = False
+        self.n_plus_one_threshold = 5
+        self.slow_query_ms = 0
+        self.slow_query_logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Set up instrumentation for an application, as far as it is enabled in the config.
+
+        Args:
+            app (Flask): Application with an initialized database
+        """
+        app.config.setdefault("SQL_INSTRUMENTATION", False)
+        app.config.setdefault("SQL_N_PLUS_ONE_THRESHOLD", 5)
+        app.config.setdefault("SLOW_QUERY_MS", 0)
+        app.config.setdefault("SLOW_QUERY_LOG", "slow_queries.log")
+        app.config.setdefault("SLOW_QUERY_LOG_MAX_BYTES", 1024 * 1024)
+        app.config.setdefault("SLOW_QUERY_LOG_BACKUPS", 5)
+        app.extensions["sql_instrumentation"] = self
+
+        self.per_request = bool(app.config["SQL_INSTRUMENTATION"])
+        self.n_plus_one_threshold = app.config["SQL_N_PLUS_ONE_THRESHOLD"]
+        self.slow_query_ms = float(app.config["SLOW_QUERY_MS"] or 0)
+        if self.slow_query_ms > 0:
+            self.slow_query_logger = self._make_slow_query_logger(app)
+        if not self.per_request and self.slow_query_logger is None:
+            return
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+        if self.per_request:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+
+    def _make_slow_query_logger(self, app):
+        """Create the slow query logger with a rotating file handler (once per log file)."""
+        logger = logging.getLogger(SLOW_QUERY_LOGGER)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        path = os.path.abspath(app.config["SLOW_QUERY_LOG"])
+        if not any(getattr(handler, "baseFilename", None) == path for handler in logger.handlers):
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=app.config["SLOW_QUERY_LOG_MAX_BYTES"],
+                backupCount=app.config["SLOW_QUERY_LOG_BACKUPS"],
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+        return logger
+
+    # ------------------------------------------------------------------
+    # Engine events
+    # ------------------------------------------------------------------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+
+        stats = g.get("sql_stats") if has_request_context() else None
+        if stats is not None:
+            stats.record(statement, elapsed)
+
+        if self.slow_query_logger is not None and elapsed * 1000 >= self.slow_query_ms:
+            endpoint = request.endpoint if has_request_context() else "-"
+            logged_parameters = repr(parameters)
+            if len(logged_parameters) > MAX_LOGGED_PARAMETERS:
+                logged_parameters = logged_parameters[:MAX_LOGGED_PARAMETERS] + "..."
+            self.slow_query_logger.info(
+                "%.1f ms | %s | %s | %s | %s",
+                elapsed * 1000, endpoint, find_call_site(), WHITESPACE.sub(" ", statement).strip(), logged_parameters,
+            )
+
+    # ------------------------------------------------------------------
+    # Request hooks
+    # ------------------------------------------------------------------
+
+    def _start_request(self):
+        g.sql_stats = RequestQueryStats()
+
+    def _finish_request(self, response):
+        stats = g.get("sql_stats")
+        if stats is None:
+            return response
+
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-ms"] = f"{stats.total_time * 1000:.2f}"
+
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        if repeated:
+            response.headers["X-DB-N-Plus-One"] = str(len(repeated))
+            for shape, runs, call_site in repeated:
+                current_app.logger.warning(
+                    "Possible N+1 in %s %s: %d x %s at %s",
+                    request.method, request.path, runs, shape, call_site,
+                )
+        return response
@@ -0,0 +1,688 @@
+"""
+Prometheus Metrics for Pizza Ordering System
+
+This module collects application metrics and serves them on /metrics in the
+Prometheus text format:
+- pizza_http_request_duration_seconds: latency histogram per blueprint,
+  endpoint, method and status (p99 of create_order etc. via histogram_quantile)
+- pizza_http_requests_in_flight: requests being handled per blueprint and endpoint
+- pizza_db_pool_wait_seconds: time spent waiting for a pooled database connection
+- pizza_orders_created_total, pizza_quotes_previewed_total,
+  pizza_quote_tokens_total, pizza_courier_assignment_failures_total and
+  pizza_courier_slot_conflicts_total: business counters
+- pizza_courier_zone_loads_total: courier dispatcher zones loaded from the
+  database, by reason (new, expired or conflict)
+- pizza_trip_orders_total: orders that opened or joined a trip (trip batching)
+- pizza_menu_catalog_requests_total: menu catalog cache hits and reloads
+- pizza_report_cache_requests_total and pizza_report_cache_invalidations_total:
+  staff report cache hits and misses, and results dropped by new orders
+
+Updates are protected by a lock, so threaded servers count correctly. With
+several worker processes (e.g. gunicorn) set METRICS_DIR to a directory shared
+by the workers: every worker writes its values to its own file in that
+directory (every METRICS_FLUSH_INTERVAL seconds from a background thread and
+when scraped), and /metrics adds up the files of all workers. The files are
+named after the pid and start time of the worker, so a new worker that gets
+the pid of an old one does not overwrite its values. When a worker exits, or
+a scrape finds a worker that stopped, its counters and histograms are added
+to one metrics-retired.json file and its own file is removed; gauges only
+count workers that are still running.
+
+Configuration (app.config):
+    METRICS_ENABLED (bool): Collect request metrics and serve /metrics (default True)
+    METRICS_DIR (str): Directory shared by worker processes, None for a single process
+    METRICS_FLUSH_INTERVAL (float): Seconds between writes of the worker file (default 1)
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import Response, g, has_app_context, request
+from sqlalchemy.pool import QueuePool
+from catalog import get_catalog_cache
+from reports import get_report_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows, see locked_directory()
+    fcntl = None
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for the connection pool wait, which is normally well below a millisecond
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """
+    Base class of the metric types: a name, help text, label names and one value per label combination.
+    """
+
+    metric_type = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name} needs the labels {', '.join(self.labels)}")
+        return tuple(str(value) for value in label_values)
+
+    def describe(self):
+        """Returns the metadata and a copy of the values, as stored in a snapshot."""
+        return {
+            "type": self.metric_type,
+            "help": self.documentation,
+            "labels": list(self.labels),
+            "samples": [[list(key), value] for key, value in self.values.items()],
+        }
+
+
+class CounterMetric(Metric):
+    """A value that only goes up, e.g. the number of created orders."""
+
+    metric_type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        """Add `amount` to the counter with these label values."""
+        key = self._key(label_values)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value, *label_values):
+        """Set the counter to a total that is counted elsewhere (e.g. cache statistics)."""
+        key = self._key(label_values)
+        with self.registry.lock:
+            self.values[key] = value
+
+
+class GaugeMetric(Metric):
+    """A value that goes up and down, e.g. the number of requests in flight."""
+
+    metric_type = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        """Add `amount` to the gauge with these label values."""
+        key = self._key(label_values)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        """Subtract `amount` from the gauge with these label values."""
+        self.inc(*label_values, amount=-amount)
+
+
+class HistogramMetric(Metric):
+    """
+    Counts observations (e.g. request durations) in buckets.
+
+    The value per label combination is a list with the (non-cumulative) count
+    per bucket, the count above the last bucket, and the sum of all observations.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        """Add one observation to the histogram with these label values."""
+        key = self._key(label_values)
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def describe(self):
+        description = super().describe()
+        description["buckets"] = list(self.buckets)
+        description["samples"] = [[key, list(value)] for key, value in description["samples"]]
+        return description
+
+
+class MetricsRegistry:
+    """
+    All metrics of this process.
+
+    Attributes:
+        lock (Lock): Protects the values of all metrics
+        metrics (dict): Metrics by name, in registration order
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(CounterMetric(self, name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(GaugeMetric(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(HistogramMetric(self, name, documentation, labels, buckets))
+
+    def add_collector(self, collector):
+        """Register a function that updates metrics right before a snapshot is taken."""
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        """
+        Get a copy of all metric values.
+
+        Returns:
+            dict: Metric name to type, help, label names, (buckets) and samples
+        """
+        for collector in self.collectors:
+            collector()
+        with self.lock:
+            return {name: metric.describe() for name, metric in self.metrics.items()}
+
+    def reset(self):
+        """Forget all values, e.g. in a worker process forked from a process that already counted."""
+        # Another thread may have held the lock while the process was forked
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric.values = {}
+
+
+# The metrics of this process
+REGISTRY = MetricsRegistry()
+
+REQUEST_DURATION = REGISTRY.histogram(
+    "pizza_http_request_duration_seconds", "Time spent handling HTTP requests.",
+    ("blueprint", "endpoint", "method", "status"),
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "pizza_http_requests_in_flight", "HTTP requests currently being handled.", ("blueprint", "endpoint"),
+)
+DB_POOL_WAIT = REGISTRY.histogram(
+    "pizza_db_pool_wait_seconds", "Time spent waiting for a database connection from the pool.",
+    buckets=POOL_WAIT_BUCKETS,
+)
+ORDERS_CREATED = REGISTRY.counter("pizza_orders_created_total", "Orders created.", ("source",))
+QUOTES_PREVIEWED = REGISTRY.counter("pizza_quotes_previewed_total", "Order price previews shown.")
+QUOTE_TOKENS = REGISTRY.counter(
+    "pizza_quote_tokens_total", "Quote tokens sent with a new order, by result (redeemed, stale or ignored).",
+    ("result",),
+)
+COURIER_ASSIGNMENT_FAILURES = REGISTRY.counter(
+    "pizza_courier_assignment_failures_total", "Orders rejected because no delivery person serves the postal code.",
+)
+COURIER_SLOT_CONFLICTS = REGISTRY.counter(
+    "pizza_courier_slot_conflicts_total", "Delivery slot reservations retried because a concurrent order took the slot.",
+)
+COURIER_ZONE_LOADS = REGISTRY.counter(
+    "pizza_courier_zone_loads_total", "Courier dispatcher zones loaded from the database, by reason (new, expired or conflict).",
+    ("reason",),
+)
+TRIP_ORDERS = REGISTRY.counter(
+    "pizza_trip_orders_total", "Orders placed with trip batching, by result (opened or joined a trip).", ("result",),
+)
+CATALOG_REQUESTS = REGISTRY.counter(
+    "pizza_menu_catalog_requests_total", "Menu catalog lookups by result (hit or reload).", ("result",),
+)
+REPORT_CACHE_REQUESTS = REGISTRY.counter(
+    "pizza_report_cache_requests_total", "Staff report cache lookups by result (hit or miss).", ("result",),
+)
+REPORT_CACHE_INVALIDATIONS = REGISTRY.counter(
+    "pizza_report_cache_invalidations_total", "Cached staff report results dropped because new orders were added.",
+)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long every checkout waits for a connection.
+
+    The wait includes opening a new connection when the pool is not full yet.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def timed_pool_options(database_uri):
+    """
+    Get SQLAlchemy engine options that time pool checkouts.
+
+    In-memory SQLite databases do not use a QueuePool, they keep their default pool.
+
+    Args:
+        database_uri (str): SQLALCHEMY_DATABASE_URI
+
+    Returns:
+        dict: Engine options for SQLALCHEMY_ENGINE_OPTIONS
+    """
+    if database_uri.startswith("sqlite") and (database_uri in ("sqlite://", "sqlite:///") or ":memory:" in database_uri):
+        return {}
+    return {"poolclass": TimedQueuePool}
+
+
+# ============================================================================
+# MULTI-PROCESS AGGREGATION
+# ============================================================================
+
+# File with the added-up counters and histograms of the workers that stopped
+RETIRED_FILE = "metrics-retired.json"
+
+# A worker file that was not written for this long belongs to a stopped worker,
+# even when a new process got the same pid (running workers write it every
+# METRICS_FLUSH_INTERVAL seconds)
+WORKER_FILE_TIMEOUT = 600
+
+# Start time of this process, part of its worker file name because pids are reused
+_process_started = time.time()
+
+# Set when this process moved its values into the retired file, after which
+# it must not write its worker file again
+_process_retired = False
+_worker_file_lock = threading.Lock()
+
+
+def _reset_forked_worker():
+    """Start a forked worker from zero, with a worker file of its own."""
+    global _process_started, _process_retired, _worker_file_lock
+    _process_started = time.time()
+    _process_retired = False
+    _worker_file_lock = threading.Lock()
+    REGISTRY.reset()
+
+
+# Registered once per process, however many apps are created
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_forked_worker)
+
+
+def worker_file_path(directory):
+    """Get the path of the worker file of this process: metrics-<pid>-<start time in ms>.json."""
+    return os.path.join(directory, f"metrics-{os.getpid()}-{int(_process_started * 1000)}.json")
+
+
+def write_json_file(path, data):
+    """Write a JSON file atomically, readers see the old or the new contents."""
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".metrics-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def read_json_file(path):
+    """Read a JSON file, None if it is missing or not (completely) written."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_worker_file(directory, snapshot):
+    """Write the snapshot of this process to its file, atomically (not after it was retired)."""
+    with _worker_file_lock:
+        if not _process_retired:
+            write_json_file(worker_file_path(directory),
+                            {"pid": os.getpid(), "started": _process_started, "metrics": snapshot})
+
+
+@contextmanager
+def locked_directory(directory):
+    """
+    Hold the lock of the metrics directory while files are merged and read.
+
+    Yields:
+        bool: Whether the lock is held. Without fcntl (Windows) nothing is
+              locked and stopped workers' files are not merged.
+    """
+    if fcntl is None:
+        yield False
+        return
+    with open(os.path.join(directory, "metrics.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def process_alive(pid):
+    """Returns whether a process with this pid is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def worker_stopped(path, data, now):
+    """Returns whether the worker that wrote a file stopped: its pid is gone or it stopped writing."""
+    if not process_alive(data["pid"]):
+        return True
+    try:
+        return now - os.path.getmtime(path) > WORKER_FILE_TIMEOUT
+    except OSError:
+        return True
+
+
+def retire_snapshots(directory, stopped):
+    """
+    Add the snapshots of stopped workers to the retired file and remove their worker files.
+
+    Their gauges are dropped, their counters and histograms keep counting in
+    the totals. Must be called with the directory lock held.
+
+    Args:
+        directory (str): METRICS_DIR
+        stopped (list of tuple): (worker file path, snapshot) per stopped worker
+    """
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    retired = read_json_file(retired_path)
+    snapshots = [(snapshot, False) for _, snapshot in stopped]
+    if retired is not None:
+        snapshots.append((retired["metrics"], False))
+    write_json_file(retired_path, {"metrics": merge_snapshots(snapshots)})
+    for path, _ in stopped:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def retire_worker_file(directory, snapshot):
+    """
+    Move the values of this process into the retired file when it exits.
+
+    Only the first call does something, later flushes no longer write the worker file.
+    """
+    global _process_retired
+    with _worker_file_lock:
+        if _process_retired:
+            return
+        with locked_directory(directory) as locked:
+            if not locked:
+                # Keep the worker file, collect_all() counts it as a stopped worker
+                write_json_file(worker_file_path(directory),
+                                {"pid": os.getpid(), "started": _process_started, "metrics": snapshot})
+            else:
+                retire_snapshots(directory, [(worker_file_path(directory), snapshot)])
+        _process_retired = True
+
+
+def merge_snapshots(snapshots):
+    """
+    Add up the snapshots of several processes.
+
+    Args:
+        snapshots (list of tuple): (snapshot, process alive) per process
+
+    Returns:
+        dict: Merged snapshot
+    """
+    merged = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+    for metric in merged.values():
+        metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+    return merged
+
+
+def collect_all(directory):
+    """
+    Get the merged metrics of all worker processes writing to the directory.
+
+    The files of workers that stopped are merged into the retired file on the
+    way, so the directory does not fill up with the files of old workers.
+
+    Args:
+        directory (str): METRICS_DIR
+
+    Returns:
+        dict: Merged snapshot
+    """
+    snapshots = []
+    stopped = []
+    with locked_directory(directory) as locked:
+        now = time.time()
+        for filename in os.listdir(directory):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")) or filename == RETIRED_FILE:
+                continue
+            path = os.path.join(directory, filename)
+            data = read_json_file(path)
+            if data is None:
+                continue
+            if worker_stopped(path, data, now):
+                stopped.append((path, data["metrics"]))
+            else:
+                snapshots.append((data["metrics"], True))
+        if locked and stopped:
+            retire_snapshots(directory, stopped)
+        else:
+            snapshots.extend((snapshot, False) for _, snapshot in stopped)
+        retired = read_json_file(os.path.join(directory, RETIRED_FILE))
+    if retired is not None:
+        snapshots.append((retired["metrics"], False))
+    return merge_snapshots(snapshots)
+
+
+# ============================================================================
+# TEXT FORMAT
+# ============================================================================
+
+def escape_label_value(value):
+    """Escape a label value for the text format (backslash, double quote and newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=None):
+    """Format label names and values as {name="value",...}."""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def format_number(value):
+    """Format a value like Prometheus expects (integers without a decimal point)."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render_text(snapshot):
+    """
+    Render a snapshot in the Prometheus text exposition format.
+
+    Args:
+        snapshot (dict): Output of MetricsRegistry.snapshot() or merge_snapshots()
+
+    Returns:
+        str: Metrics text
+    """
+    lines = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labels = metric["labels"]
+        for key, value in sorted(metric["samples"], key=lambda sample: sample[0]):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{format_labels(labels, key)} {format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, key, ('le', format_number(float(bound))))} {cumulative}")
+            cumulative += value[len(metric["buckets"])]
+            lines.append(f"{name}_bucket{format_labels(labels, key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels, key)} {format_number(value[-1])}")
+            lines.append(f"{name}_count{format_labels(labels, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# FLASK INTEGRATION
+# ============================================================================
+
+class Metrics:
+    """
+    Flask extension that times all requests and serves /metrics.
+
+    Usage:
+        Metrics(app)
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.flush_interval = 1.0
+        self._flusher_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the request hooks and the /metrics route.
+
+        Args:
+            app (Flask): Application to collect metrics for
+        """
+        app.config.setdefault("METRICS_ENABLED", True)
+        app.config.setdefault("METRICS_DIR", None)
+        app.config.setdefault("METRICS_FLUSH_INTERVAL", 1.0)
+        app.extensions["metrics"] = self
+        if not app.config["METRICS_ENABLED"]:
+            return
+
+        self.directory = app.config["METRICS_DIR"]
+        self.flush_interval = app.config["METRICS_FLUSH_INTERVAL"]
+        if self.directory:
+            # Workers forked from a process that already counted start from zero
+            # (see _reset_forked_worker(), registered once at import)
+            os.makedirs(self.directory, exist_ok=True)
+
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def _start_request(self):
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+        labels = (request.blueprint or "app", request.endpoint or "none")
+        g.metrics_labels = labels
+        g.metrics_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc(*labels)
+
+    def _record_status(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _finish_request(self, exc):
+        # Runs after streamed responses are sent, and also after unhandled errors
+        labels = g.pop("metrics_labels", None)
+        if labels is None:
+            return
+        REQUESTS_IN_FLIGHT.dec(*labels)
+        status = g.pop("metrics_status", 500)
+        REQUEST_DURATION.observe(time.perf_counter() - g.pop("metrics_start"), *labels, request.method, status)
+
+    def _start_flusher(self):
+        """Start writing the worker file periodically, once per process (also in forked workers)."""
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.retire)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass  # e.g. the directory was removed, try again next time
+
+    def flush(self):
+        """Write the values of this process to its file in METRICS_DIR."""
+        write_worker_file(self.directory, REGISTRY.snapshot())
+
+    def retire(self):
+        """Move the values of this process into the retired file of METRICS_DIR (at exit)."""
+        # A forked worker inherits the exit handler of its parent
+        if self._flusher_pid == os.getpid():
+            retire_worker_file(self.directory, REGISTRY.snapshot())
+
+    def metrics_view(self):
+        """
+        Serve all metrics in the Prometheus text format.
+
+        Returns:
+            Response: Metrics of this process, or of all workers if METRICS_DIR is set
+        """
+        if self.directory:
+            self.flush()
+            snapshot = collect_all(self.directory)
+        else:
+            snapshot = REGISTRY.snapshot()
+        return Response(render_text(snapshot), content_type=CONTENT_TYPE)
+
+
+def collect_catalog_stats():
+    """Copy the menu catalog cache statistics of the current app into the metrics."""
+    if not has_app_context():
+        return
+    stats = get_catalog_cache().stats()
+    CATALOG_REQUESTS.set_total(stats["hits"], "hit")
+    CATALOG_REQUESTS.set_total(stats["misses"], "reload")
+
+
+REGISTRY.add_collector(collect_catalog_stats)
+
+
+def collect_report_cache_stats():
+    """Copy the staff report cache statistics of the current app into the metrics."""
+    if not has_app_context():
+        return
+    stats = get_report_cache().stats()
+    REPORT_CACHE_REQUESTS.set_total(stats["hits"], "hit")
+    REPORT_CACHE_REQUESTS.set_total(stats["misses"], "miss")
+    REPORT_CACHE_INVALIDATIONS.set_total(stats["invalidations"])
+
+
+REGISTRY.add_collector(collect_report_cache_stats)
@@ -5,21 +5,32 @@ This module defines all database models and relationships for the pizza ordering
 It includes models for menu items (pizzas, drinks, desserts), customers, orders, delivery persons,
 ingredients, and discount codes.
 
-The module uses SQLAlchemy ORM for database operations and includes a seed_data() function
-to populate the database with initial test data.
+The module uses SQLAlchemy ORM for database operations. Test data is created by the
+functions in data_generator.py.
 """
 
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Numeric
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import Numeric, and_, bindparam, case, delete, event, false, func, insert, inspect, not_, or_, select, true, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, object_session
 from datetime import date, timedelta
 from zoneinfo import ZoneInfo
-from faker import Faker
-import random
 
 # Initialize SQLAlchemy instance
 db = SQLAlchemy()
 
+# Time a delivery takes from pickup to the customer's door
+DELIVERY_DURATION = timedelta(minutes=30)
+
+# Pizza pricing: 40% margin and 9% VAT on top of the ingredient cost
+PIZZA_MARKUP = Decimal("1.40")
+PIZZA_VAT = Decimal("1.09")
+
 class MenuItem(db.Model):
     """
     Represents a menu item in the pizza ordering system.
@@ -42,59 +53,77 @@ class MenuItem(db.Model):
     # Relationships
     order_items = db.relationship("OrderItem", back_populates="menu_item")
 
+    @property
+    def product(self):
+        """
+        Get the Pizza, Drink or Dessert this menu item refers to.
+        
+        If the item was passed through resolve_menu_items(), the already loaded
+        object is returned without touching the database. Otherwise the object
+        is fetched from the appropriate table.
+        
+        Returns:
+            Pizza, Drink, Dessert or None: The referenced item
+        """
+        if "_product" not in self.__dict__:
+            model = MENU_ITEM_MODELS.get(self.item_type)
+            self._product = db.session.get(model, self.item_ref_id) if model else None
+        return self._product
+
     @property
     def name(self):
         """
-        Get the name of the menu item by querying the appropriate table.
+        Get the name of the menu item from the referenced pizza, drink or dessert.
         
         Returns:
             str: Name of the pizza, drink, or dessert
         """
-        if self.item_type == "pizza":
-            return Pizza.query.get(self.item_ref_id).name
-        elif self.item_type == "drink":
-            return Drink.query.get(self.item_ref_id).name
-        elif self.item_type == "dessert":
-            return Dessert.query.get(self.item_ref_id).name
-        else:
+        if self.product is None:
             return "[unknown]"
+        return self.product.name
 
     @property
     def price(self):
         """
-        Get the price of the menu item from the appropriate table.
+        Get the price of the menu item from the referenced pizza, drink or dessert.
         
-        For pizzas, price is calculated dynamically based on ingredients.
-        For drinks and desserts, price is stored directly in their tables.
+        Prices are stored on the pizza, drink and dessert tables. Pizza prices
+        are kept up to date from their ingredients (see Pizza).
         
         Returns:
             float: Price of the item in euros
         """
-        if self.item_type == "pizza":
-            return float(Pizza.query.get(self.item_ref_id).price)
-        elif self.item_type == "drink":
-            return float(Drink.query.get(self.item_ref_id).price)
-        elif self.item_type == "dessert":
-            return float(Dessert.query.get(self.item_ref_id).price)
-        else: 
+        if self.product is None:
             return 0
+        return float(self.product.price)
 
 class Pizza(db.Model):
     """
     Represents a pizza with its ingredients.
     
-    Pizza prices are calculated dynamically based on ingredient costs,
-    with a 40% markup and 9% tax applied. Dietary labels (vegan, vegetarian)
-    are determined by the ingredients used.
+    Pizza prices are calculated based on ingredient costs, with a 40% markup
+    and 9% tax applied. Dietary labels (vegan, vegetarian) are determined by
+    the ingredients used. Both are stored on the pizza row and refreshed
+    automatically whenever the pizza's ingredients, or the price or dietary
+    flags of one of those ingredients, change (see refresh_pizza_columns()).
     
     Attributes:
         pizza_id (int): Primary key
         name (str): Name of the pizza (e.g., "Margherita")
+        price (Numeric): Stored price in euros, derived from the ingredients
+        label (str): Stored dietary label, derived from the ingredients
         ingredients (list): Many-to-many relationship with Ingredient
     """
     __tablename__ = "pizza"
     pizza_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
+    price = db.Column(db.Numeric(8, 2), nullable=False, default=0)
+    label = db.Column(db.String(20), nullable=False, default="vegan")
+
+    # Index for filtering the menu on dietary label and price range
+    __table_args__ = (
+        db.Index("ix_pizza_label_price", "label", "price"),
+    )
 
     # Many-to-many relationship with ingredients
     ingredients = db.relationship(
@@ -103,21 +132,25 @@ class Pizza(db.Model):
         back_populates="pizzas"
     )
 
-    @property
-    def price(self):
+    def _current_ingredients(self):
+        """Returns the ingredients of this pizza, leaving out ingredients that are being deleted."""
+        session = object_session(self)
+        deleted = session.deleted if session is not None else ()
+        return [ing for ing in self.ingredients if ing not in deleted]
+
+    def calculate_price(self):
         """
         Calculate pizza price based on ingredient costs.
         
         Formula: (sum of ingredient prices) * 1.4 (markup) * 1.09 (tax)
         
         Returns:
-            float: Calculated price in euros
+            Decimal: Calculated price in euros, rounded to cents
         """
-        ingredient_cost = float(sum(ing.price for ing in self.ingredients))
-        return float(ingredient_cost * 1.4 * 1.09)
+        ingredient_cost = sum((Decimal(ing.price) for ing in self._current_ingredients()), Decimal("0"))
+        return (ingredient_cost * PIZZA_MARKUP * PIZZA_VAT).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
-    @property
-    def label(self):
+    def calculate_label(self):
         """
         Determine dietary label based on ingredients.
         
@@ -126,11 +159,77 @@ class Pizza(db.Model):
                  "vegetarian" if all are vegetarian (but not vegan),
                  "non-vegetarian" otherwise
         """
-        if all (ing.vegan for ing in self.ingredients):
+        ingredients = self._current_ingredients()
+        if all (ing.vegan for ing in ingredients):
             return "vegan"
-        elif all (ing.vegetarian for ing in self.ingredients):
+        elif all (ing.vegetarian for ing in ingredients):
             return "vegetarian"
         return "non-vegetarian"
+
+    @hybrid_property
+    def calculated_price(self):
+        """
+        Price calculated from the ingredients, usable in Python and in SQL.
+        
+        In SQL this is a correlated aggregate subquery over pizza_ingredient
+        and ingredient, so it can be used in filter() and order_by() without
+        loading any pizzas.
+        
+        Returns:
+            Decimal: Calculated price in euros (or a SQL expression)
+        """
+        return self.calculate_price()
+
+    @calculated_price.expression
+    def calculated_price(cls):
+        ingredient_cost = (
+            select(func.coalesce(func.sum(Ingredient.price), 0))
+            .select_from(pizza_ingredient.join(Ingredient))
+            .where(pizza_ingredient.c.pizza_id == cls.pizza_id)
+            .scalar_subquery()
+        )
+        return func.round(ingredient_cost * PIZZA_MARKUP * PIZZA_VAT, 2)
+
+    @hybrid_property
+    def calculated_label(self):
+        """
+        Dietary label calculated from the ingredients, usable in Python and in SQL.
+        
+        In SQL this counts the non-vegan and non-vegetarian ingredients of the
+        pizza with correlated aggregate subqueries.
+        
+        Returns:
+            str: "vegan", "vegetarian" or "non-vegetarian" (or a SQL expression)
+        """
+        return self.calculate_label()
+
+    @calculated_label.expression
+    def calculated_label(cls):
+        def count_ingredients_without(flag):
+            return (
+                select(func.count())
+                .select_from(pizza_ingredient.join(Ingredient))
+                .where(pizza_ingredient.c.pizza_id == cls.pizza_id, flag == false())
+                .scalar_subquery()
+            )
+        return case(
+            (count_ingredients_without(Ingredient.vegan) == 0, "vegan"),
+            (count_ingredients_without(Ingredient.vegetarian) == 0, "vegetarian"),
+            else_="non-vegetarian",
+        )
+
+    def refresh_price_and_label(self):
+        """
+        Recalculate the stored price and label from the current ingredients.
+        
+        Returns:
+            bool: True if the stored price or label changed
+        """
+        price, label = self.calculate_price(), self.calculate_label()
+        changed = self.price is None or Decimal(self.price) != price or self.label != label
+        self.price = price
+        self.label = label
+        return changed
     
     def __repr__(self):
         return f"<Pizza {self.name} {self.price}>"
@@ -229,6 +328,139 @@ pizza_ingredient = db.Table('pizza_ingredient',
     db.Column('ingredient_id', db.Integer, db.ForeignKey('ingredient.ingredient_id'), primary_key=True)
 )
 
+# Ingredient columns that influence the stored price and label of a pizza
+PIZZA_DERIVED_INGREDIENT_COLUMNS = ("price", "vegan", "vegetarian")
+
+@event.listens_for(Session, "before_flush")
+def refresh_pizza_columns(session, flush_context, instances):
+    """
+    Keep the stored price and label of pizzas in sync with their ingredients.
+    
+    Runs before every flush, so the refreshed pizza rows are written in the
+    same transaction as the change that caused them. A pizza is refreshed when:
+    - it is new, or its ingredient list changed
+    - one of its ingredients changed price, vegan or vegetarian flag
+    - one of its ingredients was deleted
+    
+    Args:
+        session (Session): Session that is about to flush
+        flush_context: Unused, part of the event signature
+        instances: Unused, part of the event signature
+    """
+    pizzas = set()
+
+    for obj in session.new:
+        if isinstance(obj, Pizza):
+            pizzas.add(obj)
+        elif isinstance(obj, Ingredient):
+            pizzas.update(obj.pizzas)
+
+    for obj in session.dirty:
+        state = inspect(obj)
+        if isinstance(obj, Pizza):
+            if state.attrs.ingredients.history.has_changes():
+                pizzas.add(obj)
+        elif isinstance(obj, Ingredient):
+            # Pizzas that gained or lost this ingredient
+            history = state.attrs.pizzas.history
+            pizzas.update(history.added)
+            pizzas.update(history.deleted)
+            # All pizzas using it, if a price or dietary flag changed
+            if any(state.attrs[column].history.has_changes() for column in PIZZA_DERIVED_INGREDIENT_COLUMNS):
+                pizzas.update(obj.pizzas)
+
+    for obj in session.deleted:
+        if isinstance(obj, Ingredient):
+            pizzas.update(obj.pizzas)
+
+    for pizza in pizzas:
+        if pizza not in session.deleted:
+            pizza.refresh_price_and_label()
+
+class CatalogVersion(db.Model):
+    """
+    Version number of the menu catalog (single row).
+    
+    The version is bumped whenever a pizza, drink, dessert, menu item or
+    ingredient changes (see bump_catalog_version()). Each worker keeps an
+    in-memory snapshot of the menu (see catalog.py) and only reloads it when
+    this number changes.
+    
+    Attributes:
+        catalog_version_id (int): Primary key, always 1
+        version (int): Current catalog version
+    """
+    __tablename__ = "catalog_version"
+    catalog_version_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f"<CatalogVersion {self.version}>"
+
+# Models whose changes invalidate the menu catalog snapshot
+CATALOG_MODELS = (MenuItem, Pizza, Drink, Dessert, Ingredient)
+
+@event.listens_for(Session, "before_flush")
+def bump_catalog_version(session, flush_context, instances):
+    """
+    Bump the catalog version when the menu changes.
+    
+    Runs before every flush, so the new version is committed in the same
+    transaction as the menu change itself.
+    
+    Args:
+        session (Session): Session that is about to flush
+        flush_context: Unused, part of the event signature
+        instances: Unused, part of the event signature
+    """
+    changed = any(isinstance(obj, CATALOG_MODELS) for obj in session.new) or \
+        any(isinstance(obj, CATALOG_MODELS) for obj in session.deleted) or \
+        any(isinstance(obj, CATALOG_MODELS) and session.is_modified(obj) for obj in session.dirty)
+    if changed:
+        increment_catalog_version(session)
+
+def increment_catalog_version(session):
+    """
+    Increment the catalog version within the session's current transaction.
+    
+    Must be called explicitly after bulk UPDATE statements on menu tables,
+    since those bypass the flush and therefore bump_catalog_version().
+    
+    Args:
+        session (Session): Session whose transaction should bump the version
+    """
+    catalog_version = session.get(CatalogVersion, 1)
+    if catalog_version is None:
+        session.add(CatalogVersion(catalog_version_id=1, version=1))
+    else:
+        # Increment in SQL, so concurrent bumps are not lost
+        catalog_version.version = CatalogVersion.version + 1
+
+def recompute_pizza_prices():
+    """
+    Recalculate the stored price and label of every pizza.
+    
+    The stored columns are normally maintained by refresh_pizza_columns(). This
+    function repairs drift caused by changes made outside the ORM, e.g. by
+    editing the ingredient table directly in MySQL. It runs as a single UPDATE
+    statement using the SQL expressions Pizza.calculated_price and
+    Pizza.calculated_label, touching only the pizzas that drifted.
+    
+    Returns:
+        int: Number of pizzas whose stored price or label was corrected
+    """
+    statement = (
+        update(Pizza)
+        .where(or_(Pizza.price != Pizza.calculated_price, Pizza.label != Pizza.calculated_label))
+        .values(price=Pizza.calculated_price, label=Pizza.calculated_label)
+        .execution_options(synchronize_session=False)
+    )
+    changed = db.session.execute(statement).rowcount
+    if changed:
+        increment_catalog_version(db.session)
+    db.session.commit()
+    return changed
+
 class Customer(db.Model):
     """
     Represents a customer in the pizza ordering system.
@@ -247,6 +479,8 @@ class Customer(db.Model):
         gender (int): Gender identifier (0=Female, 1=Male, 2=Other)
         orders (list): Relationship to customer's orders
     
+        stats (CustomerStats): Running totals of the customer's orders
+    
     Properties:
         full_name: Concatenated first and last name
         birthday: Boolean indicating if today is customer's birthday
@@ -262,8 +496,16 @@ class Customer(db.Model):
     phone_number = db.Column(db.String(32), nullable=False, unique=True)
     gender = db.Column(db.Integer)  # 0, 1, 2 for different gender options
 
+    # Indexes for the prefix search and keyset pagination of the customer list
+    # (phone_number is already indexed by its unique constraint)
+    __table_args__ = (
+        db.Index("ix_customer_last_name_customer_id", "last_name", "customer_id"),
+        db.Index("ix_customer_postal_code_customer_id", "postal_code", "customer_id"),
+    )
+
     # Relationships - cascade delete means all orders are deleted when customer is deleted
     orders = db.relationship("Order", back_populates="customer", cascade="all, delete-orphan")
+    stats = db.relationship("CustomerStats", back_populates="customer", uselist=False, cascade="all, delete-orphan")
 
     @property
     def full_name(self):
@@ -288,21 +530,107 @@ class Customer(db.Model):
         Calculate total number of pizzas ordered by this customer.
         
         This is used for the "10 pizzas = 1 free" loyalty discount.
+        Reads the customer_stats row instead of walking the order history.
         
         Returns:
             int: Total count of pizzas across all orders
         """
-        pizza_count = 0
-        for order in self.orders:
-            for item in order.order_items:
-                # Ensure the item is a pizza
-                if isinstance(item.menu_item, Pizza):
-                    pizza_count += item.amount
-        return pizza_count
+        if self.stats is None:
+            return 0
+        return self.stats.pizzas_ordered
     
     def __repr__(self):
         return f"<Customer {self.customer_id} {self.full_name}>"
 
+class CustomerStats(db.Model):
+    """
+    Running totals of a customer's orders (one row per customer).
+    
+    The row is updated in the same transaction that creates an order (see
+    record_customer_order()), so loyalty rules and customer pages read a single
+    row instead of the full order history. rebuild_customer_stats() recalculates
+    all rows from the orders.
+    
+    Attributes:
+        customer_id (int): Primary key, foreign key to Customer
+        pizzas_ordered (int): Total number of pizzas ordered
+        order_count (int): Number of orders placed
+        lifetime_spend (Numeric): Sum of the total price of all orders
+        last_order_time (datetime): When the last order was placed
+        customer (Customer): Relationship to customer
+    """
+    __tablename__ = "customer_stats"
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.customer_id"), primary_key=True)
+    pizzas_ordered = db.Column(db.Integer, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    lifetime_spend = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    last_order_time = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    customer = db.relationship("Customer", back_populates="stats")
+
+    def __repr__(self):
+        return f"<CustomerStats {self.customer_id} orders={self.order_count} pizzas={self.pizzas_ordered}>"
+
+class PizzaDailySales(db.Model):
+    """
+    Rollup of the pizzas sold per day (one row per day and pizza menu item).
+
+    Updated in the transaction that creates an order (see record_order_sales()),
+    so the top pizzas report sums a few rows per day instead of joining all
+    order lines. rebuild_sales_rollups() recalculates all rows from the orders.
+
+    Attributes:
+        sales_date (date): Day the orders were placed (Europe/Amsterdam)
+        item_id (int): Foreign key to the pizza's MenuItem
+        units (int): Number of pizzas sold that day
+        menu_item (MenuItem): Relationship to menu item
+    """
+    __tablename__ = "pizza_daily_sales"
+    # The primary key starts with sales_date, so it backs the date range of the report
+    sales_date = db.Column(db.Date, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey("menu_item.item_id"), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+
+    # Relationships
+    menu_item = db.relationship("MenuItem")
+
+    def __repr__(self):
+        return f"<PizzaDailySales {self.sales_date} item={self.item_id} units={self.units}>"
+
+class CustomerMonthlySpend(db.Model):
+    """
+    Rollup of the spend per customer, month and delivery postal code.
+
+    Updated in the transaction that creates an order (see record_order_sales()),
+    so the monthly earnings report reads one row per customer instead of all
+    their orders of the month. rebuild_sales_rollups() recalculates all rows
+    from the orders.
+
+    Attributes:
+        month (date): First day of the month the orders were placed (Europe/Amsterdam)
+        customer_id (int): Foreign key to Customer
+        postal_code (str): Delivery postal code of the orders
+        order_count (int): Number of orders
+        raw_spend (Numeric): Sum of the price before discounts
+        total_spend (Numeric): Sum of the total price
+        customer (Customer): Relationship to customer
+    """
+    __tablename__ = "customer_monthly_spend"
+    # The primary key starts with month, so it backs the month filter of the report
+    month = db.Column(db.Date, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.customer_id"), primary_key=True)
+    postal_code = db.Column(db.String(6), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    raw_spend = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    total_spend = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+
+    # Relationships
+    customer = db.relationship("Customer")
+
+    def __repr__(self):
+        return f"<CustomerMonthlySpend {self.month:%Y-%m} customer={self.customer_id} spend={self.total_spend}>"
+
 class DiscountCode(db.Model):
     """
     Represents a discount code that can be applied to orders.
@@ -415,6 +743,65 @@ class DeliveryPerson(db.Model):
     def __repr__(self):
         return f"<DeliveryPerson {self.delivery_person_id} {self.full_name}>"
 
+class Trip(db.Model):
+    """
+    Represents one delivery run: orders for one postal code picked up and delivered together.
+    
+    Trips are only created when trip batching is enabled (see ordering.py).
+    The first order opens the trip and reserves a delivery slot for it. Orders
+    for the same postal code placed within the batching window join the trip,
+    up to its capacity, as long as it has not been picked up yet. All orders
+    of a trip share its delivery person, pickup time and expected delivery time.
+    
+    Attributes:
+        trip_id (int): Primary key
+        delivery_person_id (int): Foreign key to DeliveryPerson
+        postal_code (str): Postal code all orders of the trip are delivered to
+        opened_at (datetime): When the first order of the trip was placed
+        pickup_time (datetime): When the delivery person picks up the orders
+        expected_delivery_time (datetime): When the orders are expected to be delivered
+        order_count (int): Number of orders on the trip
+        delivery_person (DeliveryPerson): Relationship to delivery person
+        orders (list): Relationship to the orders of the trip
+    """
+    __tablename__ = "trip"
+    trip_id = db.Column(db.Integer, primary_key=True)
+    delivery_person_id = db.Column(db.Integer, db.ForeignKey("delivery_person.delivery_person_id"), nullable=False)
+    postal_code = db.Column(db.String(6), nullable=False)
+    opened_at = db.Column(db.DateTime, nullable=False)
+    pickup_time = db.Column(db.DateTime, nullable=False)
+    expected_delivery_time = db.Column(db.DateTime, nullable=False)
+    order_count = db.Column(db.Integer, default=1, nullable=False)
+
+    # (postal_code, pickup_time) backs the lookup of open trips for a new order
+    __table_args__ = (
+        db.CheckConstraint("order_count >= 1", name="check_trip_order_count_positive"),
+        db.Index("ix_trip_postal_code_pickup_time", "postal_code", "pickup_time"),
+    )
+
+    # Relationships
+    delivery_person = db.relationship("DeliveryPerson")
+    orders = db.relationship("Order", back_populates="trip")
+
+    def __repr__(self):
+        return f"<Trip {self.trip_id} delivery_person={self.delivery_person_id} orders={self.order_count}>"
+
+def as_datetime(value):
+    """
+    Convert a date or datetime to the naive Europe/Amsterdam datetime stored in the database.
+
+    A date becomes midnight at the start of that day.
+    """
+    if not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    if value.tzinfo is not None:
+        return value.astimezone(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None)
+    return value
+
+def default_expected_delivery_time(context):
+    """Column default of Order.expected_delivery_time: pickup time + 30 minutes."""
+    return context.get_current_parameters()["pickup_time"] + DELIVERY_DURATION
+
 class Order(db.Model):
     """
     Represents a customer order.
@@ -431,16 +818,21 @@ class Order(db.Model):
         delivery_address (str): Delivery street address
         postal_code (str): Delivery postal code
         pickup_time (datetime): When delivery person picks up order
+        expected_delivery_time (datetime): When the order is expected to be
+            delivered, pickup time + 30 minutes (also for orders on a trip,
+            which share the trip's pickup and delivery time)
+        trip_id (int): Optional foreign key to Trip, set when the order was
+            batched with other orders for the same postal code
+        raw_price (Numeric): Price before discounts, stored when the order is created
         total_price (Numeric): Final price after discounts (must be positive)
         customer (Customer): Relationship to customer
         discount_code (DiscountCode): Relationship to discount code (if used)
         delivery_person (DeliveryPerson): Relationship to delivery person
+        trip (Trip): Relationship to the trip (if batched)
         order_items (list): Relationship to ordered items
     
     Properties:
-        expected_delivery_time: Pickup time + 30 minutes
         item_count: Total number of items in order
-        raw_price: Price before discounts
         status: Current order status (pending/out_for_delivery/delivered)
         status_display: Human-readable status with icon
     
@@ -456,29 +848,36 @@ class Order(db.Model):
     delivery_address = db.Column(db.String(255), nullable=False)
     postal_code = db.Column(db.String(6), nullable=False)
     pickup_time = db.Column(db.DateTime, nullable=False) 
+    expected_delivery_time = db.Column(db.DateTime, default=default_expected_delivery_time, nullable=False)
+    trip_id = db.Column(db.Integer, db.ForeignKey("trip.trip_id"), nullable=True)
+    raw_price = db.Column(db.Numeric(8,2), nullable=False)
     total_price = db.Column(db.Numeric(8,2), nullable=False)
     
     # Database constraint: total price must be positive
+    # Indexes:
+    # - pickup_time backs the status filters (see status_filter())
+    # - (order_time, order_id) backs the keyset pagination of the order list
+    # - postal code and courier, combined with order_time, back the order list filters
+    # - (customer_id, order_time) backs the per-customer checks of the pricing service
+    # - (order_time, customer_id, raw_price, total_price) covers the spend per
+    #   customer over a range of order times (see placed_between() and reports.py)
     __table_args__ = (
         db.CheckConstraint('total_price > 0', name='check_order_total_price_positive'),
+        db.Index("ix_order_pickup_time", "pickup_time"),
+        db.Index("ix_order_order_time_order_id", "order_time", "order_id"),
+        db.Index("ix_order_postal_code_order_time", "postal_code", "order_time"),
+        db.Index("ix_order_delivery_person_order_time", "delivery_person_id", "order_time"),
+        db.Index("ix_order_customer_order_time", "customer_id", "order_time"),
+        db.Index("ix_order_order_time_customer_spend", "order_time", "customer_id", "raw_price", "total_price"),
     )
 
     # Relationships
     customer = db.relationship("Customer", back_populates="orders")
     discount_code = db.relationship("DiscountCode", back_populates="orders")
     delivery_person = db.relationship("DeliveryPerson", back_populates="orders")
+    trip = db.relationship("Trip", back_populates="orders")
     order_items = db.relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
-    @property
-    def expected_delivery_time(self):
-        """
-        Calculate expected delivery time (pickup + 30 minutes).
-        
-        Returns:
-            datetime: Expected delivery time
-        """
-        return self.pickup_time + timedelta(minutes=30)
-    
     @property
     def item_count(self):
         """
@@ -489,20 +888,6 @@ class Order(db.Model):
         """
         return sum(item.amount for item in self.order_items)
     
-    @property
-    def raw_price(self):
-        """
-        Calculate order price before any discounts.
-        
-        Returns:
-            float: Sum of (item_price * quantity) for all items
-        """
-        subtotal = 0.0
-        for item in self.order_items:
-                item_total = item.amount * item.menu_item.price
-                subtotal += item_total
-        return subtotal
-    
     @property
     def status(self):
         """
@@ -519,7 +904,7 @@ class Order(db.Model):
         now = datetime.now(ZoneInfo("Europe/Amsterdam"))
         
         # Make datetime values timezone-aware if they aren't already
-        expected_delivery = self.pickup_time + timedelta(minutes=30)
+        expected_delivery = self.expected_delivery_time
         if expected_delivery.tzinfo is None:
             expected_delivery = expected_delivery.replace(tzinfo=ZoneInfo("Europe/Amsterdam"))
         
@@ -534,6 +919,83 @@ class Order(db.Model):
         else:
             return 'pending'
     
+    @classmethod
+    def status_filter(cls, status, now=None):
+        """
+        SQL predicate matching orders with the given status.
+        
+        Mirrors the status property, but compares the bare pickup_time column
+        so the database can use the index on pickup_time. This relies on
+        expected_delivery_time always being pickup_time + 30 minutes, which
+        also holds for orders on a trip:
+        - "pending": pickup_time > now
+        - "out_for_delivery": now - 30 minutes < pickup_time <= now
+        - "delivered": pickup_time <= now - 30 minutes
+        
+        Args:
+            status (str): 'pending', 'out_for_delivery' or 'delivered'
+            now (datetime, optional): Current time, defaults to now in Europe/Amsterdam
+        
+        Returns:
+            SQL expression usable in filter()
+        
+        Raises:
+            ValueError: If the status is unknown
+        """
+        if now is None:
+            now = datetime.now(ZoneInfo("Europe/Amsterdam"))
+        # Times are stored as naive Europe/Amsterdam datetimes
+        if now.tzinfo is not None:
+            now = now.astimezone(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None)
+
+        if status == "pending":
+            return cls.pickup_time > now
+        elif status == "out_for_delivery":
+            return and_(cls.pickup_time > now - DELIVERY_DURATION, cls.pickup_time <= now)
+        elif status == "delivered":
+            return cls.pickup_time <= now - DELIVERY_DURATION
+        raise ValueError(f"Unknown order status: {status}")
+
+    @classmethod
+    def undelivered(cls, now=None):
+        """
+        SQL predicate matching orders that are pending or out for delivery.
+        
+        An order is delivered once pickup_time + 30 minutes has passed, so it
+        is undelivered while pickup_time > now - 30 minutes.
+        
+        Args:
+            now (datetime, optional): Current time, defaults to now in Europe/Amsterdam
+        
+        Returns:
+            SQL expression usable in filter()
+        """
+        return not_(cls.status_filter("delivered", now))
+
+    @classmethod
+    def placed_between(cls, start=None, end=None):
+        """
+        SQL predicate matching orders placed in the half-open range [start, end).
+
+        Compares the bare order_time column, never a function of it (such as
+        extract('month', order_time)), so the database can range-scan the
+        indexes that start with order_time. A date means midnight at the start
+        of that day, so a range of whole days ends at the day after the last one.
+
+        Args:
+            start (date or datetime, optional): First moment included, no lower bound if None
+            end (date or datetime, optional): First moment excluded, no upper bound if None
+
+        Returns:
+            SQL expression usable in filter()
+        """
+        conditions = []
+        if start is not None:
+            conditions.append(cls.order_time >= as_datetime(start))
+        if end is not None:
+            conditions.append(cls.order_time < as_datetime(end))
+        return and_(true(), *conditions)
+
     @property
     def status_display(self):
         """
@@ -557,12 +1019,15 @@ class OrderItem(db.Model):
     """
     Represents a single item within an order (junction table).
     
-    Links orders to menu items with a quantity.
+    Links orders to menu items with a quantity. The unit price is stored
+    when the order is created, so later price changes (e.g. of ingredients)
+    do not change historical orders.
     
     Attributes:
         order_id (int): Primary key, foreign key to Order
         item_id (int): Primary key, foreign key to MenuItem
         amount (int): Quantity of this item in the order
+        unit_price (Numeric): Price of one item at the time of ordering
         order (Order): Relationship to parent order
         menu_item (MenuItem): Relationship to menu item
     """
@@ -572,6 +1037,7 @@ class OrderItem(db.Model):
     order_id = db.Column(db.Integer, db.ForeignKey("order.order_id"), primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey("menu_item.item_id"), primary_key=True)
     amount = db.Column(db.Integer, default=1, nullable=False)
+    unit_price = db.Column(db.Numeric(8, 2), nullable=False)
     
     # Relationships
     order = db.relationship("Order", back_populates="order_items")
@@ -581,225 +1047,364 @@ class OrderItem(db.Model):
         return f"<OrderItem order={self.order_id} item={self.item_id} amount={self.amount}>"
 
 
-def seed_data():
+def record_customer_order(customer_id, pizza_count, total_price, order_time):
+    """
+    Add a new order to the customer's running totals.
+    
+    Must be called in the transaction that creates the order. Existing rows are
+    incremented in SQL, so concurrent orders of the same customer are not lost.
+    
+    Args:
+        customer_id (int): Customer who placed the order
+        pizza_count (int): Number of pizzas in the order
+        total_price (float or Decimal): Final price of the order
+        order_time (datetime): When the order was placed
+    """
+    stats = db.session.get(CustomerStats, customer_id)
+    if stats is None:
+        db.session.add(CustomerStats(
+            customer_id=customer_id,
+            pizzas_ordered=pizza_count,
+            order_count=1,
+            lifetime_spend=total_price,
+            last_order_time=order_time,
+        ))
+        return
+
+    stats.pizzas_ordered = CustomerStats.pizzas_ordered + pizza_count
+    stats.order_count = CustomerStats.order_count + 1
+    stats.lifetime_spend = CustomerStats.lifetime_spend + total_price
+    stats.last_order_time = case(
+        (CustomerStats.last_order_time > order_time, CustomerStats.last_order_time),
+        else_=order_time,
+    )
+
+def record_customer_orders_bulk(totals):
+    """
+    Add many new orders to the customers' running totals at once.
+    
+    Bulk version of record_customer_order(), used when importing or generating
+    orders in batches. Missing customer_stats rows are created first, then all
+    rows are incremented with a single executemany UPDATE.
+    
+    Args:
+        totals (dict): Maps customer_id to a dict with the keys pizzas
+            (int), orders (int), spend (Decimal or float) and
+            last_order_time (datetime) of the new orders
+    """
+    if not totals:
+        return
+
+    # Create the rows that do not exist yet
+    existing = {
+        customer_id for (customer_id,) in
+        db.session.query(CustomerStats.customer_id).filter(CustomerStats.customer_id.in_(totals))
+    }
+    missing = [
+        {"customer_id": customer_id, "pizzas_ordered": 0, "order_count": 0, "lifetime_spend": 0}
+        for customer_id in totals if customer_id not in existing
+    ]
+    if missing:
+        db.session.execute(insert(CustomerStats.__table__), missing)
+
+    # Increment all rows in one executemany statement
+    table = CustomerStats.__table__
+    statement = (
+        update(table)
+        .where(table.c.customer_id == bindparam("stats_customer_id"))
+        .values(
+            pizzas_ordered=table.c.pizzas_ordered + bindparam("stats_pizzas"),
+            order_count=table.c.order_count + bindparam("stats_orders"),
+            lifetime_spend=table.c.lifetime_spend + bindparam("stats_spend"),
+            last_order_time=case(
+                (table.c.last_order_time > bindparam("stats_last_order_time"), table.c.last_order_time),
+                else_=bindparam("stats_last_order_time"),
+            ),
+        )
+    )
+    db.session.execute(statement, [
+        {
+            "stats_customer_id": customer_id,
+            "stats_pizzas": total["pizzas"],
+            "stats_orders": total["orders"],
+            "stats_spend": total["spend"],
+            "stats_last_order_time": total["last_order_time"],
+        }
+        for customer_id, total in totals.items()
+    ])
+
+def rebuild_customer_stats():
     """
-    Populate the database with initial test data.
+    Recalculate the customer_stats table from the order history.
     
-    This function:
-    1. Drops all existing tables and recreates them
-    2. Creates 10 random customers using Faker
-    3. Creates 3 delivery persons for different postal codes
-    4. Creates ingredients with dietary properties
-    5. Creates 10 pizzas with various ingredient combinations
-    6. Creates drinks and desserts
-    7. Creates menu items for all products
-    8. Creates discount codes
-    9. Generates 20 random orders from the past month
+    Used to backfill the table, or to repair it after orders were changed
+    outside the application. Every customer gets a row, also customers
+    without orders.
     
-    Uses Faker library with Dutch locale for realistic test data.
+    Returns:
+        int: Number of customer_stats rows written
     """
+    # Orders, spend and last order time per customer
+    order_totals = {
+        row.customer_id: row
+        for row in db.session.query(
+            Order.customer_id,
+            func.count(Order.order_id).label("order_count"),
+            func.sum(Order.total_price).label("lifetime_spend"),
+            func.max(Order.order_time).label("last_order_time"),
+        ).group_by(Order.customer_id)
+    }
+
+    # Pizzas per customer
+    pizza_totals = dict(
+        db.session.query(Order.customer_id, func.sum(OrderItem.amount))
+        .join(OrderItem, OrderItem.order_id == Order.order_id)
+        .join(MenuItem, MenuItem.item_id == OrderItem.item_id)
+        .filter(MenuItem.item_type == "pizza")
+        .group_by(Order.customer_id)
+        .all()
+    )
 
-    db.drop_all()
-    db.create_all()
+    rows = []
+    for (customer_id,) in db.session.query(Customer.customer_id):
+        totals = order_totals.get(customer_id)
+        rows.append({
+            "customer_id": customer_id,
+            "pizzas_ordered": int(pizza_totals.get(customer_id) or 0),
+            "order_count": totals.order_count if totals else 0,
+            "lifetime_spend": totals.lifetime_spend if totals else 0,
+            "last_order_time": totals.last_order_time if totals else None,
+        })
+
+    db.session.execute(delete(CustomerStats))
+    if rows:
+        db.session.execute(insert(CustomerStats), rows)
+    db.session.commit()
+    return len(rows)
+
+class OrderSales:
+    """
+    Sales of new orders, summed per row of the sales rollup tables.
 
-    fake = Faker("nl_NL")
-    postal_codes = ['6221AX', '6211RZ', '6215PD']
+    Collects orders with add(), record_order_sales_bulk() then adds them to
+    pizza_daily_sales and customer_monthly_spend.
+
+    Attributes:
+        pizza_units (dict): Maps (sales_date, item_id) to the number of pizzas
+        customer_spend (dict): Maps (month, customer_id, postal_code) to a dict
+            with the keys order_count (int), raw_spend and total_spend (Decimal)
+    """
+
+    def __init__(self):
+        self.pizza_units = {}
+        self.customer_spend = {}
+
+    def add(self, customer_id, postal_code, raw_price, total_price, order_time, pizza_units):
+        """
+        Add one order.
+
+        Args:
+            customer_id (int): Customer who placed the order
+            postal_code (str): Delivery postal code of the order
+            raw_price (Decimal or float): Price before discounts
+            total_price (Decimal or float): Final price of the order
+            order_time (datetime): When the order was placed (Europe/Amsterdam)
+            pizza_units (dict): Maps the item_id of each pizza in the order to
+                the number ordered
+        """
+        day = order_time.date()
+        for item_id, units in pizza_units.items():
+            self.pizza_units[(day, item_id)] = self.pizza_units.get((day, item_id), 0) + units
+
+        spend = self.customer_spend.setdefault((day.replace(day=1), customer_id, postal_code), {
+            "order_count": 0, "raw_spend": Decimal("0"), "total_spend": Decimal("0"),
+        })
+        spend["order_count"] += 1
+        spend["raw_spend"] += Decimal(str(raw_price))
+        spend["total_spend"] += Decimal(str(total_price))
+
+def _increment_rows(table, key_columns, rows):
+    """
+    Add rows to a rollup table, adding to the rows that already exist.
+
+    Uses the database's own upsert (INSERT ... ON CONFLICT DO UPDATE on SQLite
+    and PostgreSQL, INSERT ... ON DUPLICATE KEY UPDATE on MySQL), one
+    executemany statement that cannot lose concurrent increments of a new row.
+    Other databases get an UPDATE per row and an INSERT when nothing matched.
+
+    Args:
+        table (Table): Rollup table
+        key_columns (tuple of str): Primary key columns of the table
+        rows (list of dict): Key columns and the amounts to add
+    """
+    if not rows:
+        return
+    amount_columns = [column for column in rows[0] if column not in key_columns]
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        upsert = (sqlite_insert if dialect == "sqlite" else postgresql_insert)(table)
+        statement = upsert.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={column: table.c[column] + upsert.excluded[column] for column in amount_columns},
+        )
+        db.session.execute(statement, rows)
+        return
+    if dialect in ("mysql", "mariadb"):
+        upsert = mysql_insert(table)
+        statement = upsert.on_duplicate_key_update(
+            {column: table.c[column] + upsert.inserted[column] for column in amount_columns}
+        )
+        db.session.execute(statement, rows)
+        return
+
+    statement = (
+        update(table)
+        .where(and_(*(table.c[column] == bindparam(f"key_{column}") for column in key_columns)))
+        .values({column: table.c[column] + bindparam(f"add_{column}") for column in amount_columns})
+    )
+    for row in rows:
+        result = db.session.execute(statement, {
+            **{f"key_{column}": row[column] for column in key_columns},
+            **{f"add_{column}": row[column] for column in amount_columns},
+        })
+        if result.rowcount == 0:
+            db.session.execute(insert(table), row)
+
+def record_order_sales_bulk(sales):
+    """
+    Add new orders to the sales rollup tables.
+
+    Must be called in the transaction that creates the orders, like
+    record_customer_orders_bulk(). Adds one statement per table.
+
+    Args:
+        sales (OrderSales): Sales of the new orders
+    """
+    _increment_rows(PizzaDailySales.__table__, ("sales_date", "item_id"), [
+        {"sales_date": day, "item_id": item_id, "units": units}
+        for (day, item_id), units in sales.pizza_units.items()
+    ])
+    _increment_rows(CustomerMonthlySpend.__table__, ("month", "customer_id", "postal_code"), [
+        {"month": month, "customer_id": customer_id, "postal_code": postal_code, **spend}
+        for (month, customer_id, postal_code), spend in sales.customer_spend.items()
+    ])
+
+    # The cached staff reports of these months are dropped when the transaction commits (see reports.py)
+    db.session.info.setdefault("sales_months", set()).update(month for month, _, _ in sales.customer_spend)
+
+def record_order_sales(customer_id, postal_code, raw_price, total_price, order_time, pizza_units):
+    """
+    Add a new order to the sales rollup tables.
+
+    Must be called in the transaction that creates the order. See
+    OrderSales.add() for the arguments.
+    """
+    sales = OrderSales()
+    sales.add(customer_id, postal_code, raw_price, total_price, order_time, pizza_units)
+    record_order_sales_bulk(sales)
+
+def rebuild_sales_rollups():
+    """
+    Recalculate the pizza_daily_sales and customer_monthly_spend tables from the order history.
+
+    Used to backfill the tables, or to repair them after orders were changed
+    outside the application. Both tables are grouped in the database, so
+    only the rollup rows are loaded.
+
+    Returns:
+        tuple: (pizza_daily_sales rows, customer_monthly_spend rows) written
+    """
+    # Pizzas per day and menu item
+    sales_date = func.date(Order.order_time, type_=db.Date)
+    pizza_rows = [
+        {"sales_date": row.sales_date, "item_id": row.item_id, "units": int(row.units)}
+        for row in db.session.query(
+            sales_date.label("sales_date"),
+            OrderItem.item_id,
+            func.sum(OrderItem.amount).label("units"),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.order_id)
+        .join(MenuItem, MenuItem.item_id == OrderItem.item_id)
+        .filter(MenuItem.item_type == "pizza")
+        .group_by(sales_date, OrderItem.item_id)
+    ]
+
+    # Orders and spend per month, customer and postal code
+    year = func.extract("year", Order.order_time)
+    month = func.extract("month", Order.order_time)
+    spend_rows = [
+        {
+            "month": date(int(row.year), int(row.month), 1),
+            "customer_id": row.customer_id,
+            "postal_code": row.postal_code,
+            "order_count": row.order_count,
+            "raw_spend": row.raw_spend,
+            "total_spend": row.total_spend,
+        }
+        for row in db.session.query(
+            year.label("year"),
+            month.label("month"),
+            Order.customer_id,
+            Order.postal_code,
+            func.count(Order.order_id).label("order_count"),
+            func.sum(Order.raw_price).label("raw_spend"),
+            func.sum(Order.total_price).label("total_spend"),
+        ).group_by(year, month, Order.customer_id, Order.postal_code)
+    ]
+
+    db.session.execute(delete(PizzaDailySales))
+    db.session.execute(delete(CustomerMonthlySpend))
+    if pizza_rows:
+        db.session.execute(insert(PizzaDailySales), pizza_rows)
+    if spend_rows:
+        db.session.execute(insert(CustomerMonthlySpend), spend_rows)
+    db.session.info.setdefault("sales_months", set()).update(row["month"] for row in spend_rows)
+    db.session.commit()
+    return len(pizza_rows), len(spend_rows)
+
+# Maps MenuItem.item_type to the model holding the referenced item
+MENU_ITEM_MODELS = {
+    "pizza": Pizza,
+    "drink": Drink,
+    "dessert": Dessert,
+}
+
+def resolve_menu_items(menu_items):
+    """
+    Load the pizzas, drinks and desserts referenced by a collection of menu items.
+    
+    Instead of letting every MenuItem query its own pizza/drink/dessert when its
+    name or price is read, this function collects the referenced ids per item type
+    and loads them with at most one query per type. The loaded objects are
+    attached to the menu items, so reading MenuItem.name and MenuItem.price
+    afterwards costs no extra queries.
+    
+    Args:
+        menu_items (iterable of MenuItem): Menu items to resolve
+    
+    Returns:
+        list of MenuItem: The same menu items, now resolved
+    """
+    menu_items = list(menu_items)
+
+    # Collect the referenced ids per item type
+    ids_by_type = {}
+    for menu_item in menu_items:
+        ids_by_type.setdefault(menu_item.item_type, set()).add(menu_item.item_ref_id)
+
+    # One query per item type
+    loaded = {}
+    for item_type, ids in ids_by_type.items():
+        model = MENU_ITEM_MODELS.get(item_type)
+        if model is None:
+            continue
+        query = model.query.filter(model.__mapper__.primary_key[0].in_(ids))
+        for obj in query.all():
+            loaded[(item_type, obj.__mapper__.primary_key_from_instance(obj)[0])] = obj
+
+    # Attach the loaded objects to the menu items
+    for menu_item in menu_items:
+        menu_item._product = loaded.get((menu_item.item_type, menu_item.item_ref_id))
+    return menu_items
 
-    # Create customers
-    if Customer.query.count() == 0:
-        for _ in range(10):
-            c = Customer(
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                birthdate=fake.date_of_birth(minimum_age=18, maximum_age=60),
-                address=f'{fake.street_name()} {random.randint(1,200)}',
-                postal_code = random.choice(postal_codes),
-                phone_number=fake.unique.phone_number(),
-                gender=random.choice([0, 1, 2])
-            )
-            db.session.add(c)
-        db.session.flush()
-
-    # Create delivery persons (one per postal code)
-    if DeliveryPerson.query.count() == 0:
-        for i in range(3):
-            d = DeliveryPerson(
-                delivery_person_first_name=fake.first_name(),
-                delivery_person_last_name=fake.last_name(),
-                postal_code=postal_codes[i],
-                next_available_time=datetime.now(ZoneInfo("Europe/Amsterdam"))
-            )
-            db.session.add(d)
-        db.session.flush()
-
-    # Create igredients
-    if Ingredient.query.count() == 0:
-        db.session.add_all([
-            Ingredient(ingredient_name="Tomato Sauce", price=1.50, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Mozzarella", price=2.00, vegetarian=True, vegan=False),
-            Ingredient(ingredient_name="Vegan Mozzarella", price=3.00, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Pepperoni", price=2.50, vegetarian=False, vegan=False),
-            Ingredient(ingredient_name="Mushrooms", price=1.75, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Bell Peppers", price=1.25, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Onions", price=1.00, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Olives", price=1.50, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Ham", price=2.75, vegetarian=False, vegan=False),
-            Ingredient(ingredient_name="Pineapple", price=1.80, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Basil", price=0.75, vegetarian=True, vegan=True),
-            Ingredient(ingredient_name="Parmesan", price=2.20, vegetarian=True, vegan=False),
-            Ingredient(ingredient_name="Gorgonzola", price=2.30, vegetarian=True, vegan=False),
-        ])
-    db.session.flush()  # so ingredient IDs exist
-
-    # Create pizzas with ingredient combinations
-    if Pizza.query.count() == 0:
-        # Fetch ingredients for pizza creation
-        tomato = Ingredient.query.filter_by(ingredient_name="Tomato Sauce").first()
-        mozzarella = Ingredient.query.filter_by(ingredient_name="Mozzarella").first()
-        pepperoni = Ingredient.query.filter_by(ingredient_name="Pepperoni").first()
-        mushrooms = Ingredient.query.filter_by(ingredient_name="Mushrooms").first()
-        peppers = Ingredient.query.filter_by(ingredient_name="Bell Peppers").first()
-        onions = Ingredient.query.filter_by(ingredient_name="Onions").first()
-        olives = Ingredient.query.filter_by(ingredient_name="Olives").first()
-        ham = Ingredient.query.filter_by(ingredient_name="Ham").first()
-        pineapple = Ingredient.query.filter_by(ingredient_name="Pineapple").first()
-        basil = Ingredient.query.filter_by(ingredient_name="Basil").first()
-        parmesan = Ingredient.query.filter_by(ingredient_name="Parmesan").first()
-        gorgonzola = Ingredient.query.filter_by(ingredient_name="Gorgonzola").first()
-        vegan_mozzarella = Ingredient.query.filter_by(ingredient_name="Vegan Mozzarella").first()
-
-        pizzas = [
-            Pizza(name="Margherita", ingredients=[tomato, mozzarella, basil]),
-            Pizza(name="Vegan Margherita", ingredients=[tomato, vegan_mozzarella, basil]),
-            Pizza(name="Pepperoni", ingredients=[tomato, mozzarella, pepperoni]),
-            Pizza(name="Veggie Deluxe", ingredients=[tomato, mozzarella, mushrooms, peppers, onions, olives]),
-            Pizza(name="Vegan Deluxe", ingredients=[tomato, vegan_mozzarella, mushrooms, peppers, onions, olives]),
-            Pizza(name="Hawaiian", ingredients=[tomato, mozzarella, ham, pineapple]),
-            Pizza(name="Four Cheese", ingredients=[tomato, mozzarella, parmesan, gorgonzola]),
-            Pizza(name="Meat Feast", ingredients=[tomato, mozzarella, ham, pepperoni]),
-            Pizza(name="Capricciosa", ingredients=[tomato, mozzarella, ham, mushrooms, olives]),
-            Pizza(name="Funghi", ingredients=[tomato, mozzarella, mushrooms]),
-        ]
-        db.session.add_all(pizzas)
-        db.session.flush()
-
-    # Create drinks
-    if Drink.query.count() == 0:
-        drinks = [
-            Drink(name="Coca Cola", price=2.00),
-            Drink(name="Sprite", price=2.00),
-            Drink(name="Ice Tea", price=2.50),
-            Drink(name="Beer", price=3.50),
-        ]
-        db.session.add_all(drinks)
-        db.session.flush()
-
-    # Create desserts
-    if Dessert.query.count() == 0:
-        desserts = [
-            Dessert(name="Tiramisu", price=4.00),
-            Dessert(name="Panna Cotta", price=3.50),
-            Dessert(name="Brownie", price=2.50)
-        ]
-        db.session.add_all(desserts)
-        db.session.flush()
-
-    # Create menu items for all pizzas, drinks, and desserts
-    for p in Pizza.query.all():
-        if not MenuItem.query.filter_by(item_type="pizza", item_ref_id=p.pizza_id).first():
-            db.session.add(MenuItem(item_type="pizza", item_ref_id=p.pizza_id))
-
-    for d in Drink.query.all():
-        if not MenuItem.query.filter_by(item_type="drink", item_ref_id=d.drink_id).first():
-            db.session.add(MenuItem(item_type="drink", item_ref_id=d.drink_id))
-
-    for ds in Dessert.query.all():
-        if not MenuItem.query.filter_by(item_type="dessert", item_ref_id=ds.dessert_id).first():
-            db.session.add(MenuItem(item_type="dessert", item_ref_id=ds.dessert_id))
-
-
-    # Create discount codes
-    if DiscountCode.query.count() == 0:
-        db.session.add_all([
-            DiscountCode(percentage=10, discount_code="WELCOME10"),
-            DiscountCode(percentage=15, discount_code="STUDENT15"),
-            DiscountCode(percentage=20, discount_code="VIP20"),
-        ])
-        db.session.flush()
-
-
-    # Generate random orders from the past month.
-    if Order.query.count() == 0:
-        customers = Customer.query.all()
-        delivery_people = DeliveryPerson.query.all()
-        menu_pizzas = MenuItem.query.filter_by(item_type="pizza").all()
-        menu_drinks = MenuItem.query.filter_by(item_type="drink").all()
-        menu_desserts = MenuItem.query.filter_by(item_type="dessert").all()
-
-        base_date = datetime.now(ZoneInfo("Europe/Amsterdam"))
-
-        # Create 20 random orders
-        for _ in range(20):
-            customer = random.choice(customers)
-            delivery_person = random.choice(delivery_people)
-
-            # Place orders randomly in the past month
-            order_time = base_date - timedelta(
-                days=random.randint(0, 30), 
-                hours=random.randint(0, 10), 
-                minutes=random.randint(0, 59)
-            )
-            pickup_time = order_time + timedelta(minutes=random.randint(0, 60))
-
-            # Create order with placeholder price (will be updated)
-            order = Order(
-                customer_id=customer.customer_id,
-                delivery_person_id=delivery_person.delivery_person_id,
-                order_time=order_time,
-                pickup_time=pickup_time,
-                delivery_address=fake.street_address(),
-                postal_code=customer.postal_code,
-                total_price=1.0,
-            )
-            db.session.add(order)
-            db.session.flush()
-
-            # Add order items
-            subtotal = 0
-            added_item_ids = set()
-
-            # Add 1 to 4 pizzas
-            for _ in range(random.randint(1, 4)):
-                pizza_item = random.choice(menu_pizzas)
-                if pizza_item.item_id in added_item_ids:
-                    continue  # skip if we already have this pizza in the orderitems
-                qty = random.randint(1, 3)
-                db.session.add(OrderItem(order_id=order.order_id, item_id=pizza_item.item_id, amount=qty))
-                subtotal += pizza_item.price * qty
-                added_item_ids.add(pizza_item.item_id)
-
-            # 60% chance to add drinks
-            if random.random() < 0.6:
-                drink_item = random.choice(menu_drinks)
-                if drink_item.item_id in added_item_ids:
-                    continue  # skip if its already added
-                qty = random.randint(1, 2)
-                db.session.add(OrderItem(order_id=order.order_id, item_id=drink_item.item_id, amount=qty))
-                subtotal += drink_item.price * qty
-                added_item_ids.add(drink_item.item_id)
-
-            # 30% chance to add a dessert
-            if random.random() < 0.3:
-                dessert_item = random.choice(menu_desserts)
-                if dessert_item.item_id in added_item_ids:
-                    continue
-                qty = 1
-                db.session.add(OrderItem(order_id=order.order_id, item_id=dessert_item.item_id, amount=qty))
-                subtotal += dessert_item.price * qty
-                added_item_ids.add(dessert_item.item_id)
-
-            # Update order with calculated total price
-            order.total_price = round(subtotal, 2)
-
-        # Commit all changes to the database
-        db.session.commit()
@@ -0,0 +1,524 @@
+"""
+Order Placement for Pizza Ordering System
+
+This module creates orders from priced quotes (see pricing.py). It is used by
+the order form in controllers.py (one order at a time) and by the JSON order
+API (/api/orders), which accepts one or many orders per request, e.g. from the
+POS system or delivery aggregators.
+
+A batch of orders shares its lookups. Before the first order is placed, the
+following are loaded once for the whole batch (at most five queries):
+- the menu catalog (version check)
+- the customers of the batch with their loyalty totals
+- the discount codes entered, and which of these customers used them before
+- the delivery persons of the postal codes in the batch, unless the courier
+  dispatcher already has them (see dispatch.py)
+
+Later orders of the same customer see the earlier ones in the batch: the
+loyalty totals, the birthday discount and used discount codes are updated in
+memory, and the courier dispatcher keeps the availability of the delivery
+persons, so every order gets the price and pickup time it would get when
+placed on its own.
+
+Every order is created in its own savepoint, so an invalid or failing order
+does not affect the others. The batch is committed once at the end.
+
+Delivery slots:
+    Every order takes the next slot of the delivery person of its postal code
+    that is available first (picked by the courier dispatcher, see
+    dispatch.py): pickup at max(now, next_available_time), delivery 30 minutes
+    later, after which the delivery person is available again. Concurrent
+    orders for the same postal code must never get the same slot, so
+    reserve_delivery_slot() moves next_available_time with a conditional
+    UPDATE (compare-and-set): it only succeeds if next_available_time still has
+    the value the slot was calculated from. If another order got there first,
+    the zone is reloaded with SELECT ... FOR UPDATE (the plain read may come
+    from the transaction's snapshot, the locking read never does) and the
+    delivery person picked again.
+
+Trip batching (optional, TRIP_BATCHING):
+    Without batching every order ties up a delivery person for its own 30
+    minute slot. With batching, orders for the same postal code share a trip
+    (see Trip in models.py): a new order joins a trip that was opened less
+    than TRIP_WINDOW_MINUTES ago, has not been picked up yet and has fewer than
+    TRIP_CAPACITY orders. It gets the trip's delivery person, pickup and
+    delivery time. Joining increments the trip's order count with a
+    conditional UPDATE (order_count < capacity), so concurrent orders never
+    overfill a trip. When there is no open trip, the order reserves a delivery
+    slot as above and opens a new trip.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import DataError, SQLAlchemyError
+from dispatch import get_dispatcher
+from metrics import COURIER_ASSIGNMENT_FAILURES, COURIER_SLOT_CONFLICTS, ORDERS_CREATED, TRIP_ORDERS
+from models import (DELIVERY_DURATION, db, DeliveryPerson, DiscountCode, Order, OrderItem, Trip, record_customer_order,
+                    record_order_sales)
+from pricing import PricingError, PricingService, customer_totals
+
+# Maximum number of orders in one API request
+API_MAX_BATCH_SIZE = 100
+
+# Maximum amount of one menu item in an API order
+API_MAX_ITEM_AMOUNT = 100
+
+# Largest customer_id and item_id the API accepts (the range of an INT column)
+API_MAX_ID = 2 ** 31 - 1
+
+# Attempts to reserve a delivery slot before giving up (see reserve_delivery_slot())
+SLOT_RESERVATION_ATTEMPTS = 5
+
+# Open trips an order tries to join before opening a new one (see find_open_trips())
+TRIP_JOIN_ATTEMPTS = 3
+
+# A reserved delivery slot. Times are timezone-aware (Europe/Amsterdam).
+# trip_id is set when the order is batched on a trip.
+DeliverySlot = namedtuple("DeliverySlot", ["delivery_person_id", "pickup_time", "expected_delivery_time", "trip_id"],
+                          defaults=(None,))
+
+
+class OrderRequestError(ValueError):
+    """Raised when an order in an API request is invalid."""
+
+
+class SlotReservationError(RuntimeError):
+    """Raised when no delivery slot could be reserved, because other orders kept taking it first."""
+
+
+def delivery_times(next_available_time, now=None):
+    """
+    Calculate when a delivery person can pick up and deliver a new order.
+
+    Pickup occurs at max(now, next_available_time), delivery takes 30 minutes
+    from pickup.
+
+    Args:
+        next_available_time (datetime): When the delivery person is available,
+                                        naive times are in Europe/Amsterdam
+        now (datetime): Current time (default: now in Europe/Amsterdam)
+
+    Returns:
+        tuple: (pickup_time, expected_delivery_time), timezone-aware
+    """
+    # Whole seconds, so the stored times compare equal on databases without fractional seconds
+    now = (now or datetime.now(ZoneInfo("Europe/Amsterdam"))).replace(microsecond=0)
+    if next_available_time.tzinfo is None:
+        next_available_time = next_available_time.replace(tzinfo=ZoneInfo("Europe/Amsterdam"))
+    pickup_time = max(now, next_available_time)
+    return pickup_time, pickup_time + DELIVERY_DURATION
+
+
+def reserve_delivery_slot(postal_code, now=None):
+    """
+    Atomically reserve the next delivery slot for a postal code.
+
+    Picks the delivery person of the postal code that is available first
+    (see dispatch.py) and moves their next_available_time to the end of the
+    new delivery, with an UPDATE that only succeeds if next_available_time
+    still has the value the slot was calculated from. On a conflict the zone
+    is reloaded with a row lock and the delivery person picked again.
+    Must run in the transaction that creates the order, so a failed order
+    releases its slot on rollback.
+
+    Args:
+        postal_code (str): Normalized delivery postal code
+        now (datetime): Current time (default: now in Europe/Amsterdam)
+
+    Returns:
+        DeliverySlot or None: The reserved slot, or None if no delivery person
+                              serves the postal code
+
+    Raises:
+        SlotReservationError: If every attempt lost to a concurrent order
+    """
+    # One clock reading, so the stored and the returned slot are the same
+    now = now or datetime.now(ZoneInfo("Europe/Amsterdam"))
+    dispatcher = get_dispatcher()
+    for attempt in range(SLOT_RESERVATION_ATTEMPTS):
+        if attempt > 0:
+            dispatcher.load([postal_code], lock=True, reason="conflict")
+        # Stored as naive Europe/Amsterdam time, like all times in the database
+        picked = dispatcher.pick(postal_code, lambda available: delivery_times(available, now)[1].replace(tzinfo=None))
+        if picked is None:
+            return None
+        delivery_person_id, next_available_time, new_available_time = picked
+
+        result = db.session.execute(
+            update(DeliveryPerson)
+            .where(
+                DeliveryPerson.delivery_person_id == delivery_person_id,
+                DeliveryPerson.next_available_time == next_available_time,
+            )
+            .values(next_available_time=new_available_time)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            pickup_time, expected_delivery_time = delivery_times(next_available_time, now)
+            return DeliverySlot(delivery_person_id, pickup_time, expected_delivery_time)
+
+        # Another order took the slot first, try again from the current values
+        COURIER_SLOT_CONFLICTS.inc()
+    raise SlotReservationError(f"could not reserve a delivery slot for postal code {postal_code}, please try again")
+
+
+def _open_trip(postal_code, now):
+    """SQL conditions matching the trips an order for the postal code, placed at `now`, can join."""
+    config = current_app.config
+    # Stored as naive Europe/Amsterdam time, like all times in the database
+    naive_now = now.astimezone(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None)
+    return (
+        Trip.postal_code == postal_code,
+        Trip.opened_at >= naive_now - timedelta(minutes=config["TRIP_WINDOW_MINUTES"]),
+        Trip.pickup_time > naive_now,
+        Trip.order_count < config["TRIP_CAPACITY"],
+    )
+
+
+def find_open_trips(postal_code, now=None):
+    """
+    Find the trips a new order for a postal code can join.
+
+    A trip is open when it was opened at most TRIP_WINDOW_MINUTES ago, is not
+    picked up yet and has fewer than TRIP_CAPACITY orders.
+
+    Args:
+        postal_code (str): Normalized delivery postal code
+        now (datetime): Current time (default: now in Europe/Amsterdam)
+
+    Returns:
+        list of tuple: (trip_id, delivery_person_id, pickup_time,
+                       expected_delivery_time), earliest pickup first
+    """
+    now = now or datetime.now(ZoneInfo("Europe/Amsterdam"))
+    return db.session.execute(
+        select(Trip.trip_id, Trip.delivery_person_id, Trip.pickup_time, Trip.expected_delivery_time)
+        .where(*_open_trip(postal_code, now))
+        .order_by(Trip.pickup_time, Trip.trip_id)
+        .limit(TRIP_JOIN_ATTEMPTS)
+    ).all()
+
+
+def join_trip(postal_code, open_trips, now):
+    """
+    Add an order to the first of the open trips that still has room.
+
+    Args:
+        postal_code (str): Normalized delivery postal code
+        open_trips (list of tuple): Result of find_open_trips()
+        now (datetime): Current time, timezone-aware
+
+    Returns:
+        DeliverySlot or None: The trip's slot, or None if no trip could be joined
+    """
+    amsterdam = ZoneInfo("Europe/Amsterdam")
+    for trip_id, delivery_person_id, pickup_time, expected_delivery_time in open_trips:
+        # Only succeeds if the trip is still open, a concurrent order may have filled it
+        result = db.session.execute(
+            update(Trip)
+            .where(Trip.trip_id == trip_id, *_open_trip(postal_code, now))
+            .values(order_count=Trip.order_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            TRIP_ORDERS.inc("joined")
+            return DeliverySlot(delivery_person_id, pickup_time.replace(tzinfo=amsterdam),
+                                expected_delivery_time.replace(tzinfo=amsterdam), trip_id)
+    return None
+
+
+def reserve_delivery(postal_code, now=None, open_trips=None):
+    """
+    Reserve the delivery of a new order.
+
+    With trip batching enabled (TRIP_BATCHING) the order joins an open trip
+    for its postal code, or opens a new trip with its own delivery slot.
+    Without batching it gets its own delivery slot (see reserve_delivery_slot()).
+    Must run in the transaction that creates the order.
+
+    Args:
+        postal_code (str): Normalized delivery postal code
+        now (datetime): Current time (default: now in Europe/Amsterdam)
+        open_trips (list of tuple): Open trips already looked up with
+                                    find_open_trips(), looked up if not given
+
+    Returns:
+        DeliverySlot or None: The reserved slot (with trip_id when batched), or
+                              None if no delivery person serves the postal code
+
+    Raises:
+        SlotReservationError: If every attempt to reserve a slot lost to a concurrent order
+    """
+    if not current_app.config["TRIP_BATCHING"]:
+        return reserve_delivery_slot(postal_code, now)
+
+    now = now or datetime.now(ZoneInfo("Europe/Amsterdam"))
+    if open_trips is None:
+        open_trips = find_open_trips(postal_code, now)
+    slot = join_trip(postal_code, open_trips, now)
+    if slot is not None:
+        return slot
+
+    slot = reserve_delivery_slot(postal_code, now)
+    if slot is None:
+        return None
+    trip = Trip(
+        delivery_person_id=slot.delivery_person_id,
+        postal_code=postal_code,
+        opened_at=now.astimezone(ZoneInfo("Europe/Amsterdam")).replace(tzinfo=None, microsecond=0),
+        pickup_time=slot.pickup_time.replace(tzinfo=None),
+        expected_delivery_time=slot.expected_delivery_time.replace(tzinfo=None),
+        order_count=1,
+    )
+    db.session.add(trip)
+    db.session.flush()  # Get trip_id for the order
+    TRIP_ORDERS.inc("opened")
+    return slot._replace(trip_id=trip.trip_id)
+
+
+def place_order(quote, slot, delivery_address, postal_code):
+    """
+    Create an order from a quote, without committing.
+
+    Adds the order and its lines with the quoted prices and updates the
+    customer's running totals and the sales rollups, in the current
+    transaction. The delivery slot must be reserved in the same transaction
+    (see reserve_delivery()).
+
+    Args:
+        quote (Quote): Priced order (see pricing.py)
+        slot (DeliverySlot): Reserved delivery slot
+        delivery_address (str): Delivery street address
+        postal_code (str): Normalized delivery postal code
+
+    Returns:
+        Order: The new order (flushed, so order_id is set)
+    """
+    order = Order(
+        customer_id=quote.customer.customer_id,
+        delivery_person_id=slot.delivery_person_id,
+        discount_id=quote.discount_id if quote.discount_applied else None,
+        delivery_address=delivery_address,
+        postal_code=postal_code,
+        pickup_time=slot.pickup_time,
+        expected_delivery_time=slot.expected_delivery_time,
+        trip_id=slot.trip_id,
+        raw_price=round(quote.raw_price, 2),
+        total_price=quote.total,
+    )
+    db.session.add(order)
+    db.session.flush()  # Get order_id for order items
+
+    # Order lines with the quoted unit price
+    for line in quote.lines:
+        db.session.add(OrderItem(order_id=order.order_id, item_id=line.item_id,
+                                 amount=line.amount, unit_price=line.unit_price))
+
+    # Update the customer's running totals and the sales rollups in the same transaction
+    record_customer_order(quote.customer.customer_id, quote.pizza_count, quote.total, order.order_time)
+    pizza_units = {}
+    for line in quote.lines:
+        if line.item_type == "pizza":
+            pizza_units[line.item_id] = pizza_units.get(line.item_id, 0) + line.amount
+    record_order_sales(quote.customer.customer_id, postal_code, order.raw_price, quote.total,
+                       order.order_time, pizza_units)
+    return order
+
+
+def parse_order_request(data):
+    """
+    Validate one order of an API request.
+
+    Args:
+        data (dict): Order as sent, e.g.
+            {"customer_id": 1, "items": [{"item_id": 3, "amount": 2}],
+             "discount_code": "VIP20", "delivery_address": "...", "postal_code": "6211AB",
+             "reference": "pos-1234"}
+            Only customer_id and items are required, the delivery address and
+            postal code default to the customer's.
+
+    Returns:
+        dict: customer_id, items ((item_id, amount) pairs), discount_code,
+              delivery_address and postal_code (None when not given)
+
+    Raises:
+        OrderRequestError: If a field is missing, has the wrong type or is out
+            of range (ids from 1 to API_MAX_ID, amounts from 1 to
+            API_MAX_ITEM_AMOUNT per menu item)
+    """
+    if not isinstance(data, dict):
+        raise OrderRequestError("order must be a JSON object")
+
+    customer_id = data.get("customer_id")
+    if not isinstance(customer_id, int) or isinstance(customer_id, bool):
+        raise OrderRequestError("customer_id must be an integer")
+    if not 1 <= customer_id <= API_MAX_ID:
+        raise OrderRequestError(f"unknown customer {customer_id}")
+
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        raise OrderRequestError("items must be a non-empty list")
+    amounts = {}
+    for item in items:
+        item_id = item.get("item_id") if isinstance(item, dict) else None
+        amount = item.get("amount", 1) if isinstance(item, dict) else None
+        if not isinstance(item_id, int) or not isinstance(amount, int) or isinstance(amount, bool):
+            raise OrderRequestError("every item needs an integer item_id and amount")
+        if not 1 <= item_id <= API_MAX_ID:
+            raise OrderRequestError(f"unknown menu item {item_id}")
+        # The same menu item twice counts as one line
+        amount += amounts.get(item_id, 0)
+        if not 1 <= amount <= API_MAX_ITEM_AMOUNT:
+            raise OrderRequestError(f"invalid amount {amount} for menu item {item_id}, "
+                                    f"order 1 to {API_MAX_ITEM_AMOUNT}")
+        amounts[item_id] = amount
+
+    fields = {}
+    for name in ("discount_code", "delivery_address", "postal_code"):
+        value = data.get(name)
+        if value is not None and not isinstance(value, str):
+            raise OrderRequestError(f"{name} must be a string")
+        fields[name] = value.strip() if value and value.strip() else None
+    if fields["postal_code"]:
+        fields["postal_code"] = fields["postal_code"].replace(" ", "").upper()
+
+    return dict(fields, customer_id=customer_id, items=sorted(amounts.items()))
+
+
+def submit_orders(payloads, catalog=None):
+    """
+    Price and create a batch of orders, sharing the lookups across the batch.
+
+    Args:
+        payloads (list of dict): Orders as sent (see parse_order_request())
+        catalog (Catalog): Menu catalog (default: the current catalog)
+
+    Returns:
+        list of dict: One result per order, in the order they were sent.
+            Created orders: index, reference, status "created", order_id,
+            customer_id, raw_price, total, discounts (messages),
+            delivery_person_id, pickup_time, expected_delivery_time and
+            trip_id (None unless trip batching is enabled).
+            Rejected orders: index, reference, status "error" and error.
+    """
+    pricing = PricingService(catalog)
+    results = [None] * len(payloads)
+    requests = []
+    for index, data in enumerate(payloads):
+        reference = data.get("reference") if isinstance(data, dict) else None
+        try:
+            requests.append((index, reference, parse_order_request(data)))
+        except OrderRequestError as e:
+            results[index] = {"index": index, "reference": reference, "status": "error", "error": str(e)}
+    if not requests:
+        return results
+
+    # ========== SHARED LOOKUPS ==========
+    customers = pricing.load_customers(order["customer_id"] for _, _, order in requests)
+    totals = {customer_id: list(customer_totals(customer)) for customer_id, (customer, _) in customers.items()}
+    ordered_today = {customer_id: ordered for customer_id, (_, ordered) in customers.items()}
+
+    codes = {order["discount_code"] for _, _, order in requests if order["discount_code"]}
+    discounts = {}
+    used_discounts = set()
+    if codes:
+        discounts = {d.discount_code: d for d in DiscountCode.query.filter(DiscountCode.discount_code.in_(codes))}
+        if discounts:
+            used_discounts = pricing.load_discount_usage(
+                customers, [discount.discount_id for discount in discounts.values()])
+
+    # The delivery persons of all postal codes in the batch, in one query
+    get_dispatcher().refresh(
+        order["postal_code"] or customers[order["customer_id"]][0].postal_code
+        for _, _, order in requests if order["customer_id"] in customers
+    )
+
+    # ========== PLACE THE ORDERS ==========
+    created = 0
+    for index, reference, order in requests:
+        result = {"index": index, "reference": reference}
+        results[index] = result
+        try:
+            result.update(_submit_order(pricing, order, customers, totals, ordered_today,
+                                        discounts, used_discounts))
+            created += 1
+        except (OrderRequestError, PricingError, SlotReservationError) as e:
+            result.update(status="error", error=str(e))
+        except (OverflowError, DataError):
+            # A value the checks of parse_order_request() let through does not fit a column
+            result.update(status="error", error="a value of the order is out of range")
+        except SQLAlchemyError as e:
+            result.update(status="error", error=f"database error: {e.__class__.__name__}")
+
+    db.session.commit()
+    if created:
+        ORDERS_CREATED.inc("api", amount=created)
+    return results
+
+
+def _submit_order(pricing, order, customers, totals, ordered_today, discounts, used_discounts):
+    """Price and create one order of a batch, and update the shared lookups with it."""
+    customer_id = order["customer_id"]
+    if customer_id not in customers:
+        raise OrderRequestError(f"unknown customer {customer_id}")
+    customer = customers[customer_id][0]
+
+    lines = pricing.build_lines(order["items"])
+    if not any(line.item_type == "pizza" for line in lines):
+        raise OrderRequestError("choose at least 1 pizza for a valid order")
+
+    # Delivery address and postal code default to the customer's
+    if order["postal_code"]:
+        postal_code = order["postal_code"]
+        delivery_address = order["delivery_address"] or ""
+    else:
+        postal_code = customer.postal_code
+        delivery_address = order["delivery_address"] or customer.address
+    if not delivery_address:
+        raise OrderRequestError("delivery_address is required with a postal_code")
+
+    if not get_dispatcher().serves(postal_code):
+        COURIER_ASSIGNMENT_FAILURES.inc()
+        raise OrderRequestError(f"no delivery person available for postal code {postal_code}")
+
+    discount = discounts.get(order["discount_code"]) if order["discount_code"] else None
+    discount_used = discount is not None and (customer_id, discount.discount_id) in used_discounts
+    pizzas_ordered, order_count = totals[customer_id]
+    quote = pricing.price(customer, lines, ordered_today[customer_id], pizzas_ordered, order_count,
+                          discount, discount_used)
+    if order["discount_code"] and discount is None:
+        quote.messages.append("discount code is invalid")
+
+    # Open trips are looked up before the savepoint: a read at the start of the
+    # savepoint would make SQLite fail the following writes of concurrent orders
+    # with "database is locked" instead of waiting
+    open_trips = find_open_trips(postal_code) if current_app.config["TRIP_BATCHING"] else None
+    with db.session.begin_nested():
+        slot = reserve_delivery(postal_code, open_trips=open_trips)
+        # The zone can be emptied (refresh/clear) after the serves() check above
+        if slot is None:
+            COURIER_ASSIGNMENT_FAILURES.inc()
+            raise OrderRequestError(f"no delivery person available for postal code {postal_code}")
+        new_order = place_order(quote, slot, delivery_address, postal_code)
+
+    # Later orders in the batch see this one
+    totals[customer_id] = [pizzas_ordered + quote.pizza_count, order_count + 1]
+    ordered_today[customer_id] = True
+    if quote.discount_applied:
+        used_discounts.add((customer_id, discount.discount_id))
+
+    return {
+        "status": "created",
+        "order_id": new_order.order_id,
+        "customer_id": customer_id,
+        "raw_price": round(quote.raw_price, 2),
+        "total": quote.total,
+        "discounts": quote.messages,
+        "delivery_person_id": slot.delivery_person_id,
+        "pickup_time": slot.pickup_time.isoformat(),
+        "expected_delivery_time": slot.expected_delivery_time.isoformat(),
+        "trip_id": slot.trip_id,
+    }
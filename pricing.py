@@ -0,0 +1,506 @@
+"""
+Order Pricing for Pizza Ordering System
+
+This module prices orders (quotes) for the order form and anything else that
+needs the final price of an order before it is created.
+
+A quote needs the menu prices, the customer, the customer's loyalty totals,
+whether the customer already ordered today (birthday discount) and, when a
+discount code is entered, the code and whether this customer used it before.
+PricingService gathers all of that in a fixed number of queries, independent
+of how many orders the customer placed before:
+    1. the catalog version check (prices come from the in-memory catalog)
+    2. the customer joined with the customer_stats row, with an EXISTS
+       subquery for an order placed today
+    3. only with a discount code: the code, with an EXISTS subquery for an
+       earlier order of this customer that used it
+
+Both EXISTS subqueries are answered from the (customer_id, order_time) index
+on the order table.
+
+Batches of orders (the JSON order API, see ordering.py) load the customers
+and the discount code usage of the whole batch at once with load_customers()
+and load_discount_usage(), and price every order with price().
+
+The discount rules themselves are unchanged, see apply_discounts().
+
+Quote tokens:
+    A preview hands out a short-lived signed token (itsdangerous, signed with
+    the app's secret key) holding the priced quote. When the order is created
+    with a valid, unexpired token for the same customer, items and discount
+    code, the quote is taken from the token instead of being priced again.
+    One query still checks the customer: the quote is rejected (StaleQuoteError)
+    when the menu changed, the customer placed another order (loyalty and
+    birthday discounts may differ) or the discount code was redeemed since.
+    Tokens that are expired, tampered with or for a different order are
+    ignored and the order is priced again.
+"""
+
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, TimedSerializer
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager
+from catalog import get_catalog
+from models import db, Customer, DiscountCode, Order
+
+# Seconds a quote token stays valid (app.config QUOTE_TOKEN_MAX_AGE)
+QUOTE_TOKEN_MAX_AGE = 600
+
+# Salt of the quote token signatures, so no other signed value is accepted as a token
+QUOTE_TOKEN_SALT = "pizza-order-quote"
+
+# One priced line of a quote
+QuoteLine = namedtuple("QuoteLine", ["item_id", "item_type", "name", "amount", "unit_price", "line_total"])
+
+
+class PricingError(ValueError):
+    """Raised when an order cannot be priced (unknown customer or menu item, invalid amount)."""
+
+
+class StaleQuoteError(PricingError):
+    """Raised when a quote token is no longer valid for the order (menu, history or discount code changed)."""
+
+
+class Quote:
+    """
+    Itemised price of an order.
+
+    Attributes:
+        customer (Customer): Customer the quote is for
+        lines (list of QuoteLine): Ordered items, in the order they were given
+        raw_price (float): Price before discounts (not rounded)
+        total (float): Price after all discounts, rounded to 2 decimals
+        messages (list of str): Human-readable list of applied discounts
+        pizza_count (int): Number of pizzas in the order
+        discount (DiscountCode or None): Discount code entered, if it exists
+            (not loaded for quotes taken from a token)
+        discount_id (int or None): Id of the discount code entered, if it exists
+        discount_applied (bool): Whether the discount code was applied
+        catalog_version (int): Catalog version the prices were taken from
+        order_count (int): Orders the customer had placed when the quote was made
+        day (date): Day the quote was made for (birthday discount)
+        from_token (bool): Whether the quote was taken from a quote token
+    """
+
+    def __init__(self, customer, lines, catalog_version, discount=None, order_count=0, day=None):
+        self.customer = customer
+        self.lines = lines
+        self.catalog_version = catalog_version
+        self.discount = discount
+        self.discount_id = discount.discount_id if discount is not None else None
+        self.discount_applied = False
+        self.order_count = order_count
+        self.day = day or date.today()
+        self.from_token = False
+        self.raw_price = sum(line.unit_price * line.amount for line in lines)
+        self.pizza_count = sum(line.amount for line in lines if line.item_type == "pizza")
+        self.total = round(self.raw_price, 2)
+        self.messages = []
+
+    def prices_by_type(self):
+        """
+        List the individual pizza and drink prices, one entry per ordered item.
+
+        Returns:
+            dict: 'pizzas' and 'drinks' (list of float)
+        """
+        pizza_prices = []
+        drink_prices = []
+        for line in self.lines:
+            if line.item_type == "pizza":
+                pizza_prices.extend([line.unit_price] * line.amount)
+            elif line.item_type == "drink":
+                drink_prices.extend([line.unit_price] * line.amount)
+        # Desserts are not used in the discount calculations
+        return {"pizzas": pizza_prices, "drinks": drink_prices}
+
+    def to_dict(self):
+        """Get the quote as a JSON-serializable dictionary."""
+        return {
+            "customer_id": self.customer.customer_id,
+            "lines": [line._asdict() for line in self.lines],
+            "raw_price": round(self.raw_price, 2),
+            "total": self.total,
+            "messages": list(self.messages),
+            "pizza_count": self.pizza_count,
+            "discount_id": self.discount_id,
+            "discount_applied": self.discount_applied,
+            "catalog_version": self.catalog_version,
+        }
+
+    def __repr__(self):
+        return f"<Quote customer={self.customer.customer_id} lines={len(self.lines)} total={self.total}>"
+
+
+def apply_discounts(raw_price, pizza_prices, drink_prices, birthday, pizzas_ordered, discount, discount_used):
+    """
+    Calculate all applicable discounts for an order and return the final price.
+
+    Discount Types Applied (in order):
+        1. Birthday Discount: 1 free pizza + 1 free drink (if today is the
+           customer's birthday and they have not ordered yet today)
+        2. Loyalty Discount: 1 free pizza per 10 pizzas ordered historically
+        3. Discount Code: Percentage off total (e.g., 10% off with WELCOME10),
+           once per customer
+
+    Free items are applied by removing the cheapest qualifying items. The
+    percentage discount is applied after the free items are removed.
+
+    Loyalty formula: (pizzas_ordered + new_pizzas) // 10 - pizzas_ordered // 10
+        Example: 8 pizzas ordered before, ordering 5 more
+        - New total: 13 // 10 = 1 free pizza
+        - Previous: 8 // 10 = 0 free pizzas
+        - Difference: 1 free pizza this order
+
+    Args:
+        raw_price (float): Total order price before any discounts
+        pizza_prices (list of float): Individual pizza prices in the order,
+                                      modified in-place as free items are removed
+        drink_prices (list of float): Individual drink prices in the order,
+                                      modified in-place as free items are removed
+        birthday (bool): Whether the birthday discount applies
+        pizzas_ordered (int): Pizzas the customer ordered before this order
+        discount (DiscountCode or None): Discount code entered, if it exists
+        discount_used (bool): Whether the customer used the discount code before
+
+    Returns:
+        dict: 'total' (float, rounded to 2 decimals), 'messages' (list of str)
+              and 'discount_applied' (bool)
+    """
+    subtotal = raw_price
+    discounts_applied = []
+    free_pizza = 0
+    free_drink = 0
+
+    # ========== BIRTHDAY DISCOUNT ==========
+    if birthday:
+        free_pizza += 1
+        free_drink += 1
+        discounts_applied.append("happy birthday! you get one pizza and drink for free")
+
+    # ========== LOYALTY DISCOUNT (10-PIZZA REWARD) ==========
+    ten_discount = (pizzas_ordered + len(pizza_prices)) // 10 - (pizzas_ordered // 10)
+    if ten_discount > 0:
+        free_pizza += ten_discount
+        discounts_applied.append(f"10-pizza discount applied ({ten_discount} free pizza('s))")
+
+    # ========== APPLY FREE PIZZA AND DRINK DISCOUNTS ==========
+    # Remove the cheapest pizzas and drinks from the order price
+    for _ in range(free_pizza):
+        if pizza_prices:
+            cheapest = min(pizza_prices)
+            subtotal -= cheapest
+            pizza_prices.remove(cheapest)
+
+    for _ in range(free_drink):
+        if drink_prices:
+            cheapest = min(drink_prices)
+            subtotal -= cheapest
+            drink_prices.remove(cheapest)
+
+    # ========== DISCOUNT CODE ==========
+    discount_applied = False
+    if discount:
+        if not discount_used:
+            subtotal *= (100 - discount.percentage) / 100
+            discount_applied = True
+            discounts_applied.append(f"discount code applied, {discount.percentage}% off")
+        else:
+            discounts_applied.append("discount code is invalid")
+
+    return {"total": round(subtotal, 2), "messages": discounts_applied, "discount_applied": discount_applied}
+
+
+def customer_totals(customer):
+    """
+    Get the loyalty totals of a customer from the loaded customer_stats row.
+
+    Returns:
+        tuple: (pizzas ordered, orders placed), zero without a stats row
+    """
+    if customer.stats is None:
+        return 0, 0
+    return customer.stats.pizzas_ordered, customer.stats.order_count
+
+
+class PricingService:
+    """
+    Prices orders in a fixed number of queries.
+
+    Usage:
+        quote = PricingService().quote(customer_id, [(item_id, amount), ...], "WELCOME10")
+    """
+
+    def __init__(self, catalog=None):
+        """
+        Args:
+            catalog (Catalog): Menu catalog to take the prices from
+                               (default: the current catalog, one version check)
+        """
+        self.catalog = catalog if catalog is not None else get_catalog()
+
+    def load_customers(self, customer_ids, today=None):
+        """
+        Load customers with everything the birthday and loyalty discounts need (one query).
+
+        The customer_stats row is loaded with the customer (customer.stats),
+        so recording a new order does not load it again.
+
+        Args:
+            customer_ids (iterable of int): Customers to load
+            today (date): Day to check for an earlier order (default: today)
+
+        Returns:
+            dict: Maps customer_id to (customer, ordered today), for the customers that exist
+        """
+        today = today or date.today()
+        start = datetime.combine(today, time.min)
+        ordered_today = (
+            select(Order.order_id)
+            .where(
+                Order.customer_id == Customer.customer_id,
+                Order.order_time >= start,
+                Order.order_time < start + timedelta(days=1),
+            )
+            .exists()
+        )
+        rows = db.session.execute(
+            select(Customer, ordered_today)
+            .outerjoin(Customer.stats)
+            .options(contains_eager(Customer.stats))
+            .where(Customer.customer_id.in_(set(customer_ids)))
+        )
+        return {customer.customer_id: (customer, ordered) for customer, ordered in rows}
+
+    def load_discount(self, customer_id, discount_code):
+        """
+        Load a discount code and whether a customer used it before (one query).
+
+        Args:
+            customer_id (int): Customer using the code
+            discount_code (str): Code as entered
+
+        Returns:
+            tuple or None: (discount, used before), or None if the code does not exist
+        """
+        used = (
+            select(Order.order_id)
+            .where(Order.customer_id == customer_id, Order.discount_id == DiscountCode.discount_id)
+            .exists()
+        )
+        return db.session.execute(
+            select(DiscountCode, used).where(DiscountCode.discount_code == discount_code)
+        ).first()
+
+    def load_discount_usage(self, customer_ids, discount_ids):
+        """
+        Find which of these customers used which of these discount codes before (one query).
+
+        Args:
+            customer_ids (iterable of int): Customers
+            discount_ids (iterable of int): Discount codes
+
+        Returns:
+            set of tuple: (customer_id, discount_id) pairs that were used
+        """
+        rows = db.session.execute(
+            select(Order.customer_id, Order.discount_id)
+            .where(Order.customer_id.in_(set(customer_ids)), Order.discount_id.in_(set(discount_ids)))
+            .distinct()
+        )
+        return {(customer_id, discount_id) for customer_id, discount_id in rows}
+
+    def build_lines(self, items):
+        """
+        Price the ordered items with the catalog.
+
+        Args:
+            items (iterable of tuple): (item_id, amount) pairs
+
+        Returns:
+            list of QuoteLine: One line per item
+
+        Raises:
+            PricingError: If an item is not on the menu or an amount is not positive
+        """
+        lines = []
+        for item_id, amount in items:
+            item = self.catalog.get(item_id)
+            if item is None:
+                raise PricingError(f"unknown menu item {item_id}")
+            if amount < 1:
+                raise PricingError(f"invalid amount {amount} for menu item {item_id}")
+            lines.append(QuoteLine(item.item_id, item.item_type, item.name, amount, item.price, item.price * amount))
+        return lines
+
+    def price(self, customer, lines, ordered_today, pizzas_ordered, order_count,
+              discount=None, discount_used=False, today=None):
+        """
+        Apply the discount rules to priced lines, without any query.
+
+        Args:
+            customer (Customer): Customer placing the order
+            lines (list of QuoteLine): Lines from build_lines()
+            ordered_today (bool): Whether the customer already ordered today
+            pizzas_ordered (int): Pizzas the customer ordered before
+            order_count (int): Orders the customer placed before
+            discount (DiscountCode or None): Discount code entered, if it exists
+            discount_used (bool): Whether the customer used the discount code before
+            today (date): Day of the order (default: today)
+
+        Returns:
+            Quote: Itemised quote
+        """
+        today = today or date.today()
+        quote = Quote(customer, lines, self.catalog.version, discount, order_count, today)
+        # Birthday: one free pizza and drink, on the first order of the day only
+        birthday = (customer.birthdate.month == today.month and customer.birthdate.day == today.day
+                    and not ordered_today)
+        prices = quote.prices_by_type()
+        result = apply_discounts(quote.raw_price, prices["pizzas"], prices["drinks"],
+                                 birthday, pizzas_ordered, discount, discount_used)
+        quote.total = result["total"]
+        quote.messages = result["messages"]
+        quote.discount_applied = result["discount_applied"]
+        return quote
+
+    def quote(self, customer_id, items, discount_code=None, today=None):
+        """
+        Price an order for a customer.
+
+        Args:
+            customer_id (int or str): Customer placing the order
+            items (iterable of tuple): (item_id, amount) pairs
+            discount_code (str): Optional discount code, unknown codes are ignored
+            today (date): Day of the order, for the birthday discount (default: today)
+
+        Returns:
+            Quote: Itemised quote
+
+        Raises:
+            PricingError: If the customer or a menu item does not exist
+        """
+        today = today or date.today()
+        lines = self.build_lines(items)
+
+        try:
+            customer_id = int(customer_id)
+        except (TypeError, ValueError):
+            raise PricingError(f"invalid customer id {customer_id!r}")
+        row = self.load_customers([customer_id], today).get(customer_id)
+        if row is None:
+            raise PricingError(f"unknown customer {customer_id}")
+        customer, ordered_today = row
+
+        discount, discount_used = None, False
+        if discount_code:
+            discount_row = self.load_discount(customer.customer_id, discount_code)
+            if discount_row is not None:
+                discount, discount_used = discount_row
+
+        pizzas_ordered, order_count = customer_totals(customer)
+        return self.price(customer, lines, ordered_today, pizzas_ordered, order_count,
+                          discount, discount_used, today)
+
+    # ------------------------------------------------------------------
+    # Quote tokens
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _serializer():
+        # Not the URL-safe variant: it zlib-compresses every token (~300 KiB of buffers),
+        # and the token only travels in a hidden form field
+        return TimedSerializer(current_app.secret_key, salt=QUOTE_TOKEN_SALT)
+
+    def sign(self, quote, discount_code=None):
+        """
+        Create a signed token holding a quote, to be sent back when the order is created.
+
+        Args:
+            quote (Quote): Quote to sign
+            discount_code (str): Discount code as entered (also when it does not exist)
+
+        Returns:
+            str: Signed token (JSON with a timestamp and signature)
+        """
+        return self._serializer().dumps({
+            "customer_id": quote.customer.customer_id,
+            "items": [[line.item_id, line.amount] for line in quote.lines],
+            "discount_code": discount_code or None,
+            "discount_id": quote.discount.discount_id if quote.discount else None,
+            "discount_applied": quote.discount_applied,
+            "catalog_version": quote.catalog_version,
+            "order_count": quote.order_count,
+            "day": quote.day.isoformat(),
+            "lines": [list(line) for line in quote.lines],
+            "total": quote.total,
+            "messages": quote.messages,
+        })
+
+    def redeem(self, token, customer_id, items, discount_code=None, max_age=None):
+        """
+        Take the quote from a token instead of pricing the order again.
+
+        The token must be valid, unexpired and made for the same customer,
+        items and discount code. Runs one query, for the customer with their
+        order count and, with a discount code, whether they redeemed it since.
+
+        Args:
+            token (str): Token from sign()
+            customer_id (int or str): Customer placing the order
+            items (iterable of tuple): (item_id, amount) pairs of the order
+            discount_code (str): Discount code as entered
+            max_age (int): Seconds the token is valid (default: QUOTE_TOKEN_MAX_AGE config)
+
+        Returns:
+            Quote or None: The quote, or None if the token cannot be used
+                           (expired, tampered with, or for a different order)
+
+        Raises:
+            StaleQuoteError: If the menu changed, the customer placed another
+                             order, or the discount code was redeemed since the quote
+        """
+        if max_age is None:
+            max_age = current_app.config.get("QUOTE_TOKEN_MAX_AGE", QUOTE_TOKEN_MAX_AGE)
+        try:
+            data = self._serializer().loads(token, max_age=max_age)
+        except (BadSignature, SignatureExpired, TypeError):
+            return None
+
+        if (str(data["customer_id"]) != str(customer_id)
+                or data["items"] != [[item_id, amount] for item_id, amount in items]
+                or data["discount_code"] != (discount_code or None)
+                or data["day"] != date.today().isoformat()):
+            return None
+
+        if data["catalog_version"] != self.catalog.version:
+            raise StaleQuoteError("The menu changed since the price was calculated.")
+
+        query = select(Customer).outerjoin(Customer.stats).options(contains_eager(Customer.stats))
+        if data["discount_id"] is not None:
+            redeemed = (
+                select(Order.order_id)
+                .where(Order.customer_id == Customer.customer_id, Order.discount_id == data["discount_id"])
+                .exists()
+            )
+            query = query.add_columns(redeemed)
+        row = db.session.execute(query.where(Customer.customer_id == data["customer_id"])).first()
+        if row is None:
+            return None
+        customer = row[0]
+        _, order_count = customer_totals(customer)
+        if data["discount_applied"] and row[1]:
+            raise StaleQuoteError("The discount code was already redeemed.")
+        if order_count != data["order_count"]:
+            raise StaleQuoteError("A new order was placed since the price was calculated.")
+
+        quote = Quote(customer, [QuoteLine(*line) for line in data["lines"]], data["catalog_version"],
+                      None, order_count, date.fromisoformat(data["day"]))
+        quote.discount_id = data["discount_id"]
+        quote.total = data["total"]
+        quote.messages = data["messages"]
+        quote.discount_applied = data["discount_applied"]
+        quote.from_token = True
+        return quote
@@ -0,0 +1,276 @@
+"""
+On-Demand Request Profiler for Pizza Ordering System
+
+Profiles single requests in production when an admin asks for it, e.g. to see
+why staff_reports or create_order is slow during a rush. A request is
+profiled when it carries the admin token in the X-Profile header or in the
+_profile query parameter:
+
+    curl -H "X-Profile: $PROFILER_TOKEN" https://.../staff_reports
+    https://.../staff_reports?_profile=<token>&_profile_mode=sample
+
+Profiler modes (X-Profile-Mode header or _profile_mode query parameter):
+    cprofile: deterministic profile of every function call (cProfile),
+        written as a .pstats file (open with python -m pstats or snakeviz)
+    sample: a background thread samples the request's stack every
+        PROFILER_SAMPLE_INTERVAL seconds, written as a .collapsed file with
+        one "frame;frame;frame count" line per stack (flamegraph.pl, speedscope)
+    both (default): both profilers at once, both files
+
+The files are written to PROFILE_DIR. The response gets headers with the
+profile id, the wall time and the estimated profiler overhead: the CPU time
+of the sampling thread plus, for cProfile, the number of profiled calls times
+the measured cost of profiling one call.
+
+Without PROFILER_TOKEN no hooks are registered at all, so normal requests pay
+nothing. With a token, requests without the header only pay one header lookup.
+"""
+
+import cProfile
+import hmac
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import current_app, g, request
+
+# Supported profiler modes
+PROFILER_MODES = ("cprofile", "sample", "both")
+
+
+# The sampling thread only runs when it gets the GIL, by default every 5 ms.
+# While samplers run the switch interval is lowered to the sample interval.
+_switch_interval_lock = threading.Lock()
+_active_samplers = 0
+_saved_switch_interval = None
+
+
+def _lower_switch_interval(interval):
+    global _active_samplers, _saved_switch_interval
+    with _switch_interval_lock:
+        if _active_samplers == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_saved_switch_interval, interval))
+        _active_samplers += 1
+
+
+def _restore_switch_interval():
+    global _active_samplers
+    with _switch_interval_lock:
+        _active_samplers -= 1
+        if _active_samplers == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class StackSampler:
+    """
+    Samples the Python stack of one thread from a background thread.
+
+    Attributes:
+        samples (Counter): Number of samples per collapsed stack (root first)
+        cpu_time (float): CPU time used by the sampling thread, in seconds
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.cpu_time = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        """Start sampling."""
+        _lower_switch_interval(self.interval)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampling thread."""
+        self._stop.set()
+        self._thread.join()
+        _restore_switch_interval()
+
+    def _run(self):
+        start_cpu = time.thread_time()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+        self.cpu_time = time.thread_time() - start_cpu
+
+    def write_collapsed(self, path):
+        """Write the samples in the collapsed stack format used by flame graph tools."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_cprofile_call_cost = None
+
+
+def cprofile_call_cost():
+    """
+    Measure how much time cProfile adds to one function call (measured once per process).
+
+    Returns:
+        float: Seconds of profiler overhead per profiled call
+    """
+    global _cprofile_call_cost
+    if _cprofile_call_cost is None:
+        def empty():
+            pass
+
+        calls = 100000
+        start = time.perf_counter()
+        for _ in range(calls):
+            empty()
+        plain = time.perf_counter() - start
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        start = time.perf_counter()
+        for _ in range(calls):
+            empty()
+        profiled = time.perf_counter() - start
+        profiler.disable()
+
+        _cprofile_call_cost = max(profiled - plain, 0.0) / calls
+    return _cprofile_call_cost
+
+
+class ProfileSession:
+    """
+    Profilers running for one request.
+
+    Attributes:
+        profile_id (str): Id used in the file names and response headers
+        mode (str): One of PROFILER_MODES
+    """
+
+    def __init__(self, mode, sample_interval):
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.mode = mode
+        self.profiler = cProfile.Profile() if mode in ("cprofile", "both") else None
+        self.sampler = StackSampler(threading.get_ident(), sample_interval) if mode in ("sample", "both") else None
+        self.wall_time = 0.0
+        self.overhead = 0.0
+        self.files = []
+        self._start = None
+
+    def start(self):
+        """Start the profilers."""
+        self._start = time.perf_counter()
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        """Stop the profilers and estimate their overhead."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.wall_time = time.perf_counter() - self._start
+
+        if self.sampler is not None:
+            self.overhead += self.sampler.cpu_time
+        if self.profiler is not None:
+            self.overhead += pstats.Stats(self.profiler).total_calls * cprofile_call_cost()
+
+    def save(self, directory, endpoint):
+        """
+        Write the profile files.
+
+        Args:
+            directory (str): Directory to write to
+            endpoint (str): Endpoint of the request, part of the file names
+        """
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{self.profile_id}-{endpoint or 'unknown'}")
+        if self.profiler is not None:
+            self.profiler.dump_stats(base + ".pstats")
+            self.files.append(base + ".pstats")
+        if self.sampler is not None:
+            self.sampler.write_collapsed(base + ".collapsed")
+            self.files.append(base + ".collapsed")
+
+
+class RequestProfiler:
+    """
+    Flask extension that profiles requests carrying the admin token.
+
+    Configuration (app.config):
+        PROFILER_TOKEN (str): Admin token, profiling is disabled without it
+        PROFILE_DIR (str): Directory the profiles are written to (default profiles)
+        PROFILER_SAMPLE_INTERVAL (float): Seconds between stack samples (default 0.001)
+
+    Usage:
+        RequestProfiler(app)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the request hooks, only if a profiler token is configured.
+
+        Args:
+            app (Flask): Application to profile
+        """
+        app.config.setdefault("PROFILER_TOKEN", None)
+        app.config.setdefault("PROFILE_DIR", "profiles")
+        app.config.setdefault("PROFILER_SAMPLE_INTERVAL", 0.001)
+        app.extensions["request_profiler"] = self
+        if not app.config["PROFILER_TOKEN"]:
+            return
+
+        app.before_request(self._start_profile)
+        app.after_request(self._finish_profile)
+        app.teardown_request(self._teardown_profile)
+
+    def _start_profile(self):
+        token = request.headers.get("X-Profile") or request.args.get("_profile")
+        # Compared as bytes: compare_digest() refuses str with non-ASCII characters
+        if not token or not hmac.compare_digest(token.encode(), current_app.config["PROFILER_TOKEN"].encode()):
+            return
+        mode = request.headers.get("X-Profile-Mode") or request.args.get("_profile_mode") or "both"
+        if mode not in PROFILER_MODES:
+            mode = "both"
+        session = ProfileSession(mode, current_app.config["PROFILER_SAMPLE_INTERVAL"])
+        g.profile_session = session
+        session.start()
+
+    def _finish_profile(self, response):
+        session = g.pop("profile_session", None)
+        if session is None:
+            return response
+        session.stop()
+        session.save(current_app.config["PROFILE_DIR"], request.endpoint)
+        current_app.logger.info(
+            "Profiled %s %s in %.1f ms (profiler overhead %.1f ms): %s",
+            request.method, request.path, session.wall_time * 1000, session.overhead * 1000,
+            ", ".join(session.files),
+        )
+        response.headers["X-Profile-Id"] = session.profile_id
+        response.headers["X-Profile-Mode"] = session.mode
+        response.headers["X-Profile-Wall-ms"] = f"{session.wall_time * 1000:.2f}"
+        response.headers["X-Profile-Overhead-ms"] = f"{session.overhead * 1000:.2f}"
+        return response
+
+    def _teardown_profile(self, exc):
+        # The request failed before after_request ran: still stop the profilers and keep the profile
+        session = g.pop("profile_session", None)
+        if session is not None:
+            session.stop()
+            session.save(current_app.config["PROFILE_DIR"], request.endpoint)
@@ -0,0 +1,454 @@
+"""
+Staff Report Sections for Pizza Ordering System
+
+This module builds the sales sections of the staff reports page: the top
+pizzas of the last 30 days, the earnings per customer in a period and the
+first year with orders. They read from the sales rollup tables (see
+PizzaDailySales and CustomerMonthlySpend in models.py).
+
+The earnings report takes a day, an ISO week, a month, a quarter or a custom
+range of days. A period is a half-open range [start, end): the whole months
+in it are read from the monthly rollup, the remaining days from the orders
+with a range predicate on order_time (see earnings_query()).
+
+Managers refresh the page all the time with the same filters, so each worker
+keeps the results in a ReportCache:
+- Entries are keyed by the section and its normalized filters and expire
+  after REPORT_CACHE_TTL seconds. At most REPORT_CACHE_SIZE entries are kept,
+  the least recently used one is dropped first.
+- Every entry records the range of months its result depends on. When a
+  transaction that added orders commits, only the entries covering the months
+  of those orders are dropped (record_order_sales_bulk() collects the months
+  in the session). Commits in other worker processes are not seen, their
+  entries are at most REPORT_CACHE_TTL seconds old.
+"""
+
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date, timedelta
+from threading import Lock
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select, union_all
+from sqlalchemy.orm import Session
+from models import db, Customer, CustomerMonthlySpend, MenuItem, Order, Pizza, PizzaDailySales
+
+# Periods of the earnings report
+REPORT_PERIODS = ("day", "week", "month", "quarter", "custom")
+
+# Period of a report, the half-open range of days start <= day < end
+ReportPeriod = namedtuple("ReportPeriod", ["kind", "start", "end", "label"])
+
+# One cached result, valid until expires_at (time.monotonic()). The result
+# depends on the months first_month <= month < end_month.
+ReportCacheEntry = namedtuple("ReportCacheEntry", ["value", "expires_at", "first_month", "end_month"])
+
+
+def month_start(day):
+    """Get the first day of the month of a date."""
+    return day.replace(day=1)
+
+
+def next_month(day):
+    """Get the first day of the month after the month of a date."""
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+class ReportCache:
+    """
+    Per-worker TTL and LRU cache of staff report results.
+
+    Attributes:
+        ttl (float): Seconds an entry is used, 0 disables the cache
+        max_entries (int): Maximum number of entries
+        hits (int): Results served from the cache
+        misses (int): Results that had to be computed
+        invalidations (int): Entries dropped because orders were added to their months
+    """
+
+    def __init__(self, ttl=60, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = Lock()
+
+    def get(self, key, months, compute):
+        """
+        Get a cached result, computing and storing it if needed.
+
+        A result that was being computed while orders were added is returned,
+        but not stored, since it may miss those orders.
+
+        Args:
+            key (tuple): Section name and its normalized filters
+            months (tuple or callable): (first month, month after the last
+                month) the result depends on, or a function that gets them
+                from the computed result
+            compute (callable): Computes the result, without arguments
+
+        Returns:
+            The cached or computed result
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+            generation = self._generation
+
+        value = compute()
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return value
+
+        first_month, end_month = months(value) if callable(months) else months
+        with self._lock:
+            if self._generation == generation:
+                self._entries[key] = ReportCacheEntry(value, now + self.ttl, first_month, end_month)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate_months(self, months):
+        """
+        Drop the entries that depend on any of the given months.
+
+        Args:
+            months (iterable of date): First days of the months that got orders
+        """
+        months = set(months)
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items()
+                     if any(entry.first_month <= month < entry.end_month for month in months)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: hits, misses, hit_rate (0-1), invalidations and the number of entries
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+def get_report_cache():
+    """Get the report cache of the current application."""
+    cache = current_app.extensions.get("report_cache")
+    if cache is None:
+        cache = current_app.extensions.setdefault("report_cache", ReportCache(
+            current_app.config.get("REPORT_CACHE_TTL", 60), current_app.config.get("REPORT_CACHE_SIZE", 256)))
+    return cache
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_sales_months(session):
+    """
+    Drop the cached reports of the months that got orders in the committed transaction.
+
+    Args:
+        session (Session): Session that committed
+    """
+    months = session.info.pop("sales_months", None)
+    if months and has_app_context():
+        get_report_cache().invalidate_months(months)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_sales_months(session):
+    """Forget the months of orders that were rolled back."""
+    session.info.pop("sales_months", None)
+
+
+def calculate_age(birthdate, today=None):
+    """
+    Calculate age from birthdate.
+
+    Properly accounts for whether birthday has occurred this year.
+
+    Args:
+        birthdate (date): Person's date of birth
+        today (date, optional): Date to calculate the age at, defaults to today
+
+    Returns:
+        int: Age in years
+    """
+    today = today or date.today()
+
+    # Calculate initial age as year difference
+    age = today.year - birthdate.year
+
+    # Adjust if birthday hasn't occurred yet this year
+    # Check if current month is before birth month, OR
+    # if months match but current day is before birth day
+    if today.month < birthdate.month or (today.month == birthdate.month and today.day < birthdate.day):
+        age -= 1
+    return age
+
+
+def top_selling_pizzas(since, today):
+    """
+    Get the 3 best selling pizzas from a day up to today.
+
+    Args:
+        since (date): First day counted (whole days, from PizzaDailySales)
+        today (date): Current day, the end of the cached month range
+
+    Returns:
+        list of Row: name and total_sold, best selling first
+    """
+    def compute():
+        return (
+            db.session.query(
+                Pizza.name,
+                func.sum(PizzaDailySales.units).label('total_sold')
+            )
+            .join(MenuItem, MenuItem.item_ref_id == Pizza.pizza_id)
+            .join(PizzaDailySales, PizzaDailySales.item_id == MenuItem.item_id)
+            .filter(MenuItem.item_type == 'pizza')
+            .filter(PizzaDailySales.sales_date >= since)
+            .group_by(Pizza.pizza_id, Pizza.name)
+            .order_by(func.sum(PizzaDailySales.units).desc())
+            .limit(3)
+            .all()
+        )
+
+    return get_report_cache().get(("top_pizzas", since), (month_start(since), next_month(today)), compute)
+
+
+def report_period(kind, day, last_day=None):
+    """
+    Build the half-open date range of a report period.
+
+    Args:
+        kind (str): "day", "week" (ISO week, Monday to Sunday), "month",
+            "quarter" or "custom"
+        day (date): A day in the period, the first day of a custom period
+        last_day (date, optional): Last day of a custom period (inclusive),
+            defaults to day
+
+    Returns:
+        ReportPeriod: The period
+
+    Raises:
+        ValueError: If the kind is unknown, the period does not fit in the
+            calendar or a custom period ends before it starts
+    """
+    try:
+        if kind == "day":
+            return ReportPeriod(kind, day, day + timedelta(days=1), f"{day:%d %B %Y}")
+        if kind == "week":
+            start = day - timedelta(days=day.weekday())
+            year, week, _ = day.isocalendar()
+            last = start + timedelta(days=6)
+            return ReportPeriod(kind, start, start + timedelta(days=7),
+                                f"Week {week} of {year} ({start:%d %b} - {last:%d %b %Y})")
+        if kind == "month":
+            start = month_start(day)
+            return ReportPeriod(kind, start, next_month(start), f"{start:%B %Y}")
+        if kind == "quarter":
+            quarter = (day.month - 1) // 3 + 1
+            start = date(day.year, quarter * 3 - 2, 1)
+            return ReportPeriod(kind, start, next_month(next_month(next_month(start))), f"Q{quarter} {day.year}")
+        if kind == "custom":
+            last_day = last_day or day
+            if last_day < day:
+                raise ValueError("The period ends before it starts.")
+            return ReportPeriod(kind, day, last_day + timedelta(days=1), f"{day:%d %b %Y} - {last_day:%d %b %Y}")
+    except OverflowError:
+        raise ValueError("The period does not fit in the calendar.")
+    raise ValueError(f"Unknown report period: {kind}")
+
+
+def split_months(start, end):
+    """
+    Split a half-open date range into the whole months it covers and the days around them.
+
+    Args:
+        start (date): First day included
+        end (date): First day excluded
+
+    Returns:
+        tuple: ((first month, month after the last month) or None if the
+               range covers no whole month, list of (start, end) day ranges
+               before and after those months)
+    """
+    first = start if start.day == 1 else next_month(start)
+    last = month_start(end)
+    if first >= last:
+        return None, [(start, end)]
+    day_ranges = []
+    if start < first:
+        day_ranges.append((start, first))
+    if last < end:
+        day_ranges.append((last, end))
+    return (first, last), day_ranges
+
+
+def earnings_query(period, gender=None, min_age=None, max_age=None, postal_code=None, today=None):
+    """
+    Build the query of the earnings per customer in a period.
+
+    The whole months of the period are read from the CustomerMonthlySpend
+    rollup, the days before and after them from the orders. Both use
+    half-open range predicates on the bare columns (month >= ? AND month < ?,
+    Order.placed_between()), so the database range-scans the primary key of
+    the rollup and the ix_order_order_time_customer_spend index.
+
+    Args:
+        period (ReportPeriod): Period of the report
+        gender, min_age, max_age, postal_code, today: See earnings()
+
+    Returns:
+        Select: Rows with customer_id, first_name, last_name, gender,
+                birthdate, total_before_discount and total_spent, highest
+                spend first
+    """
+    today = today or date.today()
+    months, day_ranges = split_months(period.start, period.end)
+
+    # Spend per customer from the rollup and the orders
+    parts = []
+    if months is not None:
+        part = (
+            select(CustomerMonthlySpend.customer_id,
+                   CustomerMonthlySpend.raw_spend.label('raw_spend'),
+                   CustomerMonthlySpend.total_spend.label('total_spend'))
+            .where(CustomerMonthlySpend.month >= months[0], CustomerMonthlySpend.month < months[1])
+        )
+        if postal_code:
+            part = part.where(CustomerMonthlySpend.postal_code == postal_code)
+        parts.append(part)
+    for start, end in day_ranges:
+        part = (
+            select(Order.customer_id,
+                   Order.raw_price.label('raw_spend'),
+                   Order.total_price.label('total_spend'))
+            .where(Order.placed_between(start, end))
+        )
+        if postal_code:
+            part = part.where(Order.postal_code == postal_code)
+        parts.append(part)
+    spend = (parts[0] if len(parts) == 1 else union_all(*parts)).subquery()
+
+    query = (
+        select(
+            Customer.customer_id,
+            Customer.first_name,
+            Customer.last_name,
+            Customer.gender,
+            Customer.birthdate,
+            func.sum(spend.c.raw_spend).label('total_before_discount'),
+            func.sum(spend.c.total_spend).label('total_spent')
+        )
+        .join(spend, spend.c.customer_id == Customer.customer_id)
+    )
+
+    # Apply gender filter if provided
+    if gender is not None:
+        query = query.where(Customer.gender == gender)
+
+    # Apply age filters if provided
+    if max_age is not None:
+        # Customer must be born after this date to be younger than max_age
+        min_birthdate = date(today.year - max_age - 1, today.month, today.day)
+        query = query.where(Customer.birthdate > min_birthdate)
+    if min_age is not None:
+        # Customer must be born before this date to be older than min_age
+        max_birthdate = date(today.year - min_age, today.month, today.day)
+        query = query.where(Customer.birthdate <= max_birthdate)
+
+    # Group by customer and order by total spent (descending)
+    return (
+        query
+        .group_by(Customer.customer_id, Customer.first_name, Customer.last_name,
+                  Customer.gender, Customer.birthdate)
+        .order_by(func.sum(spend.c.total_spend).desc())
+    )
+
+
+def earnings(period, gender=None, min_age=None, max_age=None, postal_code=None, today=None):
+    """
+    Get the earnings per customer in a period.
+
+    Args:
+        period (ReportPeriod): Period of the report (see report_period())
+        gender (int, optional): Only customers of this gender (0=Female, 1=Male, 2=Other)
+        min_age (int, optional): Only customers at least this old
+        max_age (int, optional): Only customers at most this old
+        postal_code (str, optional): Only orders delivered to this normalized postal code
+        today (date, optional): Date the ages are calculated at, defaults to today
+
+    Returns:
+        dict: customers (list of dicts with customer_id, full_name, gender,
+              age, total_discount and total_spent, highest spend first),
+              total_earnings and total_before_discount
+    """
+    today = today or date.today()
+
+    def compute():
+        results = db.session.execute(
+            earnings_query(period, gender, min_age, max_age, postal_code, today)
+        ).all()
+
+        # Calculate age for each customer and format data
+        return {
+            "customers": [
+                {
+                    'customer_id': r.customer_id,
+                    'full_name': f"{r.first_name} {r.last_name}",
+                    'gender': r.gender,
+                    'age': calculate_age(r.birthdate, today),
+                    'total_discount': float(r.total_before_discount - r.total_spent),
+                    'total_spent': float(r.total_spent)
+                }
+                for r in results
+            ],
+            "total_earnings": sum(r.total_spent for r in results) if results else 0,
+            "total_before_discount": sum(r.total_before_discount for r in results) if results else 0,
+        }
+
+    # Ages depend on the day, so the day is part of the key
+    key = ("earnings", period.start, period.end, gender, min_age, max_age, postal_code or None, today)
+    months = (month_start(period.start), next_month(period.end - timedelta(days=1)))
+    return get_report_cache().get(key, months, compute)
+
+
+def first_report_year():
+    """
+    Get the year of the first month with orders.
+
+    Returns:
+        int or None: The year, None if there are no orders
+    """
+    def compute():
+        first_month = db.session.query(func.min(CustomerMonthlySpend.month)).scalar()
+        return first_month.year if first_month else None
+
+    def months(first_year):
+        # Only orders before the first year can change it
+        return date.min, date(first_year, 1, 1) if first_year is not None else date.max
+
+    return get_report_cache().get(("first_year",), months, compute)